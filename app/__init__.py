@@ -1,5 +1,7 @@
-from flask import Flask
-from config import SECRET_KEY
+import posixpath
+from flask import Flask, request, abort
+from config import SECRET_KEY, UPLOAD_MAX_BYTES, DOCUMENT_OFFLOAD
+from app import db
 
 from app.main.routes import main_bp
 from app.student.routes import student_bp
@@ -9,6 +11,21 @@ from app.admin.routes import admin_bp
 def create_app():
     app = Flask(__name__, template_folder="templates", static_folder="static")
     app.config['SECRET_KEY'] = SECRET_KEY
+    # Room for the multipart framing around a maximum-size file.
+    app.config['MAX_CONTENT_LENGTH'] = UPLOAD_MAX_BYTES + 64 * 1024
+    app.config['USE_X_SENDFILE'] = DOCUMENT_OFFLOAD == "x-sendfile"
+    db.init_app(app)
+
+    # Documents uploaded before the content store may still sit in
+    # static/uploads; they are only handed out by the mentor file route,
+    # which checks ownership.
+    @app.before_request
+    def hide_legacy_uploads():
+        if request.endpoint == "static":
+            filename = posixpath.normpath((request.view_args or {}).get("filename", ""))
+            if filename.split("/")[0] == "uploads":
+                abort(404)
+
     app.register_blueprint(main_bp)
     app.register_blueprint(student_bp)
     app.register_blueprint(mentor_bp)
@@ -1,7 +1,12 @@
-from flask import Blueprint, render_template, session, redirect, url_for, request
+from flask import Blueprint, render_template, session, redirect, url_for, request, Response, abort, jsonify
 from app.db import get_conn
+from app.stats import read_stats
+from app.pagination import paginate
+from app.export import EXPORTS, EXPORT_FORMATS, stream_export
 import psycopg2.extras
-from werkzeug.security import generate_password_hash
+from psycopg2 import IntegrityError
+from app.passwords import hash_password, PasswordServiceBusy
+from app import passwords, catalog, uploads, housing, jobs, importer
 
 admin_bp = Blueprint("admin", __name__, template_folder="templates")
 
@@ -10,6 +15,67 @@ def guard():
     return session.get("role") == "admin"
 
 
+DECISIONS = {"approve": "Approved", "reject": "Rejected"}
+
+# Upper bound on items decided in one batch request.
+BATCH_DECISION_MAX = 1000
+
+
+def batch_ids():
+    # Checked rows arrive as repeated "id" fields; keep their order, drop
+    # duplicates and anything that isn't an integer. A batch over the limit
+    # is refused as a whole rather than silently cut short.
+    ids = []
+    seen = set()
+    for value in request.form.getlist("id"):
+        try:
+            item = int(value)
+        except ValueError:
+            continue
+        if item not in seen:
+            seen.add(item)
+            ids.append(item)
+    if len(ids) > BATCH_DECISION_MAX:
+        abort(400, description="At most %d items can be decided at once." % BATCH_DECISION_MAX)
+    return ids
+
+
+def batch_outcome(cur, ids, decided, lookup):
+    # decided: {id: new_status} for rows this batch changed. Everything else
+    # is reported with its current status (already decided) or as missing,
+    # which takes one more query for just those ids.
+    rest = [i for i in ids if i not in decided]
+    current = {}
+    if rest:
+        cur.execute(lookup, (rest,))
+        current = dict(cur.fetchall())
+
+    results = []
+    for i in ids:
+        if i in decided:
+            results.append({"id": i, "ok": True, "status": decided[i]})
+        elif i in current:
+            results.append({"id": i, "ok": False, "status": current[i],
+                            "reason": "already decided"})
+        else:
+            results.append({"id": i, "ok": False, "status": None,
+                            "reason": "not found"})
+    return results
+
+
+def batch_response(title, results, back):
+    # The summary replaces the old redirect-and-re-render of the whole queue.
+    summary = {
+        "requested": len(results),
+        "decided": sum(1 for r in results if r["ok"]),
+        "skipped": sum(1 for r in results if not r["ok"]),
+    }
+    if request.accept_mimetypes.best == "application/json":
+        return jsonify(summary=summary, results=results)
+    return render_template("admin/batch_result.html", title=title,
+                           summary=summary, results=results, back=back)
+
+
 
 
 
@@ -21,43 +87,21 @@ def dashboard():
     conn = get_conn()
     cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
 
-    cur.execute("SELECT COUNT(*) FROM Student")
-    student_count = cur.fetchone()[0]
-
-    cur.execute("SELECT COUNT(*) FROM Mentor")
-    mentor_count = cur.fetchone()[0]
-
-    cur.execute("SELECT COUNT(*) FROM Program")
-    program_count = cur.fetchone()[0]
-
-    cur.execute("SELECT COUNT(*) FROM Application")
-    application_count = cur.fetchone()[0]
-
-    cur.execute("SELECT COUNT(*) FROM ApplicationDocument WHERE status='Pending'")
-    docs_pending = cur.fetchone()[0]
-
-    cur.execute("SELECT COUNT(*) FROM VisaPermit WHERE application_status='Pending'")
-    visa_pending = cur.fetchone()[0]
-
-    cur.execute("SELECT COUNT(*) FROM Housing WHERE availability=TRUE")
-    housing_available = cur.fetchone()[0]
-
-    cur.execute("SELECT COUNT(*) FROM Scholarship")
-    scholarship_count = cur.fetchone()[0]
+    stats = read_stats(cur)
 
     cur.close()
     conn.close()
 
     return render_template(
         "admin/dashboard.html",
-        students=student_count,
-        mentors=mentor_count,
-        programs=program_count,
-        apps=application_count,
-        docs_pending=docs_pending,
-        visa_pending=visa_pending,
-        housing_available=housing_available,
-        scholarship_count=scholarship_count
+        students=stats["students"],
+        mentors=stats["mentors"],
+        programs=stats["programs"],
+        apps=stats["applications"],
+        docs_pending=stats["docs_pending"],
+        visa_pending=stats["visa_pending"],
+        housing_available=stats["housing_available"],
+        scholarship_count=stats["scholarships"]
     )
 
 
@@ -72,12 +116,20 @@ def manage_students():
     conn = get_conn()
     cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
 
-    cur.execute("SELECT student_id, name, email, department, cgpa FROM Student ORDER BY student_id")
-    data = cur.fetchall()
+    page = paginate(
+        cur,
+        "SELECT student_id, name, email, department, cgpa FROM Student",
+        keys=[("student_id", "student_id")],
+        filters={"university": ("university_id = %s", int)}
+    )
+
+    cur.execute("SELECT university_id, name FROM University ORDER BY name")
+    universities = cur.fetchall()
 
     cur.close()
     conn.close()
-    return render_template("admin/manage_students.html", data=data)
+    return render_template("admin/manage_students.html", data=page.rows, page=page,
+                           universities=universities)
 
 
 @admin_bp.route("/admin/students/delete/<int:sid>")
@@ -106,7 +158,9 @@ def manage_programs():
     conn = get_conn()
     cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
 
-    cur.execute("""
+    page = paginate(
+        cur,
+        """
         SELECT 
             p.program_id,
             p.title,
@@ -118,13 +172,21 @@ def manage_programs():
         FROM Program p
         LEFT JOIN University u ON p.university_id = u.university_id
         LEFT JOIN Mentor m ON p.mentor_id = m.mentor_id
-        ORDER BY p.program_id;
-    """)
-    programs = cur.fetchall()
+        """,
+        keys=[("p.program_id", "program_id")],
+        filters={
+            "university": ("p.university_id = %s", int),
+            "mentor": ("p.mentor_id = %s", int),
+        }
+    )
+
+    cur.execute("SELECT university_id, name FROM University ORDER BY name")
+    universities = cur.fetchall()
 
     cur.close()
     conn.close()
-    return render_template("admin/manage_programs.html", data=programs)
+    return render_template("admin/manage_programs.html", data=page.rows, page=page,
+                           universities=universities)
 
 
 @admin_bp.route("/admin/programs/create", methods=["POST"])
@@ -158,6 +220,7 @@ def create_program():
     conn.commit()
     cur.close()
     conn.close()
+    catalog.invalidate()
 
     return redirect(url_for("admin.manage_programs"))
 
@@ -173,6 +236,7 @@ def delete_program(pid):
     conn.commit()
     cur.close()
     conn.close()
+    catalog.invalidate()
 
     return redirect(url_for("admin.manage_programs"))
 
@@ -255,18 +319,24 @@ def manage_visa():
 
     conn = get_conn()
     cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-    cur.execute("""
+    page = paginate(
+        cur,
+        """
         SELECT v.visa_id, v.student_id, s.name AS student_name,
                v.country, v.application_status, v.issued_date, v.expiry_date
         FROM VisaPermit v
         JOIN Student s ON v.student_id = s.student_id
-        ORDER BY v.visa_id ASC
-    """)
-    visas = cur.fetchall()
+        """,
+        keys=[("v.visa_id", "visa_id")],
+        filters={
+            "status": "v.application_status = %s",
+            "country": "v.country = %s",
+        }
+    )
 
     cur.close()
     conn.close()
-    return render_template('admin/manage_visa.html', visas=visas)
+    return render_template('admin/manage_visa.html', visas=page.rows, page=page)
 
 
 @admin_bp.route('/admin/visa/<int:vid>/<string:action>', methods=['POST'])
@@ -302,7 +372,46 @@ def decide_visa(vid, action):
     return redirect(url_for('admin.manage_visa'))
 
 
+@admin_bp.route('/admin/visa/batch', methods=['POST'])
+def decide_visa_batch():
+    if not guard():
+        return redirect(url_for('main.login'))
+
+    action = request.form.get("action")
+    if action not in DECISIONS:
+        return redirect(url_for('admin.manage_visa'))
+    ids = batch_ids()
+
+    conn = get_conn()
+    cur = conn.cursor()
+
+    if action == "approve":
+        cur.execute("""
+            UPDATE VisaPermit
+            SET application_status='Approved',
+                issued_date=CURRENT_DATE,
+                expiry_date=CURRENT_DATE + INTERVAL '365 days'
+            WHERE visa_id = ANY(%s) AND application_status='Pending'
+            RETURNING visa_id, application_status
+        """, (ids,))
+    else:
+        cur.execute("""
+            UPDATE VisaPermit
+            SET application_status='Rejected'
+            WHERE visa_id = ANY(%s) AND application_status='Pending'
+            RETURNING visa_id, application_status
+        """, (ids,))
+    decided = dict(cur.fetchall())
+
+    results = batch_outcome(cur, ids, decided, """
+        SELECT visa_id, application_status FROM VisaPermit WHERE visa_id = ANY(%s)
+    """)
+
+    conn.commit()
+    cur.close()
+    conn.close()
 
+    return batch_response("Visa decisions", results, url_for('admin.manage_visa'))
 
 
 @admin_bp.route('/admin/housing')
@@ -361,19 +470,25 @@ def housing_requests():
     conn = get_conn()
     cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
 
-    cur.execute("""
-        SELECT hr.request_id, hr.request_type, hr.status, hr.request_date,
+    page = paginate(
+        cur,
+        """
+        SELECT hr.request_id, hr.request_type, hr.room_type, hr.status, hr.request_date,
                s.student_id, s.name AS student_name
         FROM HousingRequest hr
         JOIN Student s ON hr.student_id = s.student_id
-        ORDER BY hr.request_date ASC
-    """)
-    reqs = cur.fetchall()
+        """,
+        keys=[("hr.request_date", "request_date"), ("hr.request_id", "request_id")],
+        filters={
+            "status": "hr.status = %s",
+            "type": "hr.request_type = %s",
+        }
+    )
 
     cur.close()
     conn.close()
 
-    return render_template("admin/housing_requests.html", reqs=reqs)
+    return render_template("admin/housing_requests.html", reqs=page.rows, page=page)
 
 
 @admin_bp.route('/admin/housing/requests/<int:req_id>/<string:action>', methods=['POST'])
@@ -388,9 +503,10 @@ def decide_housing_request(req_id, action):
     cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
 
     cur.execute("""
-        SELECT request_id, student_id, request_type
+        SELECT request_id, student_id, request_type, room_type
         FROM HousingRequest
-        WHERE request_id=%s
+        WHERE request_id=%s AND status='Pending'
+        FOR UPDATE
     """, (req_id,))
     req = cur.fetchone()
 
@@ -399,57 +515,79 @@ def decide_housing_request(req_id, action):
         conn.close()
         return redirect(url_for('admin.housing_requests'))
 
-    student_id = req["student_id"]
-    req_type = req["request_type"]
-
     if action == "reject":
         cur.execute("UPDATE HousingRequest SET status='Rejected' WHERE request_id=%s", (req_id,))
-        conn.commit()
-        cur.close()
-        conn.close()
-        return redirect(url_for('admin.housing_requests'))
+    else:
+        housing.allocate(cur, req)
 
-    if req_type == "apply":
-        cur.execute("SELECT housing_id FROM Housing WHERE availability=TRUE LIMIT 1")
-        available = cur.fetchone()
+    conn.commit()
+    cur.close()
+    conn.close()
+
+    return redirect(url_for('admin.housing_requests'))
 
-        if not available:
-            cur.execute("UPDATE HousingRequest SET status='Rejected' WHERE request_id=%s", (req_id,))
-        else:
-            housing_id = available["housing_id"]
 
-            cur.execute("""
-                INSERT INTO HousingAssignment (student_id, housing_id)
-                VALUES (%s,%s)
-            """, (student_id, housing_id))
+@admin_bp.route('/admin/housing/requests/batch', methods=['POST'])
+def decide_housing_batch():
+    if not guard():
+        return redirect(url_for('main.login'))
 
-            cur.execute("UPDATE Housing SET availability=FALSE WHERE housing_id=%s", (housing_id,))
+    action = request.form.get("action")
+    if action not in DECISIONS:
+        return redirect(url_for('admin.housing_requests'))
+    ids = batch_ids()
 
-            cur.execute("UPDATE HousingRequest SET status='Approved' WHERE request_id=%s", (req_id,))
+    conn = get_conn()
+    cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
 
+    if action == "reject":
+        cur.execute("""
+            UPDATE HousingRequest SET status='Rejected'
+            WHERE request_id = ANY(%s) AND status='Pending'
+            RETURNING request_id, status
+        """, (ids,))
+        decided = dict(cur.fetchall())
     else:
+        # Oldest first, so rooms go to whoever asked earliest.
         cur.execute("""
-            UPDATE HousingAssignment
-            SET checkout_date=CURRENT_DATE
-            WHERE student_id=%s AND checkout_date IS NULL
-        """, (student_id,))
+            SELECT request_id, student_id, request_type, room_type
+            FROM HousingRequest
+            WHERE request_id = ANY(%s) AND status='Pending'
+            ORDER BY request_date, request_id
+            FOR UPDATE
+        """, (ids,))
+        reqs = cur.fetchall()
+        housing.lock_students(cur, [req["student_id"] for req in reqs])
+        decided = {req["request_id"]: housing.allocate(cur, req) for req in reqs}
+
+    results = batch_outcome(cur, ids, decided, """
+        SELECT request_id, status FROM HousingRequest WHERE request_id = ANY(%s)
+    """)
 
-        cur.execute("""
-            UPDATE Housing SET availability=TRUE
-            WHERE housing_id IN (
-                SELECT housing_id FROM HousingAssignment
-                WHERE student_id=%s
-                ORDER BY assign_id ASC LIMIT 1
-            )
-        """, (student_id,))
+    conn.commit()
+    cur.close()
+    conn.close()
 
-        cur.execute("UPDATE HousingRequest SET status='Approved' WHERE request_id=%s", (req_id,))
+    return batch_response("Housing decisions", results, url_for('admin.housing_requests'))
+
+
+@admin_bp.route('/admin/housing/requests/drain', methods=['POST'])
+def drain_housing_queue():
+    if not guard():
+        return redirect(url_for('main.login'))
 
+    # Draining thousands of requests takes a while; hand it to a worker.
+    conn = get_conn()
+    cur = conn.cursor()
+    job_id = jobs.enqueue(cur, "housing.drain")
     conn.commit()
     cur.close()
     conn.close()
 
-    return redirect(url_for('admin.housing_requests'))
+    if request.accept_mimetypes.best == "application/json":
+        return jsonify(job_id=job_id)
+    return render_template("admin/job_queued.html", job_id=job_id,
+                           title="Housing queue", back=url_for('admin.housing_requests'))
 
 @admin_bp.route("/admin/universities/delete/<int:hid>")
 def delete_housing(hid):
@@ -553,7 +691,8 @@ def manage_mentors():
     cur.close()
     conn.close()
 
-    return render_template("admin/manage_mentors.html", data=data)
+    return render_template("admin/manage_mentors.html", data=data,
+                           error=request.args.get("error"))
 
 
 @admin_bp.route("/admin/mentors/create", methods=["POST"])
@@ -562,20 +701,31 @@ def create_mentor():
         return redirect(url_for("main.login"))
 
     name = request.form['name']
-    email = request.form['email']
-    password = generate_password_hash(request.form['password'])
+    email = request.form['email'].strip().lower()
+    try:
+        password = hash_password(request.form['password'])
+    except PasswordServiceBusy:
+        return redirect(url_for('admin.manage_mentors', error="The server is busy, please try again in a moment."))
     dept = request.form['department']
     university_id = request.form['university_id'] or None
 
     conn = get_conn()
     cur = conn.cursor()
 
-    cur.execute("""
-        INSERT INTO Mentor (name, email, password, department, university_id)
-        VALUES (%s, %s, %s, %s, %s)
-    """, (name, email, password, dept, university_id))
+    # Account's unique lower(email) index rejects addresses already used by
+    # a student, mentor or admin.
+    try:
+        cur.execute("""
+            INSERT INTO Mentor (name, email, password, department, university_id)
+            VALUES (%s, %s, %s, %s, %s)
+        """, (name, email, password, dept, university_id))
+        conn.commit()
+    except IntegrityError:
+        conn.rollback()
+        cur.close()
+        conn.close()
+        return redirect(url_for('admin.manage_mentors', error="An account with that email already exists."))
 
-    conn.commit()
     cur.close()
     conn.close()
 
@@ -681,7 +831,9 @@ def manage_scholarship_applications():
     conn = get_conn()
     cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
 
-    cur.execute("""
+    page = paginate(
+        cur,
+        """
         SELECT sa.sch_app_id, sa.status,
                s.name AS student_name,
                p.title AS program_title,
@@ -691,15 +843,19 @@ def manage_scholarship_applications():
         JOIN Student s ON a.student_id = s.student_id
         JOIN Program p ON a.program_id = p.program_id
         JOIN Scholarship sc ON sa.scholarship_id = sc.scholarship_id
-        ORDER BY sa.sch_app_id ASC
-    """)
-
-    data = cur.fetchall()
+        """,
+        keys=[("sa.sch_app_id", "sch_app_id")],
+        filters={
+            "status": "sa.status = %s",
+            "program": ("a.program_id = %s", int),
+        }
+    )
 
     cur.close()
     conn.close()
 
-    return render_template("admin/manage_scholarship_applications.html", data=data)
+    return render_template("admin/manage_scholarship_applications.html",
+                           data=page.rows, page=page)
 
 @admin_bp.route("/admin/scholarship_applications/<int:sid>/<string:action>", methods=["POST"])
 def decide_scholarship_application(sid, action):
@@ -725,3 +881,130 @@ def decide_scholarship_application(sid, action):
     conn.close()
 
     return redirect(url_for("admin.manage_scholarship_applications"))
+
+
+@admin_bp.route("/admin/scholarship_applications/batch", methods=["POST"])
+def decide_scholarship_batch():
+    if not guard():
+        return redirect(url_for("main.login"))
+
+    action = request.form.get("action")
+    if action not in DECISIONS:
+        return redirect(url_for("admin.manage_scholarship_applications"))
+    ids = batch_ids()
+
+    conn = get_conn()
+    cur = conn.cursor()
+
+    cur.execute("""
+        UPDATE ScholarshipApplication
+        SET status=%s
+        WHERE sch_app_id = ANY(%s) AND status='Pending'
+        RETURNING sch_app_id, status
+    """, (DECISIONS[action], ids))
+    decided = dict(cur.fetchall())
+
+    results = batch_outcome(cur, ids, decided, """
+        SELECT sch_app_id, status FROM ScholarshipApplication WHERE sch_app_id = ANY(%s)
+    """)
+
+    conn.commit()
+    cur.close()
+    conn.close()
+
+    return batch_response("Scholarship decisions", results,
+                          url_for("admin.manage_scholarship_applications"))
+
+
+@admin_bp.route("/admin/export/<string:dataset>.<string:fmt>")
+def export(dataset, fmt):
+    if not guard():
+        return redirect(url_for("main.login"))
+
+    if dataset not in EXPORTS or fmt not in EXPORT_FORMATS:
+        abort(404)
+
+    return Response(
+        stream_export(dataset, fmt),
+        mimetype=EXPORT_FORMATS[fmt],
+        headers={"Content-Disposition": "attachment; filename=%s.%s" % (dataset, fmt)}
+    )
+
+
+@admin_bp.route("/admin/imports", methods=["GET", "POST"])
+def imports():
+    if not guard():
+        return redirect(url_for("main.login"))
+
+    conn = get_conn()
+    cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+
+    error = None
+    if request.method == "POST":
+        kind = request.form.get("kind")
+        upload = request.files.get("file")
+        if kind not in importer.IMPORTS:
+            error = "Choose what the file contains."
+        elif not upload or not upload.filename.lower().endswith(".csv"):
+            error = "Upload a .csv file."
+        else:
+            path = importer.save_upload(upload)
+            importer.queue_import(cur, kind, upload.filename, path)
+            conn.commit()
+            cur.close()
+            conn.close()
+            return redirect(url_for("admin.imports"))
+
+    cur.execute("""
+        SELECT ib.import_id, ib.kind, ib.filename, ib.status, ib.total_rows,
+               ib.imported_rows, ib.error_count, ib.created_at, ib.finished_at,
+               j.status AS job_status, j.attempts, j.last_error
+        FROM ImportBatch ib
+        LEFT JOIN Job j ON ib.job_id = j.job_id
+        ORDER BY ib.import_id DESC
+        LIMIT 50
+    """)
+    batches = cur.fetchall()
+
+    cur.close()
+    conn.close()
+
+    return render_template("admin/imports.html", batches=batches, error=error,
+                           kinds={k: [c[0] for c in v["columns"]]
+                                  for k, v in importer.IMPORTS.items()})
+
+
+@admin_bp.route("/admin/imports/<int:import_id>")
+def import_report(import_id):
+    if not guard():
+        return redirect(url_for("main.login"))
+
+    conn = get_conn()
+    cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+    cur.execute("""
+        SELECT import_id, kind, filename, status, total_rows, imported_rows,
+               error_count, errors, created_at, finished_at
+        FROM ImportBatch
+        WHERE import_id=%s
+    """, (import_id,))
+    batch = cur.fetchone()
+    cur.close()
+    conn.close()
+
+    if not batch:
+        abort(404)
+    return render_template("admin/import_report.html", batch=batch)
+
+
+@admin_bp.route("/admin/metrics")
+def metrics():
+    if not guard():
+        return redirect(url_for("main.login"))
+
+    conn = get_conn()
+    cur = conn.cursor()
+    queue = jobs.metrics(cur)
+    cur.close()
+    conn.close()
+
+    return jsonify(passwords=passwords.metrics(), uploads=uploads.metrics(), jobs=queue)
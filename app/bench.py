@@ -0,0 +1,357 @@
+import argparse
+import json
+import os
+import time
+import psycopg2
+import psycopg2.extensions
+from flask import g, session
+from app import create_app, catalog, datagen, db
+from config import BENCH_RUNS, BENCH_SEQ_SCAN_ROWS, BENCH_BUDGET_HEADROOM, BENCH_BUDGETS
+
+# Query benchmarks for the blueprints: `python -m app.bench` runs each route in
+# ROUTES once against the current database with the real view function, records
+# every statement it sends, then replays those statements BENCH_RUNS times to
+# get p50/p95 database time and once more under EXPLAIN (ANALYZE, BUFFERS).
+# Because the statements come from the views themselves, the benchmark follows
+# the routes' SQL as it changes instead of keeping a copy of it.
+#
+# Nothing is kept: commit() is a no-op on the benchmark connection and every
+# replay is rolled back, so write routes (auto-approval, housing allocation)
+# can be measured over and over against the same rows.
+#
+# A route fails when its p95 exceeds the budget stored for the dataset in
+# BENCH_BUDGETS, or when one of its plans sequentially scans a table of at
+# least BENCH_SEQ_SCAN_ROWS rows that the route doesn't list as expected.
+# `--scales 1k,10k,100k` regenerates the dataset with app.datagen (--reset)
+# before each run; `--record` writes the measured p95s (plus headroom) as the
+# new budgets.
+
+EXPLAIN = "EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) "
+EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "VALUES")
+WARMUP_RUNS = 3
+
+# Entities the routes are pointed at, picked in order; later queries may use
+# earlier picks. The busiest student and program stand in for the worst case.
+PICKS = [
+    ("student", """
+        SELECT student_id FROM Application
+        GROUP BY student_id
+        ORDER BY COUNT(*) DESC, student_id
+        LIMIT 1
+    """),
+    ("email", "SELECT email FROM Student WHERE student_id = %(student)s"),
+    ("university", "SELECT university_id FROM Student WHERE student_id = %(student)s"),
+    ("program", """
+        SELECT program_id FROM Application
+        GROUP BY program_id
+        ORDER BY COUNT(*) DESC, program_id
+        LIMIT 1
+    """),
+    ("mentor", "SELECT mentor_id FROM Program WHERE program_id = %(program)s"),
+    ("application", """
+        SELECT MIN(ad.application_id)
+        FROM ApplicationDocument ad
+        JOIN Application a ON a.application_id = ad.application_id
+        WHERE a.program_id = %(program)s AND ad.status = 'Pending'
+    """),
+    ("requirement", """
+        SELECT MIN(req_id) FROM ApplicationDocument
+        WHERE application_id = %(application)s AND status = 'Pending'
+    """),
+    ("housing_request", """
+        SELECT request_id FROM HousingRequest
+        WHERE status = 'Pending'
+        ORDER BY request_date, request_id
+        LIMIT 1
+    """),
+    ("admin", "SELECT MIN(admin_id) FROM Admin"),
+]
+
+# (endpoint, role, method, path, form, tables it may sequentially scan)
+ROUTES = [
+    ("main.login", None, "POST", "/login",
+     {"email": "{email}", "password": datagen.DEFAULT_PASSWORD}, ()),
+    ("student.dashboard", "student", "GET", "/student/dashboard", None, ()),
+    # The catalog page loads every program into the worker's cache.
+    ("student.programs", "student", "GET", "/student/programs", None,
+     ("program", "university", "mentor")),
+    ("student.search_programs", "student", "GET",
+     "/student/programs/search?q=machine+learning", None, ()),
+    ("student.program_details", "student", "GET", "/student/program/{program}", None, ()),
+    ("mentor.dashboard", "mentor", "GET", "/mentor/dashboard", None, ()),
+    ("mentor.student_applications", "mentor", "GET", "/mentor/student_applications", None, ()),
+    ("mentor.review_documents", "mentor", "GET", "/mentor/review_documents", None, ()),
+    ("mentor.review_application", "mentor", "GET", "/mentor/application/{application}",
+     None, ()),
+    # Approving a document runs the application's auto-approval.
+    ("mentor.decide_document", "mentor", "POST",
+     "/mentor/document/{application}/{requirement}/approve", {}, ()),
+    ("admin.dashboard", "admin", "GET", "/admin/dashboard", None, ()),
+    ("admin.manage_students", "admin", "GET", "/admin/students?university={university}",
+     None, ()),
+    ("admin.manage_visa", "admin", "GET", "/admin/visa?status=Pending", None, ()),
+    ("admin.housing_requests", "admin", "GET", "/admin/housing/requests?status=Pending",
+     None, ()),
+    ("admin.manage_scholarship_applications", "admin", "GET",
+     "/admin/scholarship_applications?status=Pending", None, ()),
+    ("admin.decide_housing_request", "admin", "POST",
+     "/admin/housing/requests/{housing_request}/approve", {}, ()),
+]
+
+
+class _Recording:
+    def execute(self, query, vars=None):
+        self.connection.statements.append((query, vars))
+        return super().execute(query, vars)
+
+
+class CaptureConnection(psycopg2.extensions.connection):
+    # Records what every cursor executes; commit() keeps nothing.
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.statements = []
+        self._recording = {}
+
+    def cursor(self, *args, **kwargs):
+        factory = kwargs.pop("cursor_factory", None) or self.cursor_factory \
+            or psycopg2.extensions.cursor
+        if factory not in self._recording:
+            self._recording[factory] = type("Recording" + factory.__name__,
+                                            (_Recording, factory), {})
+        return super().cursor(*args, cursor_factory=self._recording[factory], **kwargs)
+
+    def commit(self):
+        pass
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+def pick(cur):
+    picks = {}
+    for name, query in PICKS:
+        cur.execute(query, picks)
+        row = cur.fetchone()
+        picks[name] = row[0] if row else None
+    return picks
+
+
+def table_sizes(cur):
+    cur.execute("""
+        SELECT relname, reltuples FROM pg_class
+        WHERE relkind = 'r' AND relnamespace = 'public'::regnamespace
+    """)
+    return dict(cur.fetchall())
+
+
+def capture(app, conn, picks, role, method, path, form):
+    identity = {"role": role, "user_id": picks.get(role), "name": "bench"} if role else {}
+    form = {k: v.format(**picks) for k, v in (form or {}).items()}
+    conn.statements = []
+    with app.test_request_context(path.format(**picks), method=method, data=form):
+        session.update(identity)
+        g._db_conn = db.PooledConnection(conn, request_scoped=True)
+        try:
+            response = app.full_dispatch_request()
+        finally:
+            # Not a pool connection; keep release_conn from returning it.
+            g.pop("_db_conn", None)
+    conn.rollback()
+    if response.status_code >= 400:
+        raise RuntimeError("%s %s returned %s" % (method, path, response.status))
+    return list(conn.statements)
+
+
+def replay(cur, statements, explain=False):
+    # Runs the captured statements in order, as the view did, and returns
+    # the seconds each took, or with explain=True each one's plan (None for
+    # statements EXPLAIN doesn't take).
+    results = []
+    for query, vars in statements:
+        verb = (query.decode() if isinstance(query, bytes) else query).split(None, 1)[0]
+        if explain:
+            if verb.upper() in EXPLAINABLE:
+                prefix = EXPLAIN.encode() if isinstance(query, bytes) else EXPLAIN
+                cur.execute(prefix + query, vars)
+                results.append(cur.fetchone()[0][0])
+            else:
+                cur.execute(query, vars)
+                results.append(None)
+            continue
+        started = time.perf_counter()
+        cur.execute(query, vars)
+        if cur.description is not None:
+            cur.fetchall()
+        results.append(time.perf_counter() - started)
+    cur.connection.rollback()
+    return results
+
+
+def seq_scans(node):
+    found = []
+    if node.get("Node Type") == "Seq Scan":
+        found.append(node["Relation Name"])
+    for child in node.get("Plans", ()):
+        found.extend(seq_scans(child))
+    return found
+
+
+def load_budgets():
+    if not os.path.exists(BENCH_BUDGETS):
+        return {}
+    with open(BENCH_BUDGETS) as f:
+        return json.load(f)
+
+
+def dataset_label(cur):
+    cur.execute("SELECT COUNT(*) FROM Student")
+    count = cur.fetchone()[0]
+    return next((name for name, n in datagen.SCALES.items() if n == count), str(count))
+
+
+def run(app, label=None, runs=BENCH_RUNS, only=None):
+    conn = db._connect(connection_factory=CaptureConnection)
+    # A plain cursor, so replays aren't recorded themselves.
+    cur = psycopg2.extensions.cursor(conn)
+    picks = pick(cur)
+    sizes = table_sizes(cur)
+    label = label or dataset_label(cur)
+    conn.rollback()
+    budgets = load_budgets().get(label, {})
+    catalog.invalidate()
+
+    report = {"dataset": label, "runs": runs, "picks": picks, "routes": []}
+    for endpoint, role, method, path, form, allowed in ROUTES:
+        if only and endpoint not in only:
+            continue
+        result = {"endpoint": endpoint, "failures": []}
+        report["routes"].append(result)
+
+        missing = [name for name, value in picks.items()
+                   if value is None and "{%s}" % name in path + json.dumps(form)]
+        if missing or (role and picks.get(role) is None):
+            result["skipped"] = "no %s in this dataset" % ", ".join(missing or [role])
+            continue
+
+        try:
+            statements = capture(app, conn, picks, role, method, path, form)
+            totals, per_statement = [], [[] for _ in statements]
+            for i in range(WARMUP_RUNS + runs):
+                timings = replay(cur, statements)
+                if i >= WARMUP_RUNS:
+                    totals.append(sum(timings))
+                    for samples, seconds in zip(per_statement, timings):
+                        samples.append(seconds)
+            plans = replay(cur, statements, explain=True)
+        except (psycopg2.Error, RuntimeError) as e:
+            conn.rollback()
+            result["failures"].append("error: %s" % str(e).strip())
+            continue
+
+        result["p50_ms"] = round(percentile(totals, 50) * 1000, 3)
+        result["p95_ms"] = round(percentile(totals, 95) * 1000, 3)
+        result["statements"] = []
+        for (query, vars), samples, plan in zip(statements, per_statement, plans):
+            text = query.decode() if isinstance(query, bytes) else query
+            scans = sorted(set(seq_scans(plan["Plan"]))) if plan else []
+            result["statements"].append({
+                "sql": " ".join(text.split()),
+                "params": vars,
+                "p50_ms": round(percentile(samples, 50) * 1000, 3),
+                "p95_ms": round(percentile(samples, 95) * 1000, 3),
+                "seq_scans": scans,
+                "plan": plan,
+            })
+            for table in scans:
+                if table not in allowed and sizes.get(table, 0) >= BENCH_SEQ_SCAN_ROWS:
+                    result["failures"].append("seq scan on %s (%d rows)"
+                                              % (table, sizes[table]))
+
+        budget = budgets.get(endpoint)
+        result["budget_ms"] = budget
+        if budget is not None and result["p95_ms"] > budget:
+            result["failures"].append("p95 %.1fms over budget %.1fms"
+                                      % (result["p95_ms"], budget))
+
+    cur.close()
+    conn.close()
+    return report
+
+
+def record(report):
+    budgets = load_budgets()
+    scale = budgets.setdefault(report["dataset"], {})
+    for result in report["routes"]:
+        if "p95_ms" in result:
+            scale[result["endpoint"]] = round(result["p95_ms"] * BENCH_BUDGET_HEADROOM, 1)
+    with open(BENCH_BUDGETS, "w") as f:
+        json.dump(budgets, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def print_report(report):
+    print("Dataset %s, %d runs per route" % (report["dataset"], report["runs"]))
+    print("%-40s %5s %9s %9s %9s  %s" % ("route", "stmts", "p50 ms", "p95 ms", "budget", "result"))
+    for result in report["routes"]:
+        if "skipped" in result:
+            print("%-40s %s" % (result["endpoint"], "skipped: " + result["skipped"]))
+            continue
+        budget = result.get("budget_ms")
+        print("%-40s %5s %9s %9s %9s  %s" % (
+            result["endpoint"], len(result.get("statements", ())),
+            result.get("p50_ms", "-"), result.get("p95_ms", "-"),
+            "-" if budget is None else budget,
+            "; ".join(result["failures"]) or "ok"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the routes' SQL.")
+    parser.add_argument("--scales", default=None,
+                        help="comma-separated datagen scales to generate (with --reset) "
+                             "and benchmark in turn; default: the current database")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--runs", type=int, default=BENCH_RUNS)
+    parser.add_argument("--route", action="append", default=None,
+                        help="only this endpoint (repeatable)")
+    parser.add_argument("--output", default="bench_results",
+                        help="directory for the JSON reports with plans")
+    parser.add_argument("--record", action="store_true",
+                        help="store the measured p95s plus headroom as the budgets")
+    args = parser.parse_args()
+
+    app = create_app()
+    app.testing = True
+    db.init_db()
+
+    scales = args.scales.split(",") if args.scales else [None]
+    failed = False
+    for scale in scales:
+        if scale:
+            students = datagen.parse_scale(scale)
+            print("Generating %s..." % scale)
+            datagen.generate(students, args.seed, do_reset=True)
+
+        report = run(app, scale, args.runs, args.route)
+        print_report(report)
+
+        os.makedirs(args.output, exist_ok=True)
+        path = os.path.join(args.output, "%s.json" % report["dataset"])
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2, default=str)
+        print("Plans written to %s\n" % path)
+
+        if args.record:
+            record(report)
+        elif any(result["failures"] for result in report["routes"]):
+            failed = True
+
+    raise SystemExit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+import csv
+import io
+import logging
+import os
+import zipfile
+import psycopg2.extras
+from werkzeug.utils import secure_filename
+from app import storage
+from app.db import get_pool
+
+log = logging.getLogger(__name__)
+
+BUNDLE_QUERY = """
+    SELECT a.application_id, s.name AS student_name,
+           rd.req_id, rd.document_name, ad.status, ad.file_name,
+           sf.path, sf.sha256, sf.size
+    FROM ApplicationDocument ad
+    JOIN RequiredDocuments rd ON ad.req_id = rd.req_id
+    JOIN Application a ON ad.application_id = a.application_id
+    JOIN Student s ON a.student_id = s.student_id
+    LEFT JOIN StoredFile sf ON sf.file_id = ad.file_id
+    WHERE {scope} = %s AND ad.file_name IS NOT NULL
+    ORDER BY ad.application_id, rd.req_id
+"""
+
+BUNDLE_SCOPES = {
+    "application": "ad.application_id",
+    "program": "a.program_id",
+}
+
+# archive_path is left empty, and note says why, for documents whose file is
+# missing from disk and so not in the archive.
+MANIFEST_COLUMNS = ["application_id", "student", "requirement", "status",
+                    "file_name", "sha256", "size", "archive_path", "note"]
+
+
+class _Sink(io.RawIOBase):
+    # Write-only, unseekable target for ZipFile. Whatever the archive writes
+    # is handed to the response on the next drain(), so at most one chunk of
+    # compressed output is ever held in memory.
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _archive_path(row):
+    folder = "%d_%s" % (row["application_id"], secure_filename(row["student_name"]) or "student")
+    ext = row["file_name"].rsplit(".", 1)[-1] if "." in row["file_name"] else "bin"
+    name = "%d_%s.%s" % (row["req_id"], secure_filename(row["document_name"]) or "document", ext)
+    return folder + "/" + name
+
+
+def _source_path(row):
+    if row["path"]:
+        return storage.absolute_path(row["path"])
+    return os.path.join(storage.LEGACY_UPLOADS, row["file_name"])
+
+
+def _rows(conn, scope, key, name):
+    cur = conn.cursor(name=name, cursor_factory=psycopg2.extras.DictCursor)
+    cur.itersize = 500
+    cur.execute(BUNDLE_QUERY.format(scope=BUNDLE_SCOPES[scope]), (key,))
+    for row in cur:
+        yield row
+    cur.close()
+
+
+def stream_zip(scope, key):
+    # Two passes over the same server-side query: the manifest goes first so
+    # it is the first thing a reviewer sees, without keeping the document
+    # list in memory; then every file is copied into the archive in chunks.
+    pool = get_pool()
+    conn = pool.getconn()
+    sink = _Sink()
+    try:
+        with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=1) as zf:
+            with zf.open("manifest.csv", "w") as entry:
+                text = io.TextIOWrapper(entry, encoding="utf-8", newline="")
+                writer = csv.writer(text)
+                writer.writerow(MANIFEST_COLUMNS)
+                for n, row in enumerate(_rows(conn, scope, key, "bundle_manifest"), 1):
+                    present = os.path.isfile(_source_path(row))
+                    writer.writerow([
+                        row["application_id"], row["student_name"], row["document_name"],
+                        row["status"], row["file_name"], row["sha256"] or "",
+                        row["size"] or "", _archive_path(row) if present else "",
+                        "" if present else "file missing"
+                    ])
+                    if n % 500 == 0:
+                        text.flush()
+                        data = sink.drain()
+                        if data:
+                            yield data
+                text.flush()
+                text.detach()
+            yield sink.drain()
+
+            for row in _rows(conn, scope, key, "bundle_files"):
+                try:
+                    src = open(_source_path(row), "rb")
+                except FileNotFoundError:
+                    log.warning("bundle %s %s: file for application %d requirement %d "
+                                "is missing, left out of the archive",
+                                scope, key, row["application_id"], row["req_id"])
+                    continue
+                with src, zf.open(_archive_path(row), "w") as entry:
+                    while True:
+                        chunk = src.read(storage.CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        entry.write(chunk)
+                        data = sink.drain()
+                        if data:
+                            yield data
+                yield sink.drain()
+        yield sink.drain()
+        conn.rollback()
+    finally:
+        pool.putconn(conn)
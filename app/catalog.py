@@ -0,0 +1,72 @@
+import threading
+import time
+import psycopg2.extras
+from app.db import get_conn
+from config import CATALOG_VERSION_TTL
+
+# In-process cache of the student program catalog. Entries are keyed by
+# CatalogVersion.version, which triggers bump on every Program change (and on
+# University/Mentor renames). The version itself is re-read at most every
+# CATALOG_VERSION_TTL seconds, so a warm worker answers catalog requests,
+# including 304s, without touching the database.
+
+_lock = threading.Lock()
+_version = None
+_updated_at = None
+_checked_at = 0.0
+_pages = {}
+
+
+def current_version():
+    global _version, _updated_at, _checked_at
+    if _version is not None and time.monotonic() - _checked_at < CATALOG_VERSION_TTL:
+        return _version, _updated_at
+
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute("SELECT version, updated_at FROM CatalogVersion")
+    version, updated_at = cur.fetchone()
+    cur.close()
+    conn.close()
+
+    with _lock:
+        _version, _updated_at = version, updated_at
+        _checked_at = time.monotonic()
+        for stale in [v for v in _pages if v != version]:
+            del _pages[stale]
+    return version, updated_at
+
+
+def invalidate():
+    # Called after an admin changes the catalog so this worker notices
+    # immediately; other workers pick it up within CATALOG_VERSION_TTL.
+    global _checked_at
+    with _lock:
+        _checked_at = 0.0
+
+
+def load_programs():
+    conn = get_conn()
+    cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+    cur.execute("""
+        SELECT p.program_id, p.title, u.name AS university,
+               m.name AS mentor, p.duration
+        FROM Program p
+        LEFT JOIN University u ON p.university_id=u.university_id
+        LEFT JOIN Mentor m ON p.mentor_id=m.mentor_id
+        ORDER BY p.program_id
+    """)
+    programs = cur.fetchall()
+    cur.close()
+    conn.close()
+    return programs
+
+
+def cached_page(version, render):
+    page = _pages.get(version)
+    if page is None:
+        page = render(load_programs())
+        with _lock:
+            if version == _version:
+                _pages[version] = page
+    return page
@@ -0,0 +1,434 @@
+import argparse
+import csv
+import io
+import itertools
+import multiprocessing
+import os
+import random
+import time
+from datetime import date, datetime, timedelta
+from werkzeug.security import generate_password_hash
+from app.db import _connect
+from app import stats
+from config import PASSWORD_HASH_METHOD
+
+# Synthetic portal data for performance work: `python -m app.datagen --scale 100k`
+# adds 100k students with everything hanging off them (applications, documents,
+# scholarship applications, visas, housing) plus the universities, mentors,
+# programs, requirements, scholarships and rooms they need. For a given day the
+# output depends only on --seed and the scale, not on --workers (dates are
+# relative to today). Every generated account logs in with DEFAULT_PASSWORD.
+#
+# Shape of the data:
+#   - universities, program popularity and student universities are Zipf-skewed,
+#     so a few programs get most of the applications
+#   - 0-5 applications per student, most students have 1-2
+#   - document and scholarship statuses agree with their application's status
+#   - about 60% of rooms are occupied, each by a student of that university
+
+SCALES = {"1k": 1000, "10k": 10000, "100k": 100000, "1m": 1000000}
+
+STUDENTS_PER_UNIVERSITY = 2000
+STUDENTS_PER_MENTOR = 40
+ROOMS_PER_STUDENT = 0.25
+ROOMS_OCCUPIED = 0.6
+CHUNK_STUDENTS = 5000
+APP_SLOTS = 5              # application ids are reserved per student
+DEFAULT_PASSWORD = "portal-demo"
+
+COUNTRIES = [("India", 30), ("Germany", 12), ("United States", 12), ("Japan", 8),
+             ("France", 7), ("Canada", 7), ("Australia", 6), ("Singapore", 5),
+             ("Netherlands", 5), ("Sweden", 4), ("Brazil", 4)]
+CITIES = ["Coimbatore", "Munich", "Boston", "Kyoto", "Lyon", "Toronto", "Melbourne",
+          "Singapore", "Delft", "Lund", "Campinas", "Bengaluru", "Aachen", "Austin"]
+UNIVERSITY_KINDS = ["University", "Institute of Technology", "Technical University",
+                    "University of Science", "Polytechnic"]
+DEPARTMENTS = [("Computer Science", 30), ("Electrical Engineering", 14),
+               ("Mechanical Engineering", 12), ("Data Science", 10), ("Physics", 6),
+               ("Biotechnology", 6), ("Civil Engineering", 6), ("Mathematics", 5),
+               ("Chemical Engineering", 5), ("Economics", 4), ("Design", 2)]
+TOPICS = ["Machine Learning", "Robotics", "Embedded Systems", "Renewable Energy",
+          "Computer Vision", "Distributed Systems", "Bioinformatics", "Cybersecurity",
+          "Materials Science", "Quantum Computing", "Urban Mobility", "Climate Modelling",
+          "Natural Language Processing", "Supply Chain Analytics", "Medical Imaging"]
+PROGRAM_TYPES = [("Research", 45), ("Industry", 30), ("Exchange", 15), ("Summer School", 10)]
+DOCUMENTS = ["Transcript", "Statement of Purpose", "Recommendation Letter", "Resume",
+             "Passport Copy", "Language Certificate", "Portfolio", "Research Proposal"]
+ROOM_TYPES = [("Shared", 40), ("Double", 30), ("Single", 22), ("Studio", 8)]
+RENT = {"Shared": 250, "Double": 400, "Single": 600, "Studio": 850}
+APPS_PER_STUDENT = [25, 35, 20, 10, 7, 3]
+FIRST_NAMES = ["Aarav", "Ananya", "Lukas", "Mia", "Noah", "Emma", "Haruto", "Yui",
+               "Louis", "Chloe", "Liam", "Olivia", "Wei", "Mei", "Mateus", "Sofia",
+               "Arjun", "Diya", "Elias", "Freya", "Omar", "Layla", "Kenji", "Sara"]
+LAST_NAMES = ["Sharma", "Iyer", "Müller", "Schmidt", "Smith", "Johnson", "Sato",
+              "Tanaka", "Martin", "Bernard", "Brown", "Tan", "Silva", "Santos",
+              "Nair", "Reddy", "Andersson", "de Jong", "Khan", "Nguyen"]
+
+# (table, id column) for every table whose sequence is moved past generated ids.
+SEQUENCES = [("University", "university_id"), ("Mentor", "mentor_id"),
+             ("Program", "program_id"), ("RequiredDocuments", "req_id"),
+             ("Scholarship", "scholarship_id"), ("Housing", "housing_id"),
+             ("Admin", "admin_id"), ("Student", "student_id"),
+             ("Application", "application_id")]
+
+# Counter triggers (migrations 0003 and 0009). Every COPY would bump the same
+# few PortalStats rows, serializing the loader processes on their row locks,
+# so they are disabled for the load and stats.reconcile() recounts at the end.
+COUNTER_TRIGGERS = [
+    ("Student", "trg_stats_student_ins"), ("Mentor", "trg_stats_mentor_ins"),
+    ("Program", "trg_stats_program_ins"), ("Application", "trg_stats_application_ins"),
+    ("Scholarship", "trg_stats_scholarship_ins"), ("VisaPermit", "trg_stats_visa_ins"),
+    ("Housing", "trg_stats_housing_ins"), ("ApplicationDocument", "trg_stats_app_doc_ins"),
+    ("ApplicationDocument", "trg_app_doc_counts_ins"),
+]
+
+RESET_TABLES = ["ApplicationDocument", "ScholarshipApplication", "Application",
+                "RequiredDocuments", "Scholarship", "HousingAssignment", "HousingRequest",
+                "VisaPermit", "Housing", "Program", "Student", "Mentor", "University"]
+
+
+def parse_scale(value):
+    value = value.lower()
+    if value in SCALES:
+        return SCALES[value]
+    try:
+        return int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError("use one of %s or a student count" % ", ".join(SCALES))
+
+
+def zipf_cum(n, s=1.1):
+    return list(itertools.accumulate(1.0 / (i + 1) ** s for i in range(n)))
+
+
+def weighted(rng, choices):
+    return rng.choices([c for c, _ in choices], weights=[w for _, w in choices])[0]
+
+
+def person(rng):
+    return "%s %s" % (rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES))
+
+
+def copy(cur, table, columns, rows):
+    buf = io.StringIO()
+    csv.writer(buf).writerows(rows)
+    buf.seek(0)
+    cur.copy_expert("COPY %s (%s) FROM STDIN WITH (FORMAT csv)" % (table, ", ".join(columns)), buf)
+    return len(rows)
+
+
+def next_ids(cur):
+    ids = {}
+    for table, column in SEQUENCES:
+        cur.execute("SELECT COALESCE(MAX(%s), 0) FROM %s" % (column, table))
+        ids[table] = cur.fetchone()[0]
+    return ids
+
+
+def reset(cur):
+    # TRUNCATE bypasses the row triggers, so the derived tables are fixed up
+    # by hand here and the counters by stats.reconcile() at the end.
+    cur.execute("TRUNCATE %s RESTART IDENTITY" % ", ".join(RESET_TABLES))
+    cur.execute("DELETE FROM Account WHERE role IN ('student', 'mentor')")
+    cur.execute("UPDATE StoredFile SET ref_count = 0, last_seen = NOW()")
+
+
+def counter_triggers(cur, enable):
+    # ALTER TABLE applies to every session, so writes from the running app
+    # during a load go uncounted too; the reconcile afterwards covers them.
+    for table, trigger in COUNTER_TRIGGERS:
+        cur.execute("ALTER TABLE %s %s TRIGGER %s"
+                    % (table, "ENABLE" if enable else "DISABLE", trigger))
+
+
+def generate_parents(cur, rng, students, ids, pw_hash, today):
+    # Everything the students refer to. Small enough to build in one process;
+    # returns the lookups the student workers need.
+    counts = {}
+
+    n_univ = max(3, students // STUDENTS_PER_UNIVERSITY)
+    univ_ids = [ids["University"] + i + 1 for i in range(n_univ)]
+    rows = []
+    for uid in univ_ids:
+        rows.append((uid, "%s %s" % (rng.choice(CITIES), rng.choice(UNIVERSITY_KINDS)),
+                     weighted(rng, COUNTRIES), rng.randint(1, 500),
+                     "admissions%d@u%d.example.edu" % (uid, uid)))
+    counts["University"] = copy(cur, "University",
+                                ["university_id", "name", "country", "ranking", "contact_email"], rows)
+    univ_cum = zipf_cum(n_univ)
+
+    n_mentors = max(1, students // STUDENTS_PER_MENTOR)
+    mentor_univ = {}
+    rows = []
+    for i in range(n_mentors):
+        mid = ids["Mentor"] + i + 1
+        mentor_univ[mid] = rng.choices(univ_ids, cum_weights=univ_cum)[0]
+        rows.append((mid, "Dr. " + person(rng), "mentor%d@example.edu" % mid, pw_hash,
+                     weighted(rng, DEPARTMENTS), mentor_univ[mid]))
+    counts["Mentor"] = copy(cur, "Mentor",
+                            ["mentor_id", "name", "email", "password", "department", "university_id"],
+                            rows)
+
+    programs, prog_rows = [], []
+    pid = ids["Program"]
+    for mid, uid in mentor_univ.items():
+        for _ in range(rng.choice((1, 2, 2, 3))):
+            pid += 1
+            topic, kind = rng.choice(TOPICS), weighted(rng, PROGRAM_TYPES)
+            weeks = rng.choice((4, 6, 8, 12, 24))
+            start = today + timedelta(days=rng.randint(30, 365))
+            prog_rows.append((
+                pid, "%s %s Internship" % (topic, kind), kind, weeks,
+                "A %d-week %s placement in %s. Participants join an active team, "
+                "present their work and receive a certificate on completion."
+                % (weeks, kind.lower(), topic.lower()),
+                "Open to students of %s or related fields with a CGPA of %.1f or above."
+                % (weighted(rng, DEPARTMENTS), rng.choice((6.0, 6.5, 7.0, 7.5, 8.0))),
+                start, start + timedelta(weeks=weeks), uid, mid))
+            programs.append(pid)
+    counts["Program"] = copy(cur, "Program",
+                             ["program_id", "title", "program_type", "duration", "description",
+                              "eligibility", "start_date", "end_date", "university_id", "mentor_id"],
+                             prog_rows)
+
+    # Popularity is Zipf over a shuffled order, so hot programs are spread
+    # across universities and id ranges.
+    popular = programs[:]
+    rng.shuffle(popular)
+
+    prog_reqs, prog_schs = {}, {}
+    req_rows, sch_rows = [], []
+    req_id, sch_id = ids["RequiredDocuments"], ids["Scholarship"]
+    for p in programs:
+        prog_reqs[p] = []
+        for name in rng.sample(DOCUMENTS, rng.randint(2, 5)):
+            req_id += 1
+            req_rows.append((req_id, p, name))
+            prog_reqs[p].append(req_id)
+        prog_schs[p] = []
+        for _ in range(rng.choices((0, 1, 2), weights=(50, 35, 15))[0]):
+            sch_id += 1
+            sch_rows.append((sch_id, p, "%s Merit Award" % rng.choice(CITIES),
+                             rng.choice((500, 1000, 1500, 2500, 5000)),
+                             "Top applicants by CGPA."))
+            prog_schs[p].append(sch_id)
+    counts["RequiredDocuments"] = copy(cur, "RequiredDocuments",
+                                       ["req_id", "program_id", "document_name"], req_rows)
+    counts["Scholarship"] = copy(cur, "Scholarship",
+                                 ["scholarship_id", "program_id", "name", "amount",
+                                  "eligibility_criteria"], sch_rows)
+
+    n_rooms = max(1, int(students * ROOMS_PER_STUDENT))
+    occupied = int(n_rooms * ROOMS_OCCUPIED)
+    room_ids, room_univ, rows = [], [], []
+    for r in range(n_rooms):
+        hid = ids["Housing"] + r + 1
+        uid = rng.choices(univ_ids, cum_weights=univ_cum)[0]
+        kind = weighted(rng, ROOM_TYPES)
+        rows.append((hid, uid, "Block %s, %s" % (chr(65 + r % 26), rng.choice(CITIES)),
+                     kind, RENT[kind] + rng.randint(-50, 150), r >= occupied))
+        room_ids.append(hid)
+        room_univ.append(uid)
+    counts["Housing"] = copy(cur, "Housing",
+                             ["housing_id", "university_id", "location", "room_type", "rent",
+                              "availability"], rows)
+
+    rows = [(ids["Admin"] + i + 1, person(rng), "admin%d@example.edu" % (ids["Admin"] + i + 1),
+             pw_hash) for i in range(2)]
+    counts["Admin"] = copy(cur, "Admin", ["admin_id", "name", "email", "password"], rows)
+
+    return counts, {
+        "univ_ids": univ_ids,
+        "univ_cum": univ_cum,
+        "popular": popular,
+        "popular_cum": zipf_cum(len(popular)),
+        "prog_reqs": prog_reqs,
+        "prog_schs": prog_schs,
+        "room_ids": room_ids[:occupied],
+        "room_univ": room_univ[:occupied],
+        "room_stride": max(1, students // occupied) if occupied else 0,
+        "pw_hash": pw_hash,
+        "today": today,
+    }
+
+
+_ctx = None
+_conn = None
+
+
+def _init_worker(ctx):
+    global _ctx
+    _ctx = ctx
+
+
+def generate_students(task):
+    # One chunk of students and all of their rows, in one transaction.
+    # Ids derive from the student's position, so chunks are independent.
+    global _conn
+    seed, chunk, student_base, app_base, first, last = task
+    ctx = _ctx
+    rng = random.Random("%s:students:%d" % (seed, chunk))
+    today = ctx["today"]
+    now = datetime.combine(today, datetime.min.time())
+    stride, rooms = ctx["room_stride"], ctx["room_ids"]
+
+    students, apps, docs, sch_apps = [], [], [], []
+    visas, housing_reqs, assignments = [], [], []
+
+    for idx in range(first, last):
+        sid = student_base + idx + 1
+        room = idx // stride if stride and idx % stride == 0 and idx // stride < len(rooms) else None
+        uid = (ctx["room_univ"][room] if room is not None
+               else rng.choices(ctx["univ_ids"], cum_weights=ctx["univ_cum"])[0])
+        cgpa = min(9.99, max(4.0, rng.gauss(7.4, 1.1)))
+        students.append((sid, person(rng), "student%d@example.edu" % sid, ctx["pw_hash"],
+                         date(rng.randint(1996, 2006), rng.randint(1, 12), rng.randint(1, 28)),
+                         weighted(rng, DEPARTMENTS), "%.2f" % cgpa, uid))
+
+        chosen = set()
+        n_apps = rng.choices(range(len(APPS_PER_STUDENT)), weights=APPS_PER_STUDENT)[0]
+        for k in range(min(n_apps, APP_SLOTS)):
+            p = rng.choices(ctx["popular"], cum_weights=ctx["popular_cum"])[0]
+            if p in chosen:
+                continue
+            chosen.add(p)
+            app_id = app_base + idx * APP_SLOTS + k + 1
+            status = rng.choices(("Pending", "Approved", "Rejected"), weights=(60, 25, 15))[0]
+
+            reqs = ctx["prog_reqs"][p]
+            rejected_req = rng.choice(reqs) if status == "Rejected" else None
+            for req in reqs:
+                if status == "Approved":
+                    doc_status = "Approved"
+                elif status == "Rejected":
+                    doc_status = "Rejected" if req == rejected_req else "Approved"
+                elif rng.random() < 0.7:
+                    doc_status = "Pending" if rng.random() < 0.8 else "Approved"
+                else:
+                    continue
+                docs.append((app_id, req, "%s_%d.pdf" % (req, app_id), doc_status))
+
+            awarded = False
+            if ctx["prog_schs"][p] and rng.random() < 0.3:
+                sch_status = {"Pending": "Pending", "Rejected": "Rejected"}.get(
+                    status, rng.choice(("Pending", "Approved", "Rejected")))
+                awarded = sch_status == "Approved"
+                sch_apps.append((app_id, rng.choice(ctx["prog_schs"][p]), sch_status))
+
+            apps.append((app_id, sid, p, status,
+                         now - timedelta(minutes=rng.randint(0, 180 * 24 * 60)), awarded))
+
+        if rng.random() < 0.4:
+            v_status = rng.choices(("Pending", "Approved", "Rejected"), weights=(50, 40, 10))[0]
+            issued = today - timedelta(days=rng.randint(0, 300)) if v_status == "Approved" else None
+            visas.append((sid, weighted(rng, COUNTRIES), v_status, issued,
+                          issued + timedelta(days=365) if issued else None))
+
+        if room is not None:
+            allotted = today - timedelta(days=rng.randint(1, 300))
+            assignments.append((sid, rooms[room], allotted))
+            housing_reqs.append((sid, "apply", None, "Approved",
+                                 datetime.combine(allotted, datetime.min.time()) - timedelta(days=3)))
+            if rng.random() < 0.05:
+                housing_reqs.append((sid, "vacate", None, "Pending",
+                                     now - timedelta(minutes=rng.randint(0, 30 * 24 * 60))))
+        elif rng.random() < 0.15:
+            housing_reqs.append((sid, "apply",
+                                 weighted(rng, ROOM_TYPES) if rng.random() < 0.5 else None,
+                                 rng.choices(("Pending", "Rejected"), weights=(70, 30))[0],
+                                 now - timedelta(minutes=rng.randint(0, 60 * 24 * 60))))
+
+    if _conn is None or _conn.closed:
+        _conn = _connect()
+    cur = _conn.cursor()
+    counts = {
+        "Student": copy(cur, "Student", ["student_id", "name", "email", "password", "dob",
+                                         "department", "cgpa", "university_id"], students),
+        "Application": copy(cur, "Application", ["application_id", "student_id", "program_id",
+                                                 "status", "applied_date", "scholarship_awarded"],
+                            apps),
+        "ApplicationDocument": copy(cur, "ApplicationDocument",
+                                    ["application_id", "req_id", "file_name", "status"], docs),
+        "ScholarshipApplication": copy(cur, "ScholarshipApplication",
+                                       ["application_id", "scholarship_id", "status"], sch_apps),
+        "VisaPermit": copy(cur, "VisaPermit", ["student_id", "country", "application_status",
+                                               "issued_date", "expiry_date"], visas),
+        "HousingRequest": copy(cur, "HousingRequest", ["student_id", "request_type", "room_type",
+                                                       "status", "request_date"], housing_reqs),
+        "HousingAssignment": copy(cur, "HousingAssignment",
+                                  ["student_id", "housing_id", "allotment_date"], assignments),
+    }
+    _conn.commit()
+    cur.close()
+    return counts
+
+
+def generate(students, seed=1, workers=None, do_reset=False):
+    started = time.time()
+    rng = random.Random("%s:parents" % seed)
+    today = date.today()
+    pw_hash = generate_password_hash(DEFAULT_PASSWORD, method=PASSWORD_HASH_METHOD)
+
+    conn = _connect()
+    cur = conn.cursor()
+    counter_triggers(cur, enable=False)
+    conn.commit()
+    try:
+        if do_reset:
+            reset(cur)
+        ids = next_ids(cur)
+        counts, ctx = generate_parents(cur, rng, students, ids, pw_hash, today)
+        conn.commit()
+
+        tasks = [(seed, chunk, ids["Student"], ids["Application"],
+                  first, min(first + CHUNK_STUDENTS, students))
+                 for chunk, first in enumerate(range(0, students, CHUNK_STUDENTS))]
+
+        mp = multiprocessing.get_context("spawn")
+        with mp.Pool(workers or os.cpu_count(), initializer=_init_worker, initargs=(ctx,)) as pool:
+            for chunk_counts in pool.imap_unordered(generate_students, tasks):
+                for table, n in chunk_counts.items():
+                    counts[table] = counts.get(table, 0) + n
+
+        for table, column in SEQUENCES:
+            cur.execute("SELECT setval(pg_get_serial_sequence(%%s, %%s), "
+                        "GREATEST((SELECT MAX(%s) FROM %s), 1))" % (column, table),
+                        (table.lower(), column))
+        conn.commit()
+    finally:
+        conn.rollback()
+        # Re-enable and recount in one transaction: the ALTERs lock the
+        # tables, so no write slips in between uncounted.
+        counter_triggers(cur, enable=True)
+        stats.reconcile(cur)
+        conn.commit()
+
+    # ANALYZE can't run inside a transaction block.
+    conn.autocommit = True
+    cur.execute("ANALYZE")
+    cur.close()
+    conn.close()
+    return counts, time.time() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic portal dataset.")
+    parser.add_argument("--scale", type=parse_scale, default=SCALES["1k"],
+                        help="students to create: %s or a number" % ", ".join(SCALES))
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=None,
+                        help="loader processes (default: one per core)")
+    parser.add_argument("--reset", action="store_true",
+                        help="delete all existing portal data first (admins are kept)")
+    args = parser.parse_args()
+
+    counts, elapsed = generate(args.scale, args.seed, args.workers, args.reset)
+    total = sum(counts.values())
+    for table, n in sorted(counts.items()):
+        print("%-24s %10d" % (table, n))
+    print("%d rows in %.1fs (%.0f rows/s). Accounts log in with password %r."
+          % (total, elapsed, total / elapsed, DEFAULT_PASSWORD))
+
+
+if __name__ == "__main__":
+    main()
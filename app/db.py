@@ -1,225 +1,390 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter
 import psycopg2
 from psycopg2 import sql
-from config import DB_NAME, DB_USER, DB_PASS, DB_HOST, DB_PORT
+from psycopg2 import extensions
+from flask import g, has_app_context, request
+from config import (DB_NAME, DB_USER, DB_PASS, DB_HOST, DB_PORT,
+                    DB_POOL_MIN, DB_POOL_MAX, DB_POOL_TIMEOUT,
+                    DB_POOL_HEALTHCHECK_INTERVAL, DB_INSTRUMENT, DB_REPEAT_WARN)
 
-def get_conn():
+query_log = logging.getLogger("app.db")
+
+
+class PoolTimeout(psycopg2.OperationalError):
+    pass
+
+
+def _connect(**kwargs):
     return psycopg2.connect(
         dbname=DB_NAME,
         user=DB_USER,
         password=DB_PASS,
         host=DB_HOST,
-        port=DB_PORT
+        port=DB_PORT,
+        **kwargs
     )
 
-def init_db():
-    schema = """
-    CREATE TABLE IF NOT EXISTS University (
-        university_id SERIAL PRIMARY KEY,
-        name VARCHAR(150) NOT NULL,
-        country VARCHAR(100) NOT NULL,
-        ranking INT,
-        contact_email VARCHAR(120) UNIQUE
-    );
-
-    CREATE TABLE IF NOT EXISTS Student (
-        student_id SERIAL PRIMARY KEY,
-        name VARCHAR(120) NOT NULL,
-        email VARCHAR(120) UNIQUE NOT NULL,
-        password VARCHAR(225) NOT NULL,
-        dob DATE,
-        department VARCHAR(100),
-        cgpa NUMERIC(3,2),
-        university_id INT,
-        FOREIGN KEY (university_id)
-            REFERENCES University(university_id)
-            ON DELETE SET NULL
-    );
-
-    CREATE TABLE IF NOT EXISTS Mentor (
-        mentor_id SERIAL PRIMARY KEY,
-        name VARCHAR(120) NOT NULL,
-        email VARCHAR(120) UNIQUE NOT NULL,
-        password VARCHAR(225) NOT NULL,
-        department VARCHAR(100),
-        university_id INT,
-        FOREIGN KEY (university_id)
-            REFERENCES University(university_id)
-            ON DELETE SET NULL
-    );
-
-    CREATE TABLE IF NOT EXISTS Program (
-        program_id SERIAL PRIMARY KEY,
-        title VARCHAR(200) NOT NULL,
-        description TEXT,
-        program_type VARCHAR(50),
-        duration INT,
-        eligibility TEXT,
-        start_date DATE,
-        end_date DATE,
-        university_id INT,
-        mentor_id INT,
-        FOREIGN KEY (university_id)
-            REFERENCES University(university_id)
-            ON DELETE CASCADE,
-        FOREIGN KEY (mentor_id)
-            REFERENCES Mentor(mentor_id)
-            ON DELETE SET NULL
-    );
-
-    CREATE TABLE IF NOT EXISTS Application (
-        application_id SERIAL PRIMARY KEY,
-        student_id INT NOT NULL,
-        program_id INT NOT NULL,
-        status VARCHAR(30) DEFAULT 'Pending',
-        applied_date TIMESTAMP DEFAULT NOW(),
-        scholarship_awarded BOOLEAN DEFAULT FALSE,
-        FOREIGN KEY (student_id)
-            REFERENCES Student(student_id)
-            ON DELETE CASCADE,
-        FOREIGN KEY (program_id)
-            REFERENCES Program(program_id)
-            ON DELETE CASCADE
-    );
-
-    CREATE TABLE IF NOT EXISTS Scholarship (
-        scholarship_id SERIAL PRIMARY KEY,
-        program_id INT NOT NULL,
-        name VARCHAR(150) NOT NULL,
-        amount NUMERIC(10,2),
-        eligibility_criteria TEXT,
-        FOREIGN KEY (program_id)
-            REFERENCES Program(program_id)
-            ON DELETE CASCADE
-    );
-
-    CREATE TABLE IF NOT EXISTS VisaPermit (
-        visa_id SERIAL PRIMARY KEY,
-        student_id INT NOT NULL,
-        country VARCHAR(100),
-        application_status VARCHAR(50) DEFAULT 'Pending',
-        issued_date DATE,
-        expiry_date DATE,
-        FOREIGN KEY (student_id)
-            REFERENCES Student(student_id)
-            ON DELETE CASCADE
-    );
-
-    CREATE TABLE IF NOT EXISTS Housing (
-        housing_id SERIAL PRIMARY KEY,
-        university_id INT NOT NULL,
-        location VARCHAR(150),
-        room_type VARCHAR(50),
-        rent NUMERIC(10,2),
-        availability BOOLEAN DEFAULT TRUE,
-        FOREIGN KEY (university_id)
-            REFERENCES University(university_id)
-            ON DELETE CASCADE
-    );
-
-    CREATE TABLE IF NOT EXISTS HousingAssignment (
-        assign_id SERIAL PRIMARY KEY,
-        student_id INT NOT NULL,
-        housing_id INT NOT NULL,
-        allotment_date DATE DEFAULT CURRENT_DATE,
-        checkout_date DATE,
-        FOREIGN KEY (student_id)
-            REFERENCES Student(student_id)
-            ON DELETE CASCADE,
-        FOREIGN KEY (housing_id)
-            REFERENCES Housing(housing_id)
-            ON DELETE CASCADE
-    );
-
-    CREATE TABLE IF NOT EXISTS HousingRequest (
-        request_id SERIAL PRIMARY KEY,
-        student_id INT NOT NULL,
-        request_type VARCHAR(20) NOT NULL, -- 'apply' OR 'vacate'
-        status VARCHAR(20) DEFAULT 'Pending',
-        request_date TIMESTAMP DEFAULT NOW(),
-        FOREIGN KEY (student_id)
-            REFERENCES Student(student_id)
-            ON DELETE CASCADE
-    );
-
-
-    CREATE TABLE IF NOT EXISTS Admin (
-        admin_id SERIAL PRIMARY KEY,
-        name VARCHAR(80) NOT NULL,
-        email VARCHAR(120) UNIQUE NOT NULL,
-        password VARCHAR(225) NOT NULL
-    );
-
-    -- Scholarship Applications (per program)
-    CREATE TABLE IF NOT EXISTS ScholarshipApplication (
-        sch_app_id SERIAL PRIMARY KEY,
-        application_id INT NOT NULL,
-        scholarship_id INT NOT NULL,
-        status VARCHAR(30) DEFAULT 'Pending',
-        UNIQUE (application_id, scholarship_id),
-        FOREIGN KEY (application_id)
-            REFERENCES Application(application_id)
-            ON DELETE CASCADE,
-        FOREIGN KEY (scholarship_id)
-            REFERENCES Scholarship(scholarship_id)
-            ON DELETE CASCADE
-    );
-
-    CREATE TABLE IF NOT EXISTS RequiredDocuments (
-        req_id SERIAL PRIMARY KEY,
-        program_id INT NOT NULL,
-        document_name VARCHAR(255) NOT NULL,
-        FOREIGN KEY (program_id)
-            REFERENCES Program(program_id)
-            ON DELETE CASCADE
-    );
-
-    CREATE TABLE IF NOT EXISTS ApplicationDocument (
-        app_doc_id SERIAL PRIMARY KEY,
-        application_id INT NOT NULL,
-        req_id INT NOT NULL,
-        file_name VARCHAR(255),
-        status VARCHAR(20) DEFAULT 'Pending',
-
-        CONSTRAINT unique_app_req UNIQUE (application_id, req_id),
-
-        FOREIGN KEY (application_id)
-            REFERENCES Application(application_id)
-            ON DELETE CASCADE,
-
-        FOREIGN KEY (req_id)
-            REFERENCES RequiredDocuments(req_id)
-            ON DELETE CASCADE
-    );
-
-    -- Seed data
-    INSERT INTO University (name, country, ranking, contact_email)
-    VALUES ('Amrita Vishwa Vidyapeetham', 'India', 5, 'info@amrita.edu')
-    ON CONFLICT DO NOTHING;
-
-    INSERT INTO Admin (name, email, password)
-    VALUES (
-        'System Admin',
-        'admin@portal.com',
-        'scrypt:32768:8:1$1kmyWq0yU0CHjzv0$d5750057ce306b78563c9374b181b4326e63c9cbb5eec657b7491ceda9dc79fbb1c848e9d48984d3cecf8c12d43e5463c5bd5d0ad8c886029fcf0b67b8ced1b0'
-    )
-    ON CONFLICT DO NOTHING;
-
-    INSERT INTO Mentor (name, email, password, department, university_id)
-    VALUES (
-        'Dr. Arvind Reddy',
-        'arvindr@university.com',
-        'scrypt:32768:8:1$ZJ7qb1Iyz8SU9uds$76f8db6c58ce7ba801ea260de6894d026daa59b8582311aeb9dcc5fc12d52a1c020980e21ea8c903d82b61bac6b0d0c06dce41a226e3ee7f83a209c100d38aff',
-        'Computer Science',
-        1
-    )
-    ON CONFLICT DO NOTHING;
-    """
 
+class ConnectionPool:
+    # Bounded pool: keeps at least minconn idle connections open, never
+    # has more than maxconn checked out + idle, and blocks up to `timeout`
+    # seconds waiting for one to come back.
+
+    def __init__(self, minconn, maxconn, timeout, healthcheck_interval):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.healthcheck_interval = healthcheck_interval
+        self._cond = threading.Condition()
+        self._idle = []        # [(conn, last_used)]
+        self._size = 0
+        self._pid = os.getpid()
+        for _ in range(minconn):
+            self._idle.append((_connect(), time.monotonic()))
+            self._size += 1
+
+    def _healthy(self, conn, last_used):
+        if conn.closed:
+            return False
+        if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+            return False
+        if time.monotonic() - last_used < self.healthcheck_interval:
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1")
+            cur.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self):
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            while True:
+                while self._idle:
+                    conn, last_used = self._idle.pop()
+                    if self._healthy(conn, last_used):
+                        return conn
+                    self._discard(conn)
+
+                if self._size < self.maxconn:
+                    self._size += 1
+                    break
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeout(
+                        "no database connection available within %ss" % self.timeout)
+                self._cond.wait(remaining)
+
+        try:
+            return _connect()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+    def putconn(self, conn):
+        if not conn.closed:
+            try:
+                if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                conn.close()
+
+        with self._cond:
+            if conn.closed:
+                self._size -= 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def _discard(self, conn):
+        self._size -= 1
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def closeall(self):
+        with self._cond:
+            for conn, _ in self._idle:
+                conn.close()
+            self._size -= len(self._idle)
+            self._idle = []
+
+
+_pool = None
+_pool_lock = threading.Lock()
+# Connections inherited across fork() belong to the parent's sockets; closing
+# them in the child would send Terminate on the parent's session, so they are
+# parked here and never touched again.
+_inherited = []
+
+
+def _reset_after_fork():
+    global _pool, _pool_lock
+    if _pool is not None:
+        _inherited.append(_pool)
+    _pool = None
+    _pool_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_pool():
+    global _pool
+    if _pool is None or _pool._pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool._pid != os.getpid():
+                if _pool is not None:
+                    _inherited.append(_pool)
+                _pool = ConnectionPool(DB_POOL_MIN, DB_POOL_MAX,
+                                       DB_POOL_TIMEOUT,
+                                       DB_POOL_HEALTHCHECK_INTERVAL)
+    return _pool
+
+
+class PooledConnection:
+    # Thin proxy over a pooled psycopg2 connection. Handlers keep calling
+    # conn.close() as before; inside a request that is a no-op and the
+    # connection goes back to the pool in teardown, outside a request it is
+    # returned immediately.
+
+    def __init__(self, raw, request_scoped):
+        self._raw = raw
+        self._request_scoped = request_scoped
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def cursor(self, *args, **kwargs):
+        # Request cursors report to the request's QueryStats. Named
+        # (server-side) cursors are left alone: they stream exports after
+        # the response has started.
+        stats = g.get("_db_stats") if self._request_scoped else None
+        if stats is None or args or kwargs.get("name"):
+            return self._raw.cursor(*args, **kwargs)
+        factory = kwargs.pop("cursor_factory", None) or self._raw.cursor_factory \
+            or extensions.cursor
+        cur = self._raw.cursor(cursor_factory=_instrumented(factory), **kwargs)
+        cur.query_stats = stats
+        return cur
+
+    def close(self):
+        if self._request_scoped or self._raw is None:
+            return
+        get_pool().putconn(self._raw)
+        self._raw = None
+
+    def release(self):
+        if self._raw is not None:
+            get_pool().putconn(self._raw)
+            self._raw = None
+
+
+def get_conn():
+    if not has_app_context():
+        return PooledConnection(get_pool().getconn(), request_scoped=False)
+
+    conn = g.get("_db_conn")
+    if conn is None or conn._raw is None:
+        conn = PooledConnection(get_pool().getconn(), request_scoped=True)
+        g._db_conn = conn
+    return conn
+
+
+def release_conn(exc=None):
+    conn = g.pop("_db_conn", None)
+    if conn is not None:
+        conn.release()
+
+
+# Per-request query instrumentation. Statements are grouped by their
+# normalized text (literals and IN/VALUES lists folded), so one query run in a
+# loop shows up as a single statement with a high count.
+
+_LITERALS = [
+    (re.compile(r"'(?:[^']|'')*'"), "?"),
+    (re.compile(r"%(?:\(\w+\))?s"), "?"),
+    (re.compile(r"\b\d+(?:\.\d+)?\b"), "?"),
+    (re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)(?:\s*,\s*\(\s*\?(?:\s*,\s*\?)*\s*\))*"), "(...)"),
+    (re.compile(r"\s+"), " "),
+]
+
+
+def normalize(query):
+    if isinstance(query, bytes):
+        query = query.decode("utf-8", "replace")
+    for pattern, replacement in _LITERALS:
+        query = pattern.sub(replacement, query)
+    return query.strip()
+
+
+class QueryStats:
+    def __init__(self):
+        self.statements = 0
+        self.seconds = 0.0
+        self.rows = 0
+        self.slowest = (0.0, None)
+        self.counts = Counter()
+
+    def record(self, query, seconds, rows):
+        statement = normalize(query)
+        self.statements += 1
+        self.seconds += seconds
+        self.rows += max(rows, 0)
+        self.counts[statement] += 1
+        if seconds >= self.slowest[0]:
+            self.slowest = (seconds, statement)
+
+
+class _InstrumentedCursor:
+    # Mixed in front of the cursor class the caller asked for. Client-side
+    # cursors fetch every row during execute(), so its duration is the
+    # statement's full database time and rowcount the rows fetched.
+    query_stats = None
+
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            self.query_stats.record(query, time.perf_counter() - started,
+                                    self.rowcount if self.description is not None else 0)
+
+    def executemany(self, query, vars_list):
+        started = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            self.query_stats.record(query, time.perf_counter() - started, 0)
+
+
+_instrumented_classes = {}
+
+
+def _instrumented(factory):
+    cls = _instrumented_classes.get(factory)
+    if cls is None:
+        cls = type("Instrumented" + factory.__name__, (_InstrumentedCursor, factory), {})
+        _instrumented_classes[factory] = cls
+    return cls
+
+
+def start_query_stats():
+    g._db_stats = QueryStats()
+
+
+def report_query_stats(response):
+    stats = g.pop("_db_stats", None)
+    if stats is None:
+        return response
+
+    slowest_seconds, slowest = stats.slowest
+    response.headers.add("Server-Timing", 'db;dur=%.2f;desc="%d statements, %d rows", '
+                         "db-slowest;dur=%.2f"
+                         % (stats.seconds * 1000, stats.statements, stats.rows,
+                            slowest_seconds * 1000))
+    query_log.info(json.dumps({
+        "event": "db_request",
+        "method": request.method,
+        "path": request.path,
+        "endpoint": request.endpoint,
+        "status": response.status_code,
+        "statements": stats.statements,
+        "db_ms": round(stats.seconds * 1000, 3),
+        "rows": stats.rows,
+        "slowest_ms": round(slowest_seconds * 1000, 3),
+        "slowest": slowest,
+    }))
+    for statement, count in stats.counts.items():
+        if count > DB_REPEAT_WARN:
+            query_log.warning(json.dumps({
+                "event": "db_repeated_statement",
+                "path": request.path,
+                "endpoint": request.endpoint,
+                "count": count,
+                "statement": statement,
+            }))
+    return response
+
+
+def init_app(app):
+    app.teardown_appcontext(release_conn)
+    if DB_INSTRUMENT:
+        if not query_log.handlers:
+            query_log.addHandler(logging.StreamHandler())
+            query_log.setLevel(logging.INFO)
+        app.before_request(start_query_stats)
+        app.after_request(report_query_stats)
+
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(__file__), "migrations")
+
+# Arbitrary key for pg_advisory_xact_lock so two processes starting at the
+# same time don't apply the same migration twice.
+MIGRATION_LOCK_ID = 72_410_001
+
+
+def migration_files():
+    migrations = []
+    for fname in sorted(os.listdir(MIGRATIONS_DIR)):
+        if not fname.endswith(".sql"):
+            continue
+        version = int(fname.split("_", 1)[0])
+        migrations.append((version, fname))
+    return migrations
+
+
+def migrate():
     conn = get_conn()
     cur = conn.cursor()
-    cur.execute(schema)
+
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INT PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            applied_at TIMESTAMP DEFAULT NOW()
+        )
+    """)
     conn.commit()
+
+    applied = []
+    for version, fname in migration_files():
+        cur.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_ID,))
+        cur.execute("SELECT 1 FROM schema_version WHERE version=%s", (version,))
+        if cur.fetchone():
+            conn.rollback()
+            continue
+
+        with open(os.path.join(MIGRATIONS_DIR, fname)) as f:
+            cur.execute(f.read())
+        cur.execute("""
+            INSERT INTO schema_version (version, name)
+            VALUES (%s, %s)
+        """, (version, fname))
+        conn.commit()
+        applied.append(fname)
+
     cur.close()
     conn.close()
-    print("Database schema initialized successfully.")
+    return applied
+
 
+def init_db():
+    applied = migrate()
+    for fname in applied:
+        print("Applied migration " + fname)
+    print("Database schema initialized successfully.")
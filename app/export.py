@@ -0,0 +1,104 @@
+import csv
+import io
+import json
+from app.db import get_pool
+
+EXPORT_BATCH_SIZE = 2000
+
+EXPORTS = {
+    "applications": """
+        SELECT a.application_id, s.student_id, s.name AS student_name, s.email,
+               p.program_id, p.title AS program_title, u.name AS university,
+               a.status, a.applied_date, a.scholarship_awarded
+        FROM Application a
+        JOIN Student s ON a.student_id = s.student_id
+        JOIN Program p ON a.program_id = p.program_id
+        LEFT JOIN University u ON p.university_id = u.university_id
+        ORDER BY a.application_id
+    """,
+    "visas": """
+        SELECT v.visa_id, v.student_id, s.name AS student_name, v.country,
+               v.application_status, v.issued_date, v.expiry_date
+        FROM VisaPermit v
+        JOIN Student s ON v.student_id = s.student_id
+        ORDER BY v.visa_id
+    """,
+    "housing_requests": """
+        SELECT hr.request_id, hr.student_id, s.name AS student_name,
+               hr.request_type, hr.status, hr.request_date
+        FROM HousingRequest hr
+        JOIN Student s ON hr.student_id = s.student_id
+        ORDER BY hr.request_date, hr.request_id
+    """,
+    "scholarship_applications": """
+        SELECT sa.sch_app_id, sa.application_id, s.student_id,
+               s.name AS student_name, p.title AS program_title,
+               sc.name AS scholarship_name, sc.amount, sa.status
+        FROM ScholarshipApplication sa
+        JOIN Application a ON sa.application_id = a.application_id
+        JOIN Student s ON a.student_id = s.student_id
+        JOIN Program p ON a.program_id = p.program_id
+        JOIN Scholarship sc ON sa.scholarship_id = sc.scholarship_id
+        ORDER BY sa.sch_app_id
+    """,
+}
+
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "jsonl": "application/x-ndjson",
+}
+
+
+def _batches(dataset):
+    # Uses its own pooled connection rather than the request's: the response
+    # body is produced after the view returns, and a long dump should not
+    # pin the connection the rest of the request machinery expects to reuse.
+    pool = get_pool()
+    conn = pool.getconn()
+    try:
+        # Named cursor = server-side cursor: Postgres holds the result set and
+        # we pull EXPORT_BATCH_SIZE rows at a time, so memory stays flat.
+        cur = conn.cursor(name="export_" + dataset)
+        cur.execute(EXPORTS[dataset])
+
+        rows = cur.fetchmany(EXPORT_BATCH_SIZE)
+        columns = [col[0] for col in cur.description]
+        yield columns, rows
+        while rows:
+            rows = cur.fetchmany(EXPORT_BATCH_SIZE)
+            if rows:
+                yield columns, rows
+
+        cur.close()
+        conn.rollback()
+    finally:
+        pool.putconn(conn)
+
+
+def stream_csv(dataset):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    header_sent = False
+
+    for columns, rows in _batches(dataset):
+        if not header_sent:
+            writer.writerow(columns)
+            header_sent = True
+        writer.writerows(rows)
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+
+
+def stream_jsonl(dataset):
+    for columns, rows in _batches(dataset):
+        yield "".join(
+            json.dumps(dict(zip(columns, row)), default=str) + "\n"
+            for row in rows
+        )
+
+
+def stream_export(dataset, fmt):
+    if fmt == "csv":
+        return stream_csv(dataset)
+    return stream_jsonl(dataset)
@@ -0,0 +1,177 @@
+import argparse
+import logging
+import time
+import psycopg2.extras
+from app.db import get_conn
+from app import jobs
+from config import HOUSING_BATCH_SIZE
+
+log = logging.getLogger(__name__)
+
+# Room allocation for approved housing requests. Rooms are claimed with
+# FOR UPDATE SKIP LOCKED: two admins (or an admin and a queue drain) approving
+# at the same moment each lock a different free room instead of both reading
+# the same "available" row and assigning it twice.
+
+PENDING_QUERY = """
+    SELECT request_id, student_id, request_type, room_type
+    FROM HousingRequest
+    WHERE status = 'Pending'
+    ORDER BY request_date, request_id
+    LIMIT %s
+    FOR UPDATE SKIP LOCKED
+"""
+
+
+def claim_room(cur, student_id, room_type=None):
+    # Lowest-numbered free room at the student's university (and of the
+    # requested type, if any). The row stays locked until the caller commits.
+    type_cond = "AND h.room_type = %s" if room_type else ""
+    cur.execute("""
+        SELECT h.housing_id
+        FROM Student s
+        JOIN Housing h ON h.university_id = s.university_id
+        WHERE s.student_id = %s
+          AND h.availability = TRUE
+          {}
+        ORDER BY h.housing_id
+        LIMIT 1
+        FOR UPDATE OF h SKIP LOCKED
+    """.format(type_cond), (student_id, room_type) if room_type else (student_id,))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def vacate(cur, student_id):
+    # Frees the student's current assignment(s), not their oldest one.
+    cur.execute("""
+        WITH closed AS (
+            UPDATE HousingAssignment
+            SET checkout_date = CURRENT_DATE
+            WHERE student_id = %s AND checkout_date IS NULL
+            RETURNING housing_id
+        )
+        UPDATE Housing SET availability = TRUE
+        WHERE housing_id IN (SELECT housing_id FROM closed)
+    """, (student_id,))
+
+
+def lock_students(cur, student_ids):
+    # allocate()'s "already has a room" check only holds while the student
+    # is locked against other allocations. NO KEY UPDATE doesn't block rows
+    # that merely reference the student. Batches lock all their students up
+    # front, in id order, so two batches can't deadlock on each other.
+    cur.execute("""
+        SELECT student_id FROM Student
+        WHERE student_id = ANY(%s)
+        ORDER BY student_id
+        FOR NO KEY UPDATE
+    """, (sorted(set(student_ids)),))
+
+
+def allocate(cur, req):
+    # Carries out one approved request and returns the status it ends up
+    # with. An "apply" for a student who already has a room, or for which no
+    # matching room is free, is rejected.
+    student_id = req["student_id"]
+    status = "Approved"
+    lock_students(cur, [student_id])
+
+    if req["request_type"] == "apply":
+        cur.execute("""
+            SELECT 1 FROM HousingAssignment
+            WHERE student_id = %s AND checkout_date IS NULL
+        """, (student_id,))
+        housing_id = None if cur.fetchone() else claim_room(cur, student_id, req["room_type"])
+
+        if housing_id is None:
+            status = "Rejected"
+        else:
+            cur.execute("""
+                INSERT INTO HousingAssignment (student_id, housing_id)
+                VALUES (%s, %s)
+            """, (student_id, housing_id))
+            cur.execute("UPDATE Housing SET availability=FALSE WHERE housing_id=%s", (housing_id,))
+    else:
+        vacate(cur, student_id)
+
+    cur.execute("UPDATE HousingRequest SET status=%s WHERE request_id=%s",
+                (status, req["request_id"]))
+    return status
+
+
+def drain_batch(cur, size):
+    # Approves up to `size` pending requests, oldest first, in the caller's
+    # transaction. Requests another session holds locked are skipped, so
+    # several drains (or a drain and admins working the list) can run side
+    # by side.
+    cur.execute(PENDING_QUERY, (size,))
+    reqs = cur.fetchall()
+    lock_students(cur, [req["student_id"] for req in reqs])
+    return [(req["request_id"], allocate(cur, req)) for req in reqs]
+
+
+def drain(batch_size=HOUSING_BATCH_SIZE, limit=None):
+    # Works through the whole queue, one transaction per batch.
+    conn = get_conn()
+    cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+
+    results = []
+    started = time.time()
+    while limit is None or len(results) < limit:
+        size = batch_size if limit is None else min(batch_size, limit - len(results))
+        decided = drain_batch(cur, size)
+        if not decided:
+            break
+        conn.commit()
+        results.extend(decided)
+
+    elapsed = time.time() - started
+    cur.close()
+    conn.close()
+
+    return results, summarize(results, elapsed)
+
+
+def summarize(results, elapsed):
+    return {
+        "processed": len(results),
+        "approved": sum(1 for _, status in results if status == "Approved"),
+        "rejected": sum(1 for _, status in results if status == "Rejected"),
+        "seconds": round(elapsed, 3),
+        "per_second": round(len(results) / elapsed, 1) if elapsed else None,
+    }
+
+
+@jobs.handler("housing.drain")
+def drain_job(cur, payload):
+    # One batch per job, committed with the job itself; while requests remain
+    # the job queues its own continuation in the same transaction.
+    batch_size = payload.get("batch_size", HOUSING_BATCH_SIZE)
+    limit = payload.get("limit")
+    started = time.time()
+    decided = drain_batch(cur, batch_size if limit is None else min(batch_size, limit))
+    log.info("housing.drain: %(processed)d requests in %(seconds).2fs, %(per_second)s/s.",
+             summarize(decided, time.time() - started))
+
+    remaining = None if limit is None else limit - len(decided)
+    if len(decided) == batch_size and remaining != 0:
+        jobs.enqueue(cur, "housing.drain", {"batch_size": batch_size, "limit": remaining})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Housing request queue.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    drain_parser = sub.add_parser("drain", help="approve every pending request, oldest first")
+    drain_parser.add_argument("--batch-size", type=int, default=HOUSING_BATCH_SIZE)
+    drain_parser.add_argument("--limit", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.command == "drain":
+        _, stats = drain(args.batch_size, args.limit)
+        print("Processed %(processed)d requests (%(approved)d approved, "
+              "%(rejected)d rejected) in %(seconds).2fs, %(per_second)s/s." % stats)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,471 @@
+import argparse
+import csv
+import functools
+import io
+import multiprocessing
+import os
+import re
+import tempfile
+import uuid
+import psycopg2.extras
+from datetime import date
+from decimal import Decimal, InvalidOperation
+from werkzeug.security import generate_password_hash
+from app.db import get_conn
+from app import jobs
+from config import (PASSWORD_HASH_METHOD, IMPORT_DIR, IMPORT_HASH_WORKERS,
+                    IMPORT_ERROR_MAX)
+
+# Bulk onboarding from CSV. An import runs in three steps:
+#   1. one streaming pass over the file validates each row and writes the good
+#      ones to a temp file in COPY format; bad rows (including undecodable or
+#      malformed CSV lines) go to the error report
+#   2. in the caller's transaction the rows are COPYed into a staging table and
+#      checked in bulk against the database (duplicates, existing accounts,
+#      references)
+#   3. initial passwords of the rows that passed are hashed across
+#      IMPORT_HASH_WORKERS processes, and everything is merged into the real
+#      table with a single INSERT ... SELECT
+# The report lists every rejected row by its line number in the file.
+
+
+def _text(max_len):
+    def convert(value):
+        if len(value) > max_len:
+            raise ValueError("longer than %d characters" % max_len)
+        return value
+    return convert
+
+
+def _email(value):
+    value = value.lower()
+    if "@" not in value or len(value) > 120:
+        raise ValueError("not a valid email address")
+    return value
+
+
+def _int(value):
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError("not a whole number")
+
+
+def _date(value):
+    try:
+        return date.fromisoformat(value).isoformat()
+    except ValueError:
+        raise ValueError("not a YYYY-MM-DD date")
+
+
+def _cgpa(value):
+    try:
+        cgpa = Decimal(value)
+    except InvalidOperation:
+        raise ValueError("not a number")
+    if not 0 <= cgpa < 10:
+        raise ValueError("must be between 0 and 10")
+    return str(cgpa)
+
+
+_password = _text(1000)
+
+# Passwords hashed per worker between two progress() calls; at up to ~0.2s
+# per scrypt hash that is well inside JOB_VISIBILITY_TIMEOUT.
+HASH_STEP = 64
+
+# Per kind: CSV columns as (name, staging SQL type, converter, required); the
+# bulk checks as (error message, condition on staging row s), applied in order
+# so each row reports its first problem; and the merge statement. A "password"
+# column is hashed and staged separately in import_password.
+IMPORTS = {
+    "universities": {
+        "columns": [
+            ("name", "VARCHAR(150)", _text(150), True),
+            ("country", "VARCHAR(100)", _text(100), True),
+            ("ranking", "INT", _int, False),
+            ("contact_email", "VARCHAR(120)", _email, False),
+        ],
+        "checks": [
+            ("contact_email appears earlier in the file", """
+                s.contact_email IS NOT NULL AND EXISTS (
+                    SELECT 1 FROM import_stage o
+                    WHERE o.contact_email = s.contact_email AND o.line < s.line)
+            """),
+            ("a university with this contact_email already exists", """
+                EXISTS (SELECT 1 FROM University u WHERE u.contact_email = s.contact_email)
+            """),
+        ],
+        "merge": """
+            INSERT INTO University (name, country, ranking, contact_email)
+            SELECT name, country, ranking, contact_email
+            FROM import_stage WHERE error IS NULL ORDER BY line
+        """,
+    },
+    "mentors": {
+        "columns": [
+            ("name", "VARCHAR(120)", _text(120), True),
+            ("email", "VARCHAR(120)", _email, True),
+            ("password", None, _password, True),
+            ("department", "VARCHAR(100)", _text(100), False),
+            ("university_id", "INT", _int, False),
+        ],
+        "checks": [
+            ("email appears earlier in the file", """
+                EXISTS (SELECT 1 FROM import_stage o
+                        WHERE o.email = s.email AND o.line < s.line)
+            """),
+            ("an account with this email already exists", """
+                EXISTS (SELECT 1 FROM Account a WHERE lower(a.email) = s.email)
+            """),
+            ("university_id does not exist", """
+                s.university_id IS NOT NULL AND NOT EXISTS (
+                    SELECT 1 FROM University u WHERE u.university_id = s.university_id)
+            """),
+        ],
+        "merge": """
+            INSERT INTO Mentor (name, email, password, department, university_id)
+            SELECT s.name, s.email, p.password, s.department, s.university_id
+            FROM import_stage s
+            JOIN import_password p ON p.line = s.line
+            WHERE s.error IS NULL ORDER BY s.line
+        """,
+    },
+    "students": {
+        "columns": [
+            ("name", "VARCHAR(120)", _text(120), True),
+            ("email", "VARCHAR(120)", _email, True),
+            ("password", None, _password, True),
+            ("dob", "DATE", _date, False),
+            ("department", "VARCHAR(100)", _text(100), False),
+            ("cgpa", "NUMERIC(3,2)", _cgpa, False),
+            ("university_id", "INT", _int, False),
+        ],
+        "checks": [
+            ("email appears earlier in the file", """
+                EXISTS (SELECT 1 FROM import_stage o
+                        WHERE o.email = s.email AND o.line < s.line)
+            """),
+            ("an account with this email already exists", """
+                EXISTS (SELECT 1 FROM Account a WHERE lower(a.email) = s.email)
+            """),
+            ("university_id does not exist", """
+                s.university_id IS NOT NULL AND NOT EXISTS (
+                    SELECT 1 FROM University u WHERE u.university_id = s.university_id)
+            """),
+        ],
+        "merge": """
+            INSERT INTO Student (name, email, password, dob, department, cgpa, university_id)
+            SELECT s.name, s.email, p.password, s.dob, s.department, s.cgpa, s.university_id
+            FROM import_stage s
+            JOIN import_password p ON p.line = s.line
+            WHERE s.error IS NULL ORDER BY s.line
+        """,
+    },
+    "programs": {
+        "columns": [
+            ("title", "VARCHAR(200)", _text(200), True),
+            ("university_id", "INT", _int, True),
+            ("mentor_email", "VARCHAR(120)", _email, False),
+            ("program_type", "VARCHAR(50)", _text(50), False),
+            ("description", "TEXT", str, False),
+            ("eligibility", "TEXT", str, False),
+            ("duration", "INT", _int, False),
+            ("start_date", "DATE", _date, False),
+            ("end_date", "DATE", _date, False),
+        ],
+        "checks": [
+            ("university_id does not exist", """
+                NOT EXISTS (SELECT 1 FROM University u WHERE u.university_id = s.university_id)
+            """),
+            ("no mentor with this mentor_email", """
+                s.mentor_email IS NOT NULL AND NOT EXISTS (
+                    SELECT 1 FROM Account a
+                    WHERE lower(a.email) = s.mentor_email AND a.role = 'mentor')
+            """),
+            ("end_date is before start_date", """
+                s.end_date < s.start_date
+            """),
+        ],
+        "merge": """
+            INSERT INTO Program (title, description, program_type, duration, eligibility,
+                                 start_date, end_date, university_id, mentor_id)
+            SELECT s.title, s.description, s.program_type, s.duration, s.eligibility,
+                   s.start_date, s.end_date, s.university_id, a.principal_id
+            FROM import_stage s
+            LEFT JOIN Account a ON lower(a.email) = s.mentor_email AND a.role = 'mentor'
+            WHERE s.error IS NULL ORDER BY s.line
+        """,
+    },
+}
+
+
+class ImportReport:
+    def __init__(self, kind):
+        self.kind = kind
+        self.total_rows = 0
+        self.imported_rows = 0
+        self.error_count = 0
+        self.errors = []
+
+    def error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < IMPORT_ERROR_MAX:
+            self.errors.append({"line": line, "error": message})
+
+    def as_dict(self):
+        return {
+            "kind": self.kind,
+            "total_rows": self.total_rows,
+            "imported_rows": self.imported_rows,
+            "error_count": self.error_count,
+            "errors": sorted(self.errors, key=lambda e: e["line"]),
+        }
+
+
+# Bytes that aren't valid UTF-8 come through open(errors="surrogateescape")
+# as lone surrogates; NUL is valid UTF-8 but PostgreSQL text can't hold it.
+_UNDECODABLE = re.compile("[\x00\udc80-\udcff]")
+
+
+def validate(kind, stream, out, report):
+    # Streaming pass: stream is the CSV as text (opened with
+    # errors="surrogateescape"), out receives the good rows as COPY csv (line
+    # number first, password left out). Returns the plaintext passwords as
+    # [(line, password)].
+    columns = IMPORTS[kind]["columns"]
+    reader = csv.DictReader(stream)
+    try:
+        fieldnames = reader.fieldnames or ()
+    except csv.Error as e:
+        report.error(1, "header is not valid CSV: %s" % e)
+        return []
+    header = {name.strip().lower() for name in fieldnames}
+    missing = [name for name, _, _, required in columns if required and name not in header]
+    if missing:
+        report.error(1, "missing column(s): " + ", ".join(missing))
+        return []
+
+    writer = csv.writer(out)
+    passwords = []
+    while True:
+        try:
+            raw = next(reader)
+        except StopIteration:
+            break
+        except csv.Error as e:
+            report.total_rows += 1
+            report.error(reader.line_num, "not valid CSV: %s" % e)
+            continue
+        report.total_rows += 1
+        row = {(k or "").strip().lower(): v.strip() for k, v in raw.items()
+               if isinstance(v, str)}
+        if any(_UNDECODABLE.search(v) for v in row.values()):
+            report.error(reader.line_num, "not valid UTF-8 text")
+            continue
+        values = []
+        password = None
+        problem = None
+        for name, _, convert, required in columns:
+            value = row.get(name, "")
+            if not value:
+                if required:
+                    problem = "%s is required" % name
+                    break
+                value = None
+            else:
+                try:
+                    value = convert(value)
+                except ValueError as e:
+                    problem = "%s: %s" % (name, e)
+                    break
+            if name == "password":
+                password = value
+            else:
+                values.append(value)
+
+        if problem:
+            report.error(reader.line_num, problem)
+            continue
+        writer.writerow([reader.line_num] + values)
+        if password is not None:
+            passwords.append((reader.line_num, password))
+    return passwords
+
+
+def hash_passwords(passwords, workers=IMPORT_HASH_WORKERS, progress=None):
+    # scrypt dominates the cost of a student or mentor import; spread it over
+    # every core. The web request pool (app.passwords) is left alone. Hashes
+    # go in steps of HASH_STEP per worker, calling progress() after each, so
+    # a job can keep its claim alive however large the file is.
+    if not passwords:
+        return []
+    fn = functools.partial(generate_password_hash, method=PASSWORD_HASH_METHOD)
+    plain = [pw for _, pw in passwords]
+    step = workers * HASH_STEP
+    hashed = []
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Pool(workers) as pool:
+        for start in range(0, len(plain), step):
+            hashed.extend(pool.map(fn, plain[start:start + step],
+                                   chunksize=max(1, HASH_STEP // 8)))
+            if progress is not None:
+                progress()
+    return [(line, h) for (line, _), h in zip(passwords, hashed)]
+
+
+def stage(cur, kind, staged):
+    # Loads and checks the validated rows; runs in the caller's transaction.
+    # Returns the lines that passed every check.
+    spec = IMPORTS[kind]
+    stage_cols = [(name, sql_type) for name, sql_type, _, _ in spec["columns"]
+                  if name != "password"]
+
+    cur.execute("CREATE TEMP TABLE import_stage (line INT PRIMARY KEY, %s, error TEXT) "
+                "ON COMMIT DROP" % ", ".join("%s %s" % c for c in stage_cols))
+    cur.copy_expert("COPY import_stage (line, %s) FROM STDIN WITH (FORMAT csv)"
+                    % ", ".join(name for name, _ in stage_cols), staged)
+
+    cur.execute("ANALYZE import_stage")
+    for message, cond in spec["checks"]:
+        cur.execute("UPDATE import_stage s SET error = %%s WHERE s.error IS NULL AND (%s)" % cond,
+                    (message,))
+
+    cur.execute("SELECT line FROM import_stage WHERE error IS NULL")
+    return {row[0] for row in cur.fetchall()}
+
+
+def merge(cur, kind, hashes, report):
+    # Same transaction as stage().
+    spec = IMPORTS[kind]
+    if hashes:
+        cur.execute("CREATE TEMP TABLE import_password (line INT PRIMARY KEY, password TEXT) "
+                    "ON COMMIT DROP")
+        buf = io.StringIO()
+        csv.writer(buf).writerows(hashes)
+        buf.seek(0)
+        cur.copy_expert("COPY import_password (line, password) FROM STDIN WITH (FORMAT csv)", buf)
+
+    cur.execute(spec["merge"])
+    report.imported_rows = cur.rowcount
+
+    cur.execute("SELECT line, error FROM import_stage WHERE error IS NOT NULL ORDER BY line")
+    for line, message in cur.fetchall():
+        report.error(line, message)
+
+
+def run_import(cur, kind, path):
+    # Run from the import.csv job, this can take far longer than one claim;
+    # jobs.heartbeat() between steps keeps the job ours (and is a no-op from
+    # the command line).
+    report = ImportReport(kind)
+    with tempfile.TemporaryFile("w+", newline="") as staged:
+        with open(path, newline="", encoding="utf-8-sig", errors="surrogateescape") as f:
+            passwords = validate(kind, f, staged, report)
+        jobs.heartbeat()
+        staged.seek(0)
+        passed = stage(cur, kind, staged)
+    jobs.heartbeat()
+    # Only rows that will actually be merged are worth an scrypt each.
+    hashes = hash_passwords([(line, pw) for line, pw in passwords if line in passed],
+                            progress=jobs.heartbeat)
+    merge(cur, kind, hashes, report)
+    return report
+
+
+def save_upload(file_storage):
+    os.makedirs(IMPORT_DIR, exist_ok=True)
+    path = os.path.join(IMPORT_DIR, uuid.uuid4().hex + ".csv")
+    file_storage.save(path)
+    return path
+
+
+def queue_import(cur, kind, filename, path):
+    cur.execute("""
+        INSERT INTO ImportBatch (kind, filename, path)
+        VALUES (%s, %s, %s)
+        RETURNING import_id
+    """, (kind, filename, path))
+    import_id = cur.fetchone()[0]
+    job_id = jobs.enqueue(cur, "import.csv", {"import_id": import_id}, max_attempts=3)
+    cur.execute("UPDATE ImportBatch SET job_id=%s WHERE import_id=%s", (job_id, import_id))
+    return import_id
+
+
+def _remover(path):
+    # The file holds plaintext passwords; it goes once the batch's outcome is
+    # committed, so a rolled-back attempt can still be retried.
+    def remove():
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    return remove
+
+
+@jobs.handler("import.csv")
+def import_job(cur, payload):
+    cur.execute("""
+        SELECT kind, path FROM ImportBatch
+        WHERE import_id=%s AND status='queued'
+        FOR UPDATE
+    """, (payload["import_id"],))
+    batch = cur.fetchone()
+    if batch is None:
+        return
+    kind, path = batch[0], batch[1]
+
+    report = run_import(cur, kind, path).as_dict()
+    cur.execute("""
+        UPDATE ImportBatch
+        SET status='done', total_rows=%s, imported_rows=%s, error_count=%s,
+            errors=%s, finished_at=NOW()
+        WHERE import_id=%s
+    """, (report["total_rows"], report["imported_rows"], report["error_count"],
+          psycopg2.extras.Json(report["errors"]), payload["import_id"]))
+    return _remover(path)
+
+
+@jobs.on_failure("import.csv")
+def import_failed(cur, payload, error):
+    # Last attempt failed: nothing was imported, but the batch shouldn't sit
+    # in 'queued' forever and the file shouldn't linger.
+    cur.execute("""
+        UPDATE ImportBatch
+        SET status='failed', errors=%s, finished_at=NOW()
+        WHERE import_id=%s AND status='queued'
+        RETURNING path
+    """, (psycopg2.extras.Json([{"line": 0, "error": error.strip().splitlines()[-1]}]),
+          payload["import_id"]))
+    batch = cur.fetchone()
+    if batch is not None:
+        return _remover(batch[0])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import from CSV.")
+    parser.add_argument("kind", choices=sorted(IMPORTS))
+    parser.add_argument("path")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="validate and check, then roll back")
+    args = parser.parse_args()
+
+    conn = get_conn()
+    cur = conn.cursor()
+    report = run_import(cur, args.kind, args.path)
+    if args.dry_run:
+        conn.rollback()
+    else:
+        conn.commit()
+    cur.close()
+    conn.close()
+
+    print("%s: %d rows, %d imported, %d rejected%s." % (
+        args.kind, report.total_rows, report.imported_rows, report.error_count,
+        " (dry run)" if args.dry_run else ""))
+    for e in report.errors:
+        print("  line %(line)d: %(error)s" % e)
+
+
+if __name__ == "__main__":
+    main()
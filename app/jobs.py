@@ -0,0 +1,333 @@
+import argparse
+import logging
+import os
+import random
+import select
+import signal
+import socket
+import time
+import traceback
+import psycopg2
+import psycopg2.extras
+from app.db import _connect, get_conn
+from config import (JOB_MAX_ATTEMPTS, JOB_VISIBILITY_TIMEOUT, JOB_BACKOFF_BASE,
+                    JOB_BACKOFF_MAX, JOB_POLL_INTERVAL)
+
+# Postgres-backed job queue. Request handlers enqueue() work in their own
+# transaction (so a job exists only if the request's changes committed) and
+# return; worker processes started by run_worker.py claim jobs with
+# FOR UPDATE SKIP LOCKED and run the registered handler.
+#
+# A handler gets the worker's cursor and the job payload, and must do all its
+# database work on that cursor without committing: its writes commit in the
+# same transaction that marks the job done, so database effects happen once
+# even if the job is retried; anything outside the database (files, mail)
+# must tolerate running again. A handler that needs something done only once
+# its writes are committed (deleting an input file, say) returns a callable;
+# it runs right after the commit.
+#
+# @jobs.on_failure(kind) registers a function called as (cur, payload, error)
+# when a job of that kind has failed for the last time, in the transaction
+# that marks it failed; it may also return a callable to run after commit.
+#
+# A claim lasts JOB_VISIBILITY_TIMEOUT. Handlers that can run longer call
+# jobs.heartbeat() between steps to push the deadline out; without it the job
+# is claimed again by another worker and eventually reaped as failed.
+
+CHANNEL = "job_queue"
+
+HANDLERS = {}
+FAILURE_HANDLERS = {}
+
+log = logging.getLogger(__name__)
+
+# (job_id, attempts) of the job this process is running, for heartbeat().
+_current = None
+_heartbeat_conn = None
+
+
+class ClaimLost(Exception):
+    pass
+
+
+def handler(kind):
+    def register(fn):
+        HANDLERS[kind] = fn
+        return fn
+    return register
+
+
+def on_failure(kind):
+    def register(fn):
+        FAILURE_HANDLERS[kind] = fn
+        return fn
+    return register
+
+
+def after_commit(fn):
+    if not callable(fn):
+        return
+    try:
+        fn()
+    except Exception:
+        log.exception("post-commit step failed")
+
+
+def failed(cur, kind, payload, error):
+    # Runs the kind's failure handler inside a savepoint, so a broken
+    # handler can't keep the job from being marked failed.
+    fn = FAILURE_HANDLERS.get(kind)
+    if fn is None:
+        return None
+    cur.execute("SAVEPOINT job_failed")
+    try:
+        after = fn(cur, payload, error)
+    except Exception:
+        cur.execute("ROLLBACK TO SAVEPOINT job_failed")
+        log.exception("failure handler for %s failed", kind)
+        return None
+    cur.execute("RELEASE SAVEPOINT job_failed")
+    return after
+
+
+def heartbeat(seconds=JOB_VISIBILITY_TIMEOUT):
+    # Extends the running job's claim by `seconds` from now. Goes through a
+    # separate autocommit connection: the job's own transaction stays open
+    # until the handler returns, and other workers must see the new deadline
+    # now. Raises ClaimLost if the job was claimed again in the meantime, so
+    # the handler stops instead of finishing work that will be thrown away.
+    # Outside a worker (e.g. a CLI running the same code) it does nothing.
+    global _heartbeat_conn
+    if _current is None:
+        return
+    if _heartbeat_conn is None or _heartbeat_conn.closed:
+        _heartbeat_conn = _connect()
+        _heartbeat_conn.autocommit = True
+    cur = _heartbeat_conn.cursor()
+    cur.execute("""
+        UPDATE Job SET run_at = NOW() + make_interval(secs => %s)
+        WHERE job_id = %s AND attempts = %s AND status = 'running'
+    """, (seconds,) + _current)
+    touched = cur.rowcount
+    cur.close()
+    if touched != 1:
+        raise ClaimLost("job %d attempt %d is no longer ours" % _current)
+
+
+def enqueue(cur, kind, payload=None, delay=0, max_attempts=JOB_MAX_ATTEMPTS):
+    cur.execute("""
+        INSERT INTO Job (kind, payload, run_at, max_attempts)
+        VALUES (%s, %s, NOW() + make_interval(secs => %s), %s)
+        RETURNING job_id
+    """, (kind, psycopg2.extras.Json(payload or {}), delay, max_attempts))
+    return cur.fetchone()[0]
+
+
+def claim(cur, worker):
+    cur.execute("""
+        UPDATE Job
+        SET status = 'running',
+            attempts = attempts + 1,
+            locked_by = %s,
+            run_at = NOW() + make_interval(secs => %s)
+        WHERE job_id = (
+            SELECT job_id FROM Job
+            WHERE status IN ('queued', 'running')
+              AND run_at <= NOW()
+              AND attempts < max_attempts
+            ORDER BY run_at
+            LIMIT 1
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING job_id, kind, payload, attempts, max_attempts
+    """, (worker, JOB_VISIBILITY_TIMEOUT))
+    return cur.fetchone()
+
+
+def backoff(attempts):
+    delay = min(JOB_BACKOFF_MAX, JOB_BACKOFF_BASE * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def run(conn, cur, job):
+    global _current
+    fn = HANDLERS.get(job["kind"])
+    try:
+        if fn is None:
+            raise LookupError("no handler for job kind %r" % job["kind"])
+        _current = (job["job_id"], job["attempts"])
+        try:
+            after = fn(cur, job["payload"])
+        finally:
+            _current = None
+        # Matching on attempts fences off a worker that overran its
+        # visibility timeout: if the job was claimed again meanwhile, this
+        # updates nothing and the handler's writes are rolled back.
+        cur.execute("""
+            UPDATE Job
+            SET status = 'done', finished_at = NOW(), last_error = NULL
+            WHERE job_id = %s AND attempts = %s AND status = 'running'
+        """, (job["job_id"], job["attempts"]))
+        if cur.rowcount == 1:
+            conn.commit()
+            after_commit(after)
+            return True
+        conn.rollback()
+        return False
+    except Exception:
+        error = traceback.format_exc()
+        conn.rollback()
+        cur.execute("""
+            UPDATE Job
+            SET status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'queued' END,
+                finished_at = CASE WHEN attempts >= max_attempts THEN NOW() END,
+                run_at = NOW() + make_interval(secs => %s),
+                last_error = %s
+            WHERE job_id = %s AND attempts = %s AND status = 'running'
+            RETURNING status
+        """, (backoff(job["attempts"]), error, job["job_id"], job["attempts"]))
+        row = cur.fetchone()
+        after = None
+        if row is not None and row[0] == "failed":
+            after = failed(cur, job["kind"], job["payload"], error)
+        conn.commit()
+        after_commit(after)
+        return False
+
+
+def reap(cur):
+    # Running jobs past their deadline with no attempts left never get
+    # claimed again; close them out as failed. Returns the post-commit steps
+    # of their failure handlers.
+    cur.execute("""
+        UPDATE Job
+        SET status = 'failed', finished_at = NOW(),
+            last_error = COALESCE(last_error, 'visibility timeout expired')
+        WHERE status IN ('queued', 'running')
+          AND run_at <= NOW()
+          AND attempts >= max_attempts
+        RETURNING kind, payload, last_error
+    """)
+    return [failed(cur, kind, payload, error) for kind, payload, error in cur.fetchall()]
+
+
+def seconds_until_next(cur):
+    cur.execute("""
+        SELECT EXTRACT(EPOCH FROM MIN(run_at) - NOW())
+        FROM Job
+        WHERE status IN ('queued', 'running')
+    """)
+    delay = cur.fetchone()[0]
+    if delay is None:
+        return JOB_POLL_INTERVAL
+    return max(0.0, min(float(delay), JOB_POLL_INTERVAL))
+
+
+def wait(conn, timeout, wakeup):
+    # Returns on a NOTIFY, after timeout, or when a signal arrives (the
+    # signal module writes to the wakeup pipe).
+    ready = select.select([conn, wakeup], [], [], timeout)[0]
+    if conn in ready:
+        conn.poll()
+        del conn.notifies[:]
+    if wakeup in ready:
+        os.read(wakeup, 512)
+
+
+def work(index=0, once=False):
+    # One worker process: claim and run jobs until SIGTERM/SIGINT, sleeping
+    # on LISTEN between them. With once=True, stop when nothing is ready.
+    stopping = []
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda *_: stopping.append(True))
+    wakeup, wakeup_w = os.pipe()
+    os.set_blocking(wakeup_w, False)
+    signal.set_wakeup_fd(wakeup_w)
+
+    # Spawned processes start with logging unconfigured.
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s: %(message)s")
+
+    worker = "%s:%d:%d" % (socket.gethostname(), os.getpid(), index)
+    conn = None
+    while not stopping:
+        try:
+            if conn is None or conn.closed:
+                conn = _connect()
+                cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+                cur.execute("LISTEN " + CHANNEL)
+                conn.commit()
+
+            job = claim(cur, worker)
+            conn.commit()
+            if job is not None:
+                run(conn, cur, job)
+                continue
+
+            reaped = reap(cur)
+            timeout = seconds_until_next(cur)
+            conn.commit()
+            for after in reaped:
+                after_commit(after)
+            if once:
+                break
+            wait(conn, max(timeout, 0.1), wakeup)
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            # Lost the server: OperationalError from the statement that hit
+            # the dead socket, InterfaceError from a later call on the closed
+            # connection (e.g. run()'s rollback). Back off and reconnect.
+            if conn is not None:
+                conn.close()
+            conn = None
+            time.sleep(min(JOB_POLL_INTERVAL, 5))
+
+    if conn is not None:
+        conn.close()
+    if _heartbeat_conn is not None:
+        _heartbeat_conn.close()
+
+
+def metrics(cur):
+    cur.execute("""
+        SELECT status, COUNT(*), MIN(created_at)
+        FROM Job
+        GROUP BY status
+    """)
+    return {status: {"count": count, "oldest": oldest}
+            for status, count, oldest in cur.fetchall()}
+
+
+def prune(days=7):
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute("""
+        DELETE FROM Job
+        WHERE status = 'done' AND finished_at < NOW() - make_interval(days => %s)
+    """, (days,))
+    removed = cur.rowcount
+    conn.commit()
+    cur.close()
+    conn.close()
+    return removed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Background job queue maintenance.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    prune_parser = sub.add_parser("prune", help="delete finished jobs")
+    prune_parser.add_argument("--days", type=int, default=7)
+    sub.add_parser("status", help="job counts by status")
+    args = parser.parse_args()
+
+    if args.command == "prune":
+        print("Removed %d finished jobs." % prune(args.days))
+    else:
+        conn = get_conn()
+        cur = conn.cursor()
+        for status, info in sorted(metrics(cur).items()):
+            print("%-8s %8d  oldest %s" % (status, info["count"], info["oldest"]))
+        cur.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,427 @@
+import argparse
+import http.cookiejar
+import json
+import logging
+import multiprocessing
+import os
+import random
+import re
+import socket
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from app import datagen
+from app.bench import percentile
+from app.db import get_conn, init_db
+
+# Load generator: `python -m app.loadtest --users 300 --duration 120` starts the
+# app under a local WSGI server (or targets --url) and runs virtual users from a
+# process pool, each process driving its share of users from threads. Users
+# loop over scripted journeys picked by the profile's mix until the run ends:
+#
+#   student - sign up, log in, browse and search the catalog, open a program,
+#             apply and upload its required documents
+#   mentor  - log in, open the document queue, decide a few documents, open
+#             one application
+#   admin   - log in, work the pending visa, housing and scholarship queues
+#             with batch approvals
+#
+# Mentors and admins use the accounts app.datagen creates, so load a dataset
+# first. Runs change the data (new students, uploads, decisions). The report
+# gives requests, error rate, throughput and latency percentiles per endpoint.
+
+# mix: journey weights; ramp: seconds until every user is running;
+# think: pause between a user's requests, in seconds.
+PROFILES = {
+    "steady": {"mix": {"student": 60, "mentor": 30, "admin": 10},
+               "ramp": 30, "think": (1.0, 3.0)},
+    # The days before an intake deadline: nearly everyone is a student
+    # finishing an application, arriving within seconds and clicking fast.
+    "surge": {"mix": {"student": 90, "mentor": 8, "admin": 2},
+              "ramp": 5, "think": (0.2, 1.0)},
+}
+
+SEARCH_TERMS = ["machine learning", "robotics", "energy", "vision", "quantum",
+                "security", "data", "climate"]
+UPLOAD_BYTES = 200 * 1024
+REQUEST_TIMEOUT = 30
+DECISIONS_PER_CYCLE = 5
+BATCH_SIZE = 20
+
+PROGRAM_LINK = re.compile(r'/student/program/(\d+)"')
+UPLOAD_FORM = re.compile(r'action="(/student/program/\d+/upload/\d+/\d+)"')
+DOCUMENT_DECISION = re.compile(r'action="(/mentor/document/(\d+)/\d+/)approve"')
+BATCH_ID = re.compile(r'name="id" value="(\d+)"')
+
+
+class JourneyFailed(Exception):
+    pass
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    # Redirects are returned to the user (and timed) rather than followed.
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class VirtualUser:
+    def __init__(self, base_url, stats, think, rng):
+        self.base_url = base_url
+        self.stats = stats
+        self.think = think
+        self.rng = rng
+        self.new_session()
+
+    def new_session(self):
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect)
+
+    def request(self, label, path, data=None, content_type=None):
+        if isinstance(data, dict):
+            data = urllib.parse.urlencode(data, doseq=True).encode()
+            content_type = "application/x-www-form-urlencoded"
+        req = urllib.request.Request(self.base_url + path, data=data)
+        if content_type:
+            req.add_header("Content-Type", content_type)
+
+        sent_at = time.time()
+        started = time.perf_counter()
+        error = None
+        try:
+            with self.opener.open(req, timeout=REQUEST_TIMEOUT) as resp:
+                status, body, location = resp.status, resp.read(), None
+        except urllib.error.HTTPError as e:
+            status, body, location = e.code, e.read(), e.headers.get("Location")
+        except (urllib.error.URLError, OSError) as e:
+            status, body, location = None, b"", None
+            error = "%s: %s" % (label, e)
+        if error is None and status >= 400:
+            error = "%s: HTTP %d" % (label, status)
+        self.stats.add(label, sent_at, time.perf_counter() - started, error is None)
+
+        # Think after failures too, so a failing user keeps the profile's
+        # pace instead of retrying in a tight loop.
+        time.sleep(self.rng.uniform(*self.think))
+        if error is not None:
+            raise JourneyFailed(error)
+        return status, body.decode("utf-8", "replace"), location
+
+    def login(self, email):
+        _, _, location = self.request("POST /login", "/login",
+                                      {"email": email, "password": datagen.DEFAULT_PASSWORD})
+        if not location or "/login" in location:
+            self.stats.add_failure("POST /login")
+            raise JourneyFailed("login failed for %s" % email)
+
+    def upload(self, path):
+        boundary = "----loadtest%016x" % self.rng.getrandbits(64)
+        content = b"%PDF-1.4\n" + self.rng.randbytes(UPLOAD_BYTES)
+        body = b"".join([
+            ("--%s\r\n" % boundary).encode(),
+            b'Content-Disposition: form-data; name="file"; filename="document.pdf"\r\n',
+            b"Content-Type: application/pdf\r\n\r\n",
+            content,
+            ("\r\n--%s--\r\n" % boundary).encode(),
+        ])
+        self.request("POST /student/program/<pid>/upload/<app>/<req>", path, body,
+                     "multipart/form-data; boundary=" + boundary)
+
+
+def student_journey(user, accounts, ident):
+    email = "load-%s@example.edu" % ident
+    user.request("POST /signup", "/signup", {
+        "name": "Load Test %s" % ident, "email": email,
+        "password": datagen.DEFAULT_PASSWORD, "confirm": datagen.DEFAULT_PASSWORD,
+    })
+    user.login(email)
+    user.request("GET /student/dashboard", "/student/dashboard")
+
+    _, catalog, _ = user.request("GET /student/programs", "/student/programs")
+    user.request("GET /student/programs/search", "/student/programs/search?" +
+                 urllib.parse.urlencode({"q": user.rng.choice(SEARCH_TERMS)}))
+    programs = PROGRAM_LINK.findall(catalog)
+    if not programs:
+        raise JourneyFailed("empty program catalog")
+
+    pid = user.rng.choice(programs)
+    user.request("GET /student/program/<pid>", "/student/program/%s" % pid)
+    user.request("GET /student/program/<pid>/apply", "/student/program/%s/apply" % pid)
+    _, details, _ = user.request("GET /student/program/<pid>", "/student/program/%s" % pid)
+    for path in UPLOAD_FORM.findall(details):
+        user.upload(path)
+    user.request("GET /student/dashboard", "/student/dashboard")
+
+
+def mentor_journey(user, accounts, ident):
+    user.login(user.rng.choice(accounts["mentor"]))
+    user.request("GET /mentor/dashboard", "/mentor/dashboard")
+    _, queue, _ = user.request("GET /mentor/review_documents", "/mentor/review_documents")
+
+    decisions = DOCUMENT_DECISION.findall(queue)[:DECISIONS_PER_CYCLE]
+    for prefix, _ in decisions:
+        action = "approve" if user.rng.random() < 0.8 else "reject"
+        user.request("POST /mentor/document/<app>/<req>/<action>", prefix + action, {})
+    if decisions:
+        user.request("GET /mentor/application/<app>", "/mentor/application/%s" % decisions[0][1])
+
+
+def admin_journey(user, accounts, ident):
+    user.login(user.rng.choice(accounts["admin"]))
+    user.request("GET /admin/dashboard", "/admin/dashboard")
+    for listing, batch in [("/admin/visa", "/admin/visa/batch"),
+                           ("/admin/housing/requests", "/admin/housing/requests/batch"),
+                           ("/admin/scholarship_applications",
+                            "/admin/scholarship_applications/batch")]:
+        _, page, _ = user.request("GET " + listing, listing + "?status=Pending")
+        ids = BATCH_ID.findall(page)[:BATCH_SIZE]
+        if ids:
+            user.request("POST " + batch, batch, {"action": "approve", "id": ids})
+
+
+JOURNEYS = {"student": student_journey, "mentor": mentor_journey, "admin": admin_journey}
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoints = {}
+        self.journeys = {}
+
+    def add(self, label, sent_at, seconds, ok):
+        with self.lock:
+            entry = self.endpoints.setdefault(label, {"latencies": [], "sent": [], "errors": 0})
+            entry["latencies"].append(seconds)
+            entry["sent"].append(sent_at)
+            if not ok:
+                entry["errors"] += 1
+
+    def add_failure(self, label):
+        # A response that came back fine but didn't do what the journey needed.
+        with self.lock:
+            self.endpoints[label]["errors"] += 1
+
+    def journey(self, name, ok):
+        with self.lock:
+            entry = self.journeys.setdefault(name, {"completed": 0, "failed": 0})
+            entry["completed" if ok else "failed"] += 1
+
+
+def run_user(index, base_url, profile, accounts, deadline, stats, tag):
+    rng = random.Random("%s:%d" % (tag, index))
+    time.sleep(profile["ramp"] * rng.random())
+    user = VirtualUser(base_url, stats, profile["think"], rng)
+    names = list(profile["mix"])
+    weights = [profile["mix"][n] for n in names]
+
+    iteration = 0
+    while time.time() < deadline:
+        name = rng.choices(names, weights)[0]
+        if name != "student" and not accounts[name]:
+            name = "student"
+        # Every journey starts logged out and logs in itself.
+        user.new_session()
+        try:
+            JOURNEYS[name](user, accounts, "%s-%d-%d" % (tag, index, iteration))
+            stats.journey(name, True)
+        except JourneyFailed:
+            stats.journey(name, False)
+        iteration += 1
+
+
+def run_process(task):
+    # One pool process: its users run as threads, since they mostly wait on
+    # the server.
+    first, count, base_url, profile, accounts, deadline, tag = task
+    stats = Stats()
+    threads = [threading.Thread(target=run_user,
+                                args=(first + i, base_url, profile, accounts, deadline,
+                                      stats, tag))
+               for i in range(count)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return stats.endpoints, stats.journeys
+
+
+def serve(host, port, processes):
+    from werkzeug.serving import make_server
+    from app import create_app
+    # Per-request access log lines would cost more than some requests do.
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    app = create_app()
+    if processes > 1:
+        server = make_server(host, port, app, processes=processes)
+    else:
+        server = make_server(host, port, app, threaded=True)
+    server.serve_forever()
+
+
+def wait_for_port(host, port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection((host, port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise SystemExit("server on %s:%d did not come up" % (host, port))
+
+
+def load_accounts():
+    # Generated mentors with the most pending documents, so review cycles
+    # find work, and every generated admin.
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT m.email
+        FROM Mentor m
+        JOIN Program p ON p.mentor_id = m.mentor_id
+        JOIN Application a ON a.program_id = p.program_id
+        WHERE m.email LIKE 'mentor%@example.edu' AND a.docs_pending > 0
+        GROUP BY m.mentor_id, m.email
+        ORDER BY SUM(a.docs_pending) DESC
+        LIMIT 200
+    """)
+    mentors = [r[0] for r in cur.fetchall()]
+    cur.execute("SELECT email FROM Admin WHERE email LIKE 'admin%@example.edu'")
+    admins = [r[0] for r in cur.fetchall()]
+    cur.close()
+    conn.close()
+    return {"mentor": mentors, "admin": admins}
+
+
+def summarize(endpoints, journeys, window):
+    # Throughput counts only requests sent in the steady window (after the
+    # ramp, before the deadline); the other figures cover the whole run.
+    start, end = window
+    seconds = end - start
+    rows = []
+    for label, entry in sorted(endpoints.items()):
+        lat = entry["latencies"]
+        steady = sum(1 for t in entry["sent"] if start <= t < end)
+        rows.append({
+            "endpoint": label,
+            "requests": len(lat),
+            "errors": entry["errors"],
+            "error_rate": entry["errors"] / len(lat) if lat else 0.0,
+            "steady_requests": steady,
+            "per_second": steady / seconds,
+            "p50_ms": percentile(lat, 50) * 1000,
+            "p95_ms": percentile(lat, 95) * 1000,
+            "p99_ms": percentile(lat, 99) * 1000,
+        })
+    total = sum(r["requests"] for r in rows)
+    errors = sum(r["errors"] for r in rows)
+    every = [s for entry in endpoints.values() for s in entry["latencies"]]
+    return {
+        "seconds": seconds,
+        "requests": total,
+        "errors": errors,
+        "error_rate": errors / total if total else 0.0,
+        "per_second": sum(r["steady_requests"] for r in rows) / seconds,
+        "p50_ms": percentile(every, 50) * 1000,
+        "p95_ms": percentile(every, 95) * 1000,
+        "p99_ms": percentile(every, 99) * 1000,
+        "endpoints": rows,
+        "journeys": journeys,
+    }
+
+
+def print_summary(summary):
+    header = "%-52s %8s %7s %8s %9s %9s %9s"
+    line = "%-52s %8d %6.2f%% %8.1f %9.1f %9.1f %9.1f"
+    print(header % ("endpoint", "requests", "errors", "req/s", "p50 ms", "p95 ms", "p99 ms"))
+    for r in summary["endpoints"]:
+        print(line % (r["endpoint"], r["requests"], r["error_rate"] * 100, r["per_second"],
+                      r["p50_ms"], r["p95_ms"], r["p99_ms"]))
+    print(line % ("total", summary["requests"], summary["error_rate"] * 100,
+                  summary["per_second"], summary["p50_ms"], summary["p95_ms"],
+                  summary["p99_ms"]))
+    for name, entry in sorted(summary["journeys"].items()):
+        print("%s journeys: %d completed, %d failed" % (name, entry["completed"], entry["failed"]))
+
+
+def drive(ctx, base_url, args, accounts):
+    profile = PROFILES[args.profile]
+    processes = max(1, min(args.processes, args.users))
+    tag = "%x" % int(time.time())
+    deadline = time.time() + profile["ramp"] + args.duration
+    tasks = []
+    first = 0
+    for i in range(processes):
+        count = args.users // processes + (1 if i < args.users % processes else 0)
+        tasks.append((first, count, base_url, profile, accounts, deadline, tag))
+        first += count
+
+    print("%s profile: %d users over %d processes against %s for %ds (+%ds ramp)"
+          % (args.profile, args.users, processes, base_url, args.duration, profile["ramp"]))
+    steady_from = time.time() + profile["ramp"]
+    endpoints, journeys = {}, {}
+    with ctx.Pool(processes) as pool:
+        for proc_endpoints, proc_journeys in pool.imap_unordered(run_process, tasks):
+            for label, entry in proc_endpoints.items():
+                merged = endpoints.setdefault(label, {"latencies": [], "sent": [], "errors": 0})
+                merged["latencies"].extend(entry["latencies"])
+                merged["sent"].extend(entry["sent"])
+                merged["errors"] += entry["errors"]
+            for name, entry in proc_journeys.items():
+                merged = journeys.setdefault(name, {"completed": 0, "failed": 0})
+                merged["completed"] += entry["completed"]
+                merged["failed"] += entry["failed"]
+
+    summary = summarize(endpoints, journeys, (steady_from, deadline))
+    summary["profile"] = args.profile
+    summary["users"] = args.users
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive the portal with virtual users.")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="steady")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--duration", type=int, default=60, help="seconds")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 2,
+                        help="load generator processes the users are spread over")
+    parser.add_argument("--url", default=None,
+                        help="target an already running server instead of starting one")
+    parser.add_argument("--port", type=int, default=5050)
+    parser.add_argument("--server-processes", type=int, default=1,
+                        help="local server worker processes (1 = one threaded process)")
+    parser.add_argument("--output", default=None, help="also write the report as JSON")
+    args = parser.parse_args()
+
+    init_db()
+    accounts = load_accounts()
+    if not accounts["mentor"] or not accounts["admin"]:
+        print("No generated mentors/admins found (run app.datagen); "
+              "mentor and admin journeys are replaced by student ones.")
+
+    ctx = multiprocessing.get_context("spawn")
+    server = None
+    base_url = args.url
+    if base_url is None:
+        # Not daemonic: the app starts process pools of its own (password
+        # hashing), which daemonic processes may not have.
+        server = ctx.Process(target=serve, args=("127.0.0.1", args.port, args.server_processes))
+        server.start()
+        base_url = "http://127.0.0.1:%d" % args.port
+    try:
+        if server is not None:
+            wait_for_port("127.0.0.1", args.port)
+        summary = drive(ctx, base_url.rstrip("/"), args, accounts)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.join()
+
+    print_summary(summary)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,24 @@
 from flask import Blueprint, render_template, request, redirect, url_for, session, flash
-from werkzeug.security import generate_password_hash, check_password_hash
 from psycopg2 import IntegrityError
 from app.db import get_conn
+from app.passwords import hash_password, verify_password, PasswordServiceBusy
 
 main_bp = Blueprint('main', __name__, template_folder='templates')
 
+HOME_ENDPOINTS = {
+    'student': 'student.dashboard',
+    'mentor': 'mentor.dashboard',
+    'admin': 'admin.dashboard',
+}
+
+PASSWORD_COLUMNS = {
+    'student': ('Student', 'student_id'),
+    'mentor': ('Mentor', 'mentor_id'),
+    'admin': ('Admin', 'admin_id'),
+}
+
+BUSY_ERROR = "The server is busy, please try again in a moment."
+
 @main_bp.route('/')
 def index():
     return render_template('main/index.html')
@@ -25,7 +39,10 @@ def signup():
         if password != confirm:
             return render_template('main/signup.html', error="Passwords do not match.", form=request.form)
 
-        pw_hash = generate_password_hash(password)  
+        try:
+            pw_hash = hash_password(password)
+        except PasswordServiceBusy:
+            return render_template('main/signup.html', error=BUSY_ERROR, form=request.form), 503
 
         conn = get_conn()
         cur = conn.cursor()
@@ -70,59 +87,53 @@ def login():
         conn = get_conn()
         cur = conn.cursor()
 
-        
-        cur.execute("SELECT student_id, name, password FROM Student WHERE email = %s", (email,))
-        user = cur.fetchone()
-        if user:
-            user_id, name, pw_hash = user
-            if check_password_hash(pw_hash, password):
-                session.clear()
-                session['user_id'] = user_id
-                session['role'] = 'student'
-                session['name'] = name
-                cur.close()
-                conn.close()
-                return redirect(url_for('student.dashboard'))
-            else:
+        # Account maps lower(email) to exactly one role, so a single indexed
+        # probe finds the user whichever table they live in.
+        cur.execute("""
+            SELECT ac.role, ac.principal_id,
+                   COALESCE(s.name, m.name, ad.name),
+                   COALESCE(s.password, m.password, ad.password)
+            FROM Account ac
+            LEFT JOIN Student s ON ac.role = 'student' AND s.student_id = ac.principal_id
+            LEFT JOIN Mentor m ON ac.role = 'mentor' AND m.mentor_id = ac.principal_id
+            LEFT JOIN Admin ad ON ac.role = 'admin' AND ad.admin_id = ac.principal_id
+            WHERE lower(ac.email) = %s
+        """, (email,))
+        account = cur.fetchone()
+
+        if account:
+            role, user_id, name, pw_hash = account
+            try:
+                ok, new_hash = verify_password(pw_hash, password)
+            except PasswordServiceBusy:
                 cur.close()
                 conn.close()
-                return render_template('main/login.html', error="Invalid credentials.", form=request.form)
+                return render_template('main/login.html', error=BUSY_ERROR, form=request.form), 503
+
+            if ok and new_hash:
+                # Stored hash predates PASSWORD_HASH_METHOD; upgrade it now
+                # that we have the plaintext.
+                table, id_col = PASSWORD_COLUMNS[role]
+                cur.execute(
+                    "UPDATE %s SET password=%%s WHERE %s=%%s" % (table, id_col),
+                    (new_hash, user_id)
+                )
+                conn.commit()
 
-        
-        cur.execute("SELECT mentor_id, name, password FROM Mentor WHERE email = %s", (email,))
-        m = cur.fetchone()
-        if m:
-            mentor_id, name, pw_hash = m
-            if check_password_hash(pw_hash, password):
+            cur.close()
+            conn.close()
+
+            if ok:
                 session.clear()
-                session['user_id'] = mentor_id
-                session['role'] = 'mentor'
+                session['user_id'] = user_id
+                session['role'] = role
                 session['name'] = name
-                cur.close()
-                conn.close()
-                return redirect(url_for('mentor.dashboard'))
+                return redirect(url_for(HOME_ENDPOINTS[role]))
             else:
-                cur.close()
-                conn.close()
                 return render_template('main/login.html', error="Invalid credentials.", form=request.form)
 
-        
-        cur.execute("SELECT admin_id, name, password FROM Admin WHERE email = %s", (email,))
-        a = cur.fetchone()
         cur.close()
         conn.close()
-        if a:
-            admin_id, name, pw_hash = a
-            if check_password_hash(pw_hash, password):
-                session.clear()
-                session['user_id'] = admin_id
-                session['role'] = 'admin'
-                session['name'] = name
-                return redirect(url_for('admin.dashboard'))
-            else:
-                return render_template('main/login.html', error="Invalid credentials.", form=request.form)
-
-        
         return render_template('main/login.html', error="No account with that email.", form=request.form)
 
     return render_template('main/login.html')
@@ -1,5 +1,7 @@
-from flask import Blueprint, render_template, session, redirect, url_for, request, send_from_directory
+from flask import Blueprint, render_template, session, redirect, url_for, request, send_from_directory, send_file, abort, Response
 from app.db import get_conn
+from app.pagination import paginate
+from app import storage, bundles, renditions
 import psycopg2.extras
 import os
 
@@ -9,13 +11,22 @@ mentor_bp = Blueprint(
     template_folder="templates"
 )
 
-UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), "..", "static", "uploads")
 
 
 def guard():
     return session.get("role") == "mentor"
 
 
+def mentor_programs(cur, mentor_id):
+    cur.execute("""
+        SELECT program_id, title
+        FROM Program
+        WHERE mentor_id=%s
+        ORDER BY title
+    """, (mentor_id,))
+    return [(row[0], row[1]) for row in cur.fetchall()]
+
+
 
 
 
@@ -35,11 +46,10 @@ def dashboard():
 
     
     cur.execute("""
-        SELECT COUNT(*)
-        FROM ApplicationDocument ad
-        JOIN Application a ON ad.application_id = a.application_id
+        SELECT COALESCE(SUM(a.docs_pending), 0)
+        FROM Application a
         JOIN Program p ON a.program_id = p.program_id
-        WHERE p.mentor_id=%s AND ad.status='Pending'
+        WHERE p.mentor_id=%s
     """, (mentor_id,))
     pending_docs = cur.fetchone()[0]
 
@@ -76,21 +86,30 @@ def student_applications():
     conn = get_conn()
     cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
 
-    cur.execute("""
+    page = paginate(
+        cur,
+        """
         SELECT a.application_id, s.student_id, s.name AS student_name,
                s.email, p.title AS program_title, a.status
         FROM Application a
         JOIN Student s ON a.student_id = s.student_id
         JOIN Program p ON a.program_id = p.program_id
-        WHERE p.mentor_id = %s
-        ORDER BY a.application_id ASC
-    """, (mentor_id,))
-    apps = cur.fetchall()
+        """,
+        keys=[("a.application_id", "application_id")],
+        where=["p.mentor_id = %s"],
+        params=[mentor_id],
+        filters={
+            "status": "a.status = %s",
+            "program": ("a.program_id = %s", int),
+        }
+    )
+    programs = mentor_programs(cur, mentor_id)
 
     cur.close()
     conn.close()
 
-    return render_template("mentor/student_applications.html", apps=apps)
+    return render_template("mentor/student_applications.html", apps=page.rows,
+                           page=page, programs=programs)
 
 
 
@@ -106,50 +125,51 @@ def review_application(app_id):
     conn = get_conn()
     cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
 
-    
+    # Ownership check, documents and scholarship requests in one round trip.
     cur.execute("""
-        SELECT p.mentor_id, p.title, s.name AS student_name
+        SELECT p.mentor_id, p.title, s.name AS student_name,
+               COALESCE(d.items, '[]') AS docs,
+               COALESCE(schs.items, '[]') AS sch
         FROM Application a
         JOIN Program p ON a.program_id = p.program_id
         JOIN Student s ON a.student_id = s.student_id
+        LEFT JOIN LATERAL (
+            SELECT json_agg(json_build_object(
+                       'req_id', rd.req_id,
+                       'document_name', rd.document_name,
+                       'file_name', ad.file_name,
+                       'status', ad.status
+                   ) ORDER BY rd.req_id) AS items
+            FROM RequiredDocuments rd
+            LEFT JOIN ApplicationDocument ad
+            ON rd.req_id = ad.req_id AND ad.application_id = a.application_id
+            WHERE rd.program_id = a.program_id
+        ) d ON TRUE
+        LEFT JOIN LATERAL (
+            SELECT json_agg(json_build_object(
+                       'sch_app_id', sa.sch_app_id,
+                       'status', sa.status,
+                       'name', sc.name,
+                       'amount', sc.amount::text
+                   ) ORDER BY sa.sch_app_id) AS items
+            FROM ScholarshipApplication sa
+            JOIN Scholarship sc ON sa.scholarship_id = sc.scholarship_id
+            WHERE sa.application_id = a.application_id
+        ) schs ON TRUE
         WHERE a.application_id=%s
     """, (app_id,))
     row = cur.fetchone()
 
+    cur.close()
+    conn.close()
+
     if not row or row["mentor_id"] != mentor_id:
-        cur.close()
-        conn.close()
         return "Unauthorized", 403
 
     program_title = row["title"]
     student_name = row["student_name"]
-
-    
-    cur.execute("""
-        SELECT rd.req_id, rd.document_name,
-               ad.file_name, ad.status
-        FROM RequiredDocuments rd
-        LEFT JOIN ApplicationDocument ad
-        ON rd.req_id = ad.req_id AND ad.application_id=%s
-        WHERE rd.program_id = (
-            SELECT program_id FROM Application WHERE application_id=%s
-        )
-        ORDER BY rd.req_id
-    """, (app_id, app_id))
-    docs = cur.fetchall()
-
-    
-    cur.execute("""
-        SELECT sa.sch_app_id, sa.status,
-               sc.name, sc.amount
-        FROM ScholarshipApplication sa
-        JOIN Scholarship sc ON sa.scholarship_id = sc.scholarship_id
-        WHERE sa.application_id=%s
-    """, (app_id,))
-    sch = cur.fetchall()
-
-    cur.close()
-    conn.close()
+    docs = row["docs"]
+    sch = row["sch"]
 
     return render_template(
         "mentor/review_application.html",
@@ -164,66 +184,228 @@ def review_application(app_id):
 
 
 
+DECISIONS = {"approve": "Approved", "reject": "Rejected"}
+
+# Upper bound on documents decided in one bulk request.
+BULK_DECISION_MAX = 1000
+
+
+def apply_document_decisions(cur, mentor_id, decisions):
+    # decisions: [(app_id, req_id, status)]. One UPDATE for the whole batch,
+    # restricted to documents in programs this mentor owns. Returns the
+    # (app_id, req_id) pairs that were actually updated.
+    if not decisions:
+        return []
+
+    # execute_values takes a single placeholder, so the mentor id rides
+    # along in each VALUES row instead of being a separate parameter.
+    rows = psycopg2.extras.execute_values(cur, """
+        UPDATE ApplicationDocument ad
+        SET status = v.status
+        FROM (VALUES %s) AS v(application_id, req_id, status, mentor_id),
+             Application a, Program p
+        WHERE ad.application_id = v.application_id
+          AND ad.req_id = v.req_id
+          AND a.application_id = ad.application_id
+          AND p.program_id = a.program_id
+          AND p.mentor_id = v.mentor_id
+        RETURNING ad.application_id, ad.req_id
+    """, [d + (mentor_id,) for d in decisions],
+        page_size=len(decisions), fetch=True)
+    return [tuple(r) for r in rows]
+
+
+def refresh_application_status(cur, app_ids):
+    # Auto-approval for every touched application in one statement: all
+    # documents approved -> Approved, otherwise any rejected -> Rejected,
+    # otherwise the status is left alone. Reads the docs_* counters kept by
+    # the ApplicationDocument triggers, so no documents are re-aggregated.
+    if not app_ids:
+        return
+    cur.execute("""
+        UPDATE Application
+        SET status = CASE WHEN docs_approved = docs_total THEN 'Approved' ELSE 'Rejected' END
+        WHERE application_id = ANY(%s)
+          AND docs_total > 0
+          AND (docs_approved = docs_total OR docs_rejected > 0)
+    """, (list(app_ids),))
+
+
 @mentor_bp.route('/mentor/document/<int:app_id>/<int:req_id>/<string:action>', methods=['POST'])
 def decide_document(app_id, req_id, action):
     if not guard():
         return redirect(url_for("main.login"))
 
-    if action not in ("approve", "reject"):
+    if action not in DECISIONS:
         return redirect(url_for('mentor.review_application', app_id=app_id))
 
-    status = "Approved" if action == "approve" else "Rejected"
+    conn = get_conn()
+    cur = conn.cursor()
+
+    updated = apply_document_decisions(
+        cur, session["user_id"], [(app_id, req_id, DECISIONS[action])])
+    refresh_application_status(cur, {a for a, _ in updated})
+
+    conn.commit()
+    cur.close()
+    conn.close()
+
+    return redirect(url_for('mentor.review_application', app_id=app_id))
+
+
+@mentor_bp.route('/mentor/documents/bulk', methods=['POST'])
+def decide_documents_bulk():
+    if not guard():
+        return redirect(url_for("main.login"))
+
+    action = request.form.get("action")
+    back = request.referrer or url_for('mentor.review_documents')
+    if action not in DECISIONS:
+        return redirect(back)
+
+    # Each checkbox value is "<app_id>:<req_id>".
+    decisions = {}
+    for value in request.form.getlist("doc"):
+        try:
+            app_id, req_id = (int(x) for x in value.split(":"))
+        except ValueError:
+            continue
+        decisions[(app_id, req_id)] = (app_id, req_id, DECISIONS[action])
+    # Refuse an oversized batch outright instead of deciding part of it.
+    if len(decisions) > BULK_DECISION_MAX:
+        abort(400, description="At most %d documents can be decided at once." % BULK_DECISION_MAX)
 
     conn = get_conn()
     cur = conn.cursor()
 
-    # Update the selected document
+    updated = apply_document_decisions(cur, session["user_id"], list(decisions.values()))
+    refresh_application_status(cur, {a for a, _ in updated})
+
+    conn.commit()
+    cur.close()
+    conn.close()
+
+    return redirect(back)
+
+
+def owned_document(app_id, req_id, mentor_id):
+    conn = get_conn()
+    cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+
+    # Only the mentor who owns the program may open its documents.
     cur.execute("""
-        UPDATE ApplicationDocument
-        SET status=%s
-        WHERE application_id=%s AND req_id=%s
-    """, (status, app_id, req_id))
+        SELECT ad.file_name, sf.path, sf.sha256, sf.ext
+        FROM ApplicationDocument ad
+        JOIN Application a ON ad.application_id = a.application_id
+        JOIN Program p ON a.program_id = p.program_id
+        LEFT JOIN StoredFile sf ON sf.file_id = ad.file_id
+        WHERE ad.application_id=%s AND ad.req_id=%s AND p.mentor_id=%s
+    """, (app_id, req_id, mentor_id))
+    doc = cur.fetchone()
+
+    cur.close()
+    conn.close()
+
+    if not doc or not doc["file_name"]:
+        abort(404)
+    return doc
+
+
+@mentor_bp.route('/mentor/files/<int:app_id>/<int:req_id>')
+def document_file(app_id, req_id):
+    if not guard():
+        return redirect(url_for("main.login"))
+
+    doc = owned_document(app_id, req_id, session["user_id"])
+
+    if doc["path"] is None:
+        # Uploaded before the content-addressed store existed and not yet
+        # moved over by `python -m app.storage migrate-legacy`.
+        return send_from_directory(storage.LEGACY_UPLOADS, doc["file_name"], conditional=True)
+
+    return storage.send_blob(doc["path"], doc["sha256"], doc["file_name"])
+
+
+@mentor_bp.route('/mentor/files/<int:app_id>/<int:req_id>/<string:kind>')
+def document_rendition(app_id, req_id, kind):
+    if not guard():
+        return redirect(url_for("main.login"))
+
+    if kind not in renditions.KINDS:
+        abort(404)
+
+    doc = owned_document(app_id, req_id, session["user_id"])
+    if doc["path"] is None:
+        abort(404)
+
+    path = renditions.rendition_path(doc["path"], kind)
+    if not os.path.exists(path):
+        # Not rendered yet (or not renderable); queue it for next time.
+        conn = get_conn()
+        cur = conn.cursor()
+        renditions.queue(cur, doc["path"], doc["ext"])
+        conn.commit()
+        cur.close()
+        conn.close()
+        abort(404)
+
+    response = send_file(path, mimetype="image/jpeg", conditional=True,
+                         etag="%s-%s" % (doc["sha256"], kind), max_age=86400)
+    response.cache_control.private = True
+    return response
+
+
+def bundle_response(scope, key):
+    return Response(
+        bundles.stream_zip(scope, key),
+        mimetype="application/zip",
+        headers={"Content-Disposition": "attachment; filename=%s_%d_documents.zip" % (scope, key)}
+    )
+
+
+@mentor_bp.route('/mentor/application/<int:app_id>/documents.zip')
+def application_bundle(app_id):
+    if not guard():
+        return redirect(url_for("main.login"))
+
+    mentor_id = session["user_id"]
 
-    # -------- AUTO APPROVAL LOGIC --------
-    # Count approved and total documents
+    conn = get_conn()
+    cur = conn.cursor()
     cur.execute("""
-        SELECT 
-            SUM(CASE WHEN status = 'Approved' THEN 1 END) AS approved_count,
-            COUNT(*) AS total_count
-        FROM ApplicationDocument
-        WHERE application_id = %s
+        SELECT p.mentor_id
+        FROM Application a
+        JOIN Program p ON a.program_id = p.program_id
+        WHERE a.application_id=%s
     """, (app_id,))
-    approved_count, total_count = cur.fetchone()
-
-    # If all documents are approved → approve the application
-    if approved_count == total_count and total_count > 0:
-        cur.execute("""
-            UPDATE Application
-            SET status = 'Approved'
-            WHERE application_id = %s
-        """, (app_id,))
-    else:
-        # If ANY document is rejected → application rejected
-        cur.execute("""
-            SELECT COUNT(*) FROM ApplicationDocument
-            WHERE application_id=%s AND status='Rejected'
-        """, (app_id,))
-        rejected_count = cur.fetchone()[0]
-
-        if rejected_count > 0:
-            cur.execute("""
-                UPDATE Application
-                SET status = 'Rejected'
-                WHERE application_id = %s
-            """, (app_id,))
-
-    # -------------------------------------
+    row = cur.fetchone()
+    cur.close()
+    conn.close()
 
-    conn.commit()
+    if not row or row[0] != mentor_id:
+        return "Unauthorized", 403
+
+    return bundle_response("application", app_id)
+
+
+@mentor_bp.route('/mentor/program/<int:pid>/documents.zip')
+def program_bundle(pid):
+    if not guard():
+        return redirect(url_for("main.login"))
+
+    mentor_id = session["user_id"]
+
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute("SELECT mentor_id FROM Program WHERE program_id=%s", (pid,))
+    row = cur.fetchone()
     cur.close()
     conn.close()
 
-    return redirect(url_for('mentor.review_application', app_id=app_id))
+    if not row or row[0] != mentor_id:
+        return "Unauthorized", 403
+
+    return bundle_response("program", pid)
 
 
 @mentor_bp.route('/mentor/scholarship/<int:sch_id>/<string:action>', methods=['POST'])
@@ -260,7 +442,9 @@ def review_documents():
     conn = get_conn()
     cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
 
-    cur.execute("""
+    page = paginate(
+        cur,
+        """
         SELECT ad.application_id, ad.req_id, ad.file_name, ad.status,
                rd.document_name,
                s.name AS student_name, p.title AS program_title
@@ -269,15 +453,24 @@ def review_documents():
         JOIN Application a ON ad.application_id = a.application_id
         JOIN Student s ON a.student_id = s.student_id
         JOIN Program p ON a.program_id = p.program_id
-        WHERE p.mentor_id=%s
-        ORDER BY ad.status ASC, ad.application_id ASC
-    """, (mentor_id,))
-    docs = cur.fetchall()
+        """,
+        keys=[("ad.status", "status"),
+              ("ad.application_id", "application_id"),
+              ("ad.req_id", "req_id")],
+        where=["p.mentor_id = %s"],
+        params=[mentor_id],
+        filters={
+            "status": "ad.status = %s",
+            "program": ("a.program_id = %s", int),
+        }
+    )
+    programs = mentor_programs(cur, mentor_id)
 
     cur.close()
     conn.close()
 
-    return render_template("mentor/review_documents.html", docs=docs)
+    return render_template("mentor/review_documents.html", docs=page.rows,
+                           page=page, programs=programs)
 
 @mentor_bp.route('/mentor/review_scholarships')
 def review_scholarships():
@@ -318,18 +511,24 @@ def assigned_students():
     conn = get_conn()
     cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
 
-    cur.execute("""
+    page = paginate(
+        cur,
+        """
         SELECT s.student_id, s.name, s.email, s.department, s.cgpa,
-               p.title AS program_title
+               p.title AS program_title, a.application_id
         FROM Application a
         JOIN Student s ON a.student_id = s.student_id
         JOIN Program p ON a.program_id = p.program_id
-        WHERE p.mentor_id=%s
-        ORDER BY s.student_id
-    """, (mentor_id,))
-    students = cur.fetchall()
+        """,
+        keys=[("s.student_id", "student_id"), ("a.application_id", "application_id")],
+        where=["p.mentor_id = %s"],
+        params=[mentor_id],
+        filters={"program": ("a.program_id = %s", int)}
+    )
+    programs = mentor_programs(cur, mentor_id)
 
     cur.close()
     conn.close()
 
-    return render_template("mentor/assigned_students.html", students=students)
+    return render_template("mentor/assigned_students.html", students=page.rows,
+                           page=page, programs=programs)
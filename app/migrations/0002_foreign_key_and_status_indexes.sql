@@ -0,0 +1,46 @@
+-- Foreign keys (Postgres does not index the referencing side on its own).
+-- Where a listing page pages by id within the key, the id is appended so the
+-- same index serves the keyset scan.
+CREATE INDEX IF NOT EXISTS idx_student_university_id ON Student (university_id, student_id);
+CREATE INDEX IF NOT EXISTS idx_mentor_university ON Mentor (university_id);
+
+CREATE INDEX IF NOT EXISTS idx_program_university_id ON Program (university_id, program_id);
+CREATE INDEX IF NOT EXISTS idx_program_mentor_id ON Program (mentor_id, program_id);
+CREATE INDEX IF NOT EXISTS idx_program_start_date ON Program (start_date);
+
+CREATE INDEX IF NOT EXISTS idx_application_student_program ON Application (student_id, program_id);
+CREATE INDEX IF NOT EXISTS idx_application_program_id ON Application (program_id, application_id);
+CREATE INDEX IF NOT EXISTS idx_application_applied_date ON Application (applied_date);
+
+CREATE INDEX IF NOT EXISTS idx_scholarship_program ON Scholarship (program_id);
+
+CREATE INDEX IF NOT EXISTS idx_visa_student ON VisaPermit (student_id, visa_id);
+CREATE INDEX IF NOT EXISTS idx_visa_pending ON VisaPermit (visa_id)
+    WHERE application_status = 'Pending';
+
+CREATE INDEX IF NOT EXISTS idx_housing_university ON Housing (university_id);
+CREATE INDEX IF NOT EXISTS idx_housing_available ON Housing (university_id, housing_id)
+    WHERE availability = TRUE;
+
+CREATE INDEX IF NOT EXISTS idx_housing_assignment_student ON HousingAssignment (student_id, assign_id);
+CREATE INDEX IF NOT EXISTS idx_housing_assignment_housing ON HousingAssignment (housing_id);
+CREATE INDEX IF NOT EXISTS idx_housing_assignment_current ON HousingAssignment (student_id)
+    WHERE checkout_date IS NULL;
+
+CREATE INDEX IF NOT EXISTS idx_housing_request_student ON HousingRequest (student_id, request_date);
+CREATE INDEX IF NOT EXISTS idx_housing_request_date_id ON HousingRequest (request_date, request_id);
+CREATE INDEX IF NOT EXISTS idx_housing_request_pending ON HousingRequest (request_date)
+    WHERE status = 'Pending';
+
+-- (application_id, scholarship_id) is already covered by the UNIQUE constraint
+CREATE INDEX IF NOT EXISTS idx_sch_app_scholarship ON ScholarshipApplication (scholarship_id);
+CREATE INDEX IF NOT EXISTS idx_sch_app_pending ON ScholarshipApplication (application_id)
+    WHERE status = 'Pending';
+
+CREATE INDEX IF NOT EXISTS idx_required_documents_program ON RequiredDocuments (program_id, req_id);
+
+-- (application_id, req_id) is already covered by unique_app_req
+CREATE INDEX IF NOT EXISTS idx_app_doc_req ON ApplicationDocument (req_id);
+CREATE INDEX IF NOT EXISTS idx_app_doc_status_app_req ON ApplicationDocument (status, application_id, req_id);
+CREATE INDEX IF NOT EXISTS idx_app_doc_pending ON ApplicationDocument (application_id)
+    WHERE status = 'Pending';
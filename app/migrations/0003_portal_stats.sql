@@ -0,0 +1,156 @@
+-- Admin dashboard counters, kept current by statement-level triggers so the
+-- dashboard reads a handful of rows instead of scanning eight tables.
+-- One row per counter keeps unrelated writers from contending on the same row.
+CREATE TABLE IF NOT EXISTS PortalStats (
+    stat_name VARCHAR(50) PRIMARY KEY,
+    value BIGINT NOT NULL DEFAULT 0,
+    reconciled_at TIMESTAMP
+);
+
+CREATE OR REPLACE FUNCTION portal_stats_add(p_name TEXT, p_delta BIGINT)
+RETURNS void AS $$
+BEGIN
+    IF p_delta <> 0 THEN
+        UPDATE PortalStats SET value = value + p_delta WHERE stat_name = p_name;
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Plain row counts; TG_ARGV[0] is the counter name.
+CREATE OR REPLACE FUNCTION portal_stats_count_rows()
+RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM portal_stats_add(TG_ARGV[0], (SELECT COUNT(*) FROM new_rows));
+    ELSE
+        PERFORM portal_stats_add(TG_ARGV[0], -(SELECT COUNT(*) FROM old_rows));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION portal_stats_docs_pending()
+RETURNS trigger AS $$
+DECLARE
+    delta BIGINT := 0;
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        delta := delta + (SELECT COUNT(*) FROM new_rows WHERE status = 'Pending');
+    END IF;
+    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+        delta := delta - (SELECT COUNT(*) FROM old_rows WHERE status = 'Pending');
+    END IF;
+    PERFORM portal_stats_add('docs_pending', delta);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION portal_stats_visa_pending()
+RETURNS trigger AS $$
+DECLARE
+    delta BIGINT := 0;
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        delta := delta + (SELECT COUNT(*) FROM new_rows WHERE application_status = 'Pending');
+    END IF;
+    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+        delta := delta - (SELECT COUNT(*) FROM old_rows WHERE application_status = 'Pending');
+    END IF;
+    PERFORM portal_stats_add('visa_pending', delta);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION portal_stats_housing_available()
+RETURNS trigger AS $$
+DECLARE
+    delta BIGINT := 0;
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        delta := delta + (SELECT COUNT(*) FROM new_rows WHERE availability = TRUE);
+    END IF;
+    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+        delta := delta - (SELECT COUNT(*) FROM old_rows WHERE availability = TRUE);
+    END IF;
+    PERFORM portal_stats_add('housing_available', delta);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Transition tables only allow one event per trigger, hence the repetition.
+CREATE TRIGGER trg_stats_student_ins AFTER INSERT ON Student
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION portal_stats_count_rows('students');
+CREATE TRIGGER trg_stats_student_del AFTER DELETE ON Student
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION portal_stats_count_rows('students');
+
+CREATE TRIGGER trg_stats_mentor_ins AFTER INSERT ON Mentor
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION portal_stats_count_rows('mentors');
+CREATE TRIGGER trg_stats_mentor_del AFTER DELETE ON Mentor
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION portal_stats_count_rows('mentors');
+
+CREATE TRIGGER trg_stats_program_ins AFTER INSERT ON Program
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION portal_stats_count_rows('programs');
+CREATE TRIGGER trg_stats_program_del AFTER DELETE ON Program
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION portal_stats_count_rows('programs');
+
+CREATE TRIGGER trg_stats_application_ins AFTER INSERT ON Application
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION portal_stats_count_rows('applications');
+CREATE TRIGGER trg_stats_application_del AFTER DELETE ON Application
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION portal_stats_count_rows('applications');
+
+CREATE TRIGGER trg_stats_scholarship_ins AFTER INSERT ON Scholarship
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION portal_stats_count_rows('scholarships');
+CREATE TRIGGER trg_stats_scholarship_del AFTER DELETE ON Scholarship
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION portal_stats_count_rows('scholarships');
+
+CREATE TRIGGER trg_stats_app_doc_ins AFTER INSERT ON ApplicationDocument
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION portal_stats_docs_pending();
+CREATE TRIGGER trg_stats_app_doc_upd AFTER UPDATE ON ApplicationDocument
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION portal_stats_docs_pending();
+CREATE TRIGGER trg_stats_app_doc_del AFTER DELETE ON ApplicationDocument
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION portal_stats_docs_pending();
+
+CREATE TRIGGER trg_stats_visa_ins AFTER INSERT ON VisaPermit
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION portal_stats_visa_pending();
+CREATE TRIGGER trg_stats_visa_upd AFTER UPDATE ON VisaPermit
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION portal_stats_visa_pending();
+CREATE TRIGGER trg_stats_visa_del AFTER DELETE ON VisaPermit
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION portal_stats_visa_pending();
+
+CREATE TRIGGER trg_stats_housing_ins AFTER INSERT ON Housing
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION portal_stats_housing_available();
+CREATE TRIGGER trg_stats_housing_upd AFTER UPDATE ON Housing
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION portal_stats_housing_available();
+CREATE TRIGGER trg_stats_housing_del AFTER DELETE ON Housing
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION portal_stats_housing_available();
+
+-- Seed with exact values; same queries as app/stats.py uses to reconcile.
+INSERT INTO PortalStats (stat_name, value, reconciled_at)
+SELECT 'students', COUNT(*), NOW() FROM Student
+UNION ALL SELECT 'mentors', COUNT(*), NOW() FROM Mentor
+UNION ALL SELECT 'programs', COUNT(*), NOW() FROM Program
+UNION ALL SELECT 'applications', COUNT(*), NOW() FROM Application
+UNION ALL SELECT 'scholarships', COUNT(*), NOW() FROM Scholarship
+UNION ALL SELECT 'docs_pending', COUNT(*), NOW() FROM ApplicationDocument WHERE status = 'Pending'
+UNION ALL SELECT 'visa_pending', COUNT(*), NOW() FROM VisaPermit WHERE application_status = 'Pending'
+UNION ALL SELECT 'housing_available', COUNT(*), NOW() FROM Housing WHERE availability = TRUE
+ON CONFLICT (stat_name) DO NOTHING;
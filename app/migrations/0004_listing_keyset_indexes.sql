@@ -0,0 +1,11 @@
+-- Composite indexes matching the (filter, sort key) pairs used by the
+-- paginated listing pages, so each page is a single index range scan. The
+-- (foreign key, id) pairs are in 0002.
+CREATE INDEX IF NOT EXISTS idx_application_status_id ON Application (status, application_id);
+
+CREATE INDEX IF NOT EXISTS idx_visa_status_id ON VisaPermit (application_status, visa_id);
+CREATE INDEX IF NOT EXISTS idx_visa_country_id ON VisaPermit (country, visa_id);
+
+CREATE INDEX IF NOT EXISTS idx_housing_request_status_date ON HousingRequest (status, request_date, request_id);
+
+CREATE INDEX IF NOT EXISTS idx_sch_app_status_id ON ScholarshipApplication (status, sch_app_id);
@@ -0,0 +1,54 @@
+-- One row per login identity across Student, Mentor and Admin. The unique
+-- index on lower(email) lets login resolve the role with a single probe and
+-- stops the same address being registered under two roles.
+CREATE TABLE IF NOT EXISTS Account (
+    role VARCHAR(10) NOT NULL,
+    principal_id INT NOT NULL,
+    email VARCHAR(120) NOT NULL,
+    PRIMARY KEY (role, principal_id)
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_account_email ON Account (lower(email));
+
+-- Backfill in the order the old login probed the tables, so any existing
+-- cross-role duplicate keeps resolving to the same account it did before.
+INSERT INTO Account (role, principal_id, email)
+SELECT 'student', student_id, email FROM Student ORDER BY student_id
+ON CONFLICT ((lower(email))) DO NOTHING;
+
+INSERT INTO Account (role, principal_id, email)
+SELECT 'mentor', mentor_id, email FROM Mentor ORDER BY mentor_id
+ON CONFLICT ((lower(email))) DO NOTHING;
+
+INSERT INTO Account (role, principal_id, email)
+SELECT 'admin', admin_id, email FROM Admin ORDER BY admin_id
+ON CONFLICT ((lower(email))) DO NOTHING;
+
+-- TG_ARGV[0] is the role, TG_ARGV[1] the table's id column.
+CREATE OR REPLACE FUNCTION account_sync()
+RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO Account (role, principal_id, email)
+        VALUES (TG_ARGV[0], (to_jsonb(NEW) ->> TG_ARGV[1])::INT, NEW.email);
+    ELSIF TG_OP = 'UPDATE' THEN
+        IF NEW.email IS DISTINCT FROM OLD.email THEN
+            UPDATE Account SET email = NEW.email
+            WHERE role = TG_ARGV[0]
+              AND principal_id = (to_jsonb(NEW) ->> TG_ARGV[1])::INT;
+        END IF;
+    ELSE
+        DELETE FROM Account
+        WHERE role = TG_ARGV[0]
+          AND principal_id = (to_jsonb(OLD) ->> TG_ARGV[1])::INT;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_account_student AFTER INSERT OR UPDATE OF email OR DELETE ON Student
+    FOR EACH ROW EXECUTE FUNCTION account_sync('student', 'student_id');
+CREATE TRIGGER trg_account_mentor AFTER INSERT OR UPDATE OF email OR DELETE ON Mentor
+    FOR EACH ROW EXECUTE FUNCTION account_sync('mentor', 'mentor_id');
+CREATE TRIGGER trg_account_admin AFTER INSERT OR UPDATE OF email OR DELETE ON Admin
+    FOR EACH ROW EXECUTE FUNCTION account_sync('admin', 'admin_id');
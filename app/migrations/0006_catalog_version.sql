@@ -0,0 +1,26 @@
+-- Single-row version counter for the student program catalog. Anything that
+-- changes what /student/programs shows bumps it; app/catalog.py uses it as the
+-- cache key and ETag.
+CREATE TABLE IF NOT EXISTS CatalogVersion (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    version BIGINT NOT NULL DEFAULT 1,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+INSERT INTO CatalogVersion (id) VALUES (TRUE) ON CONFLICT DO NOTHING;
+
+CREATE OR REPLACE FUNCTION catalog_version_bump()
+RETURNS trigger AS $$
+BEGIN
+    UPDATE CatalogVersion SET version = version + 1, updated_at = NOW();
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_catalog_program AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON Program
+    FOR EACH STATEMENT EXECUTE FUNCTION catalog_version_bump();
+-- The listing shows university and mentor names.
+CREATE TRIGGER trg_catalog_university AFTER UPDATE OF name OR DELETE ON University
+    FOR EACH STATEMENT EXECUTE FUNCTION catalog_version_bump();
+CREATE TRIGGER trg_catalog_mentor AFTER UPDATE OF name OR DELETE ON Mentor
+    FOR EACH STATEMENT EXECUTE FUNCTION catalog_version_bump();
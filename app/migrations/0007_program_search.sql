@@ -0,0 +1,12 @@
+-- Weighted full-text document for program search: title ranks highest, then
+-- program type, description and eligibility.
+ALTER TABLE Program ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(program_type, '')), 'B') ||
+        setweight(to_tsvector('english', coalesce(description, '')), 'C') ||
+        setweight(to_tsvector('english', coalesce(eligibility, '')), 'D')
+    ) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_program_search ON Program USING GIN (search_vector);
+CREATE INDEX IF NOT EXISTS idx_program_duration ON Program (duration);
@@ -0,0 +1,44 @@
+-- Content-addressed upload store (see app/storage.py). One row per distinct
+-- blob; ref_count is the number of ApplicationDocument rows pointing at it and
+-- is maintained by the trigger below.
+CREATE TABLE IF NOT EXISTS StoredFile (
+    file_id SERIAL PRIMARY KEY,
+    sha256 CHAR(64) UNIQUE NOT NULL,
+    size BIGINT NOT NULL,
+    ext VARCHAR(10),
+    path VARCHAR(255) NOT NULL,
+    ref_count INT NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT NOW(),
+    last_seen TIMESTAMP DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_stored_file_unreferenced ON StoredFile (last_seen)
+    WHERE ref_count = 0;
+
+ALTER TABLE ApplicationDocument
+    ADD COLUMN IF NOT EXISTS file_id INT REFERENCES StoredFile(file_id);
+
+CREATE INDEX IF NOT EXISTS idx_app_doc_file ON ApplicationDocument (file_id);
+
+CREATE OR REPLACE FUNCTION stored_file_refcount()
+RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.file_id IS NOT NULL THEN
+        UPDATE StoredFile SET ref_count = ref_count - 1, last_seen = NOW()
+        WHERE file_id = OLD.file_id;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.file_id IS NOT NULL THEN
+        UPDATE StoredFile SET ref_count = ref_count + 1, last_seen = NOW()
+        WHERE file_id = NEW.file_id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_app_doc_refcount_ins AFTER INSERT ON ApplicationDocument
+    FOR EACH ROW EXECUTE FUNCTION stored_file_refcount();
+CREATE TRIGGER trg_app_doc_refcount_upd AFTER UPDATE OF file_id ON ApplicationDocument
+    FOR EACH ROW WHEN (OLD.file_id IS DISTINCT FROM NEW.file_id)
+    EXECUTE FUNCTION stored_file_refcount();
+CREATE TRIGGER trg_app_doc_refcount_del AFTER DELETE ON ApplicationDocument
+    FOR EACH ROW EXECUTE FUNCTION stored_file_refcount();
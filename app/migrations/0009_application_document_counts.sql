@@ -0,0 +1,76 @@
+-- Per-application document counters, so auto-approval and the dashboards read
+-- one Application row instead of aggregating its ApplicationDocument rows.
+-- Kept exact by the statement-level triggers below; ON CONFLICT re-uploads
+-- fire the UPDATE trigger and move the document back to pending.
+ALTER TABLE Application
+    ADD COLUMN IF NOT EXISTS docs_total INT NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS docs_approved INT NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS docs_rejected INT NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS docs_pending INT NOT NULL DEFAULT 0;
+
+CREATE OR REPLACE FUNCTION application_doc_counts_add(
+    p_application_id INT, p_status TEXT, p_delta BIGINT)
+RETURNS void AS $$
+BEGIN
+    IF p_delta <> 0 THEN
+        UPDATE Application
+        SET docs_total = docs_total + p_delta,
+            docs_approved = docs_approved + CASE WHEN p_status = 'Approved' THEN p_delta ELSE 0 END,
+            docs_rejected = docs_rejected + CASE WHEN p_status = 'Rejected' THEN p_delta ELSE 0 END,
+            docs_pending = docs_pending + CASE WHEN p_status = 'Pending' THEN p_delta ELSE 0 END
+        WHERE application_id = p_application_id;
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION application_doc_counts()
+RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM application_doc_counts_add(application_id, status, COUNT(*))
+        FROM new_rows
+        GROUP BY application_id, status;
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM application_doc_counts_add(application_id, status, -COUNT(*))
+        FROM old_rows
+        GROUP BY application_id, status;
+    ELSE
+        -- Updates that leave status alone (e.g. a new file_id) net out to zero.
+        PERFORM application_doc_counts_add(application_id, status, SUM(delta))
+        FROM (
+            SELECT application_id, status, 1 AS delta FROM new_rows
+            UNION ALL
+            SELECT application_id, status, -1 AS delta FROM old_rows
+        ) changes
+        GROUP BY application_id, status
+        HAVING SUM(delta) <> 0;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_app_doc_counts_ins AFTER INSERT ON ApplicationDocument
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION application_doc_counts();
+CREATE TRIGGER trg_app_doc_counts_upd AFTER UPDATE ON ApplicationDocument
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION application_doc_counts();
+CREATE TRIGGER trg_app_doc_counts_del AFTER DELETE ON ApplicationDocument
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION application_doc_counts();
+
+UPDATE Application a
+SET docs_total = d.total,
+    docs_approved = d.approved,
+    docs_rejected = d.rejected,
+    docs_pending = d.pending
+FROM (
+    SELECT application_id,
+           COUNT(*) AS total,
+           COUNT(*) FILTER (WHERE status = 'Approved') AS approved,
+           COUNT(*) FILTER (WHERE status = 'Rejected') AS rejected,
+           COUNT(*) FILTER (WHERE status = 'Pending') AS pending
+    FROM ApplicationDocument
+    GROUP BY application_id
+) d
+WHERE a.application_id = d.application_id;
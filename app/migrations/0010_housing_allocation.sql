@@ -0,0 +1,9 @@
+-- Housing requests may name a room type; NULL means any room will do.
+ALTER TABLE HousingRequest ADD COLUMN IF NOT EXISTS room_type VARCHAR(50);
+
+-- The allocator (app/housing.py) looks for the lowest free room at the
+-- student's university, optionally of one room type. This index serves both
+-- shapes of that lookup, so the older (university_id, housing_id) one goes.
+CREATE INDEX IF NOT EXISTS idx_housing_available_type ON Housing (university_id, room_type, housing_id)
+    WHERE availability = TRUE;
+DROP INDEX IF EXISTS idx_housing_available;
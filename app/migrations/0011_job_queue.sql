@@ -0,0 +1,33 @@
+-- Background job queue (see app/jobs.py). A job is ready when it is queued
+-- and its run_at has passed. While a worker runs it, run_at holds the
+-- visibility deadline: a running job whose run_at has passed belongs to a
+-- worker that died or stalled, and may be claimed again.
+CREATE TABLE IF NOT EXISTS Job (
+    job_id BIGSERIAL PRIMARY KEY,
+    kind VARCHAR(100) NOT NULL,
+    payload JSONB NOT NULL DEFAULT '{}',
+    status VARCHAR(20) NOT NULL DEFAULT 'queued',  -- queued, running, done, failed
+    attempts INT NOT NULL DEFAULT 0,
+    max_attempts INT NOT NULL DEFAULT 5,
+    run_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    locked_by VARCHAR(100),
+    last_error TEXT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    finished_at TIMESTAMPTZ
+);
+
+CREATE INDEX IF NOT EXISTS idx_job_ready ON Job (run_at)
+    WHERE status IN ('queued', 'running');
+
+-- Wake idle workers when work is queued. NOTIFY is delivered on commit and
+-- identical notifications in one transaction are folded into one.
+CREATE OR REPLACE FUNCTION job_notify()
+RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('job_queue', '');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_job_notify AFTER INSERT ON Job
+    FOR EACH STATEMENT EXECUTE FUNCTION job_notify();
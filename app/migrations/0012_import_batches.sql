@@ -0,0 +1,16 @@
+-- Bulk CSV imports (see app/importer.py). One row per uploaded file; the
+-- import itself runs as a background job and fills in the report.
+CREATE TABLE IF NOT EXISTS ImportBatch (
+    import_id SERIAL PRIMARY KEY,
+    kind VARCHAR(20) NOT NULL,
+    filename VARCHAR(255),
+    path VARCHAR(255) NOT NULL,
+    job_id BIGINT REFERENCES Job(job_id) ON DELETE SET NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'queued',  -- queued, done, failed
+    total_rows INT,
+    imported_rows INT,
+    error_count INT,
+    errors JSONB,
+    created_at TIMESTAMP DEFAULT NOW(),
+    finished_at TIMESTAMP
+);
@@ -0,0 +1,140 @@
+import base64
+import json
+import psycopg2
+from flask import request, url_for, abort
+
+PAGE_SIZE_DEFAULT = 50
+PAGE_SIZE_MAX = 200
+
+
+def encode_cursor(values):
+    raw = json.dumps(values, default=str, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    # Cursors come back from the client: anything that doesn't decode to a
+    # list of scalars (the only thing encode_cursor produces) is ignored and
+    # the listing starts from the first page.
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        values = json.loads(raw)
+    except ValueError:
+        return None
+    if not isinstance(values, list):
+        return None
+    if not all(isinstance(v, (str, int, float)) for v in values):
+        return None
+    return values
+
+
+def page_size(args):
+    try:
+        size = int(args.get("per_page", PAGE_SIZE_DEFAULT))
+    except ValueError:
+        size = PAGE_SIZE_DEFAULT
+    return max(1, min(size, PAGE_SIZE_MAX))
+
+
+class Page:
+    def __init__(self, rows, next_cursor, order, filters):
+        self.rows = rows
+        self.next_cursor = next_cursor
+        self.order = order
+        self.filters = filters
+
+    def url(self, **overrides):
+        args = request.args.to_dict()
+        args.update(overrides)
+        args = {k: v for k, v in args.items() if v not in (None, "")}
+        return url_for(request.endpoint, **request.view_args, **args)
+
+    @property
+    def is_first(self):
+        return not request.args.get("after")
+
+    @property
+    def first_url(self):
+        return self.url(after=None)
+
+    @property
+    def next_url(self):
+        return self.url(after=self.next_cursor)
+
+    @property
+    def clear_url(self):
+        return url_for(request.endpoint, **request.view_args, order=self.order)
+
+    @property
+    def toggle_order_url(self):
+        return self.url(after=None, order="asc" if self.order == "desc" else "desc")
+
+
+def paginate(cur, select, keys, where=(), params=(), filters=None, default_order="asc"):
+    # Keyset ("seek") pagination: instead of OFFSET, the next page starts
+    # strictly after the last row of this one, so every page costs the same
+    # index range scan no matter how deep the user goes.
+    #
+    # select  - the query up to (not including) WHERE
+    # keys    - [(sql_expr, column_name)], a unique ordering; the cursor holds
+    #           the last row's values for these columns
+    # filters - {arg_name: sql_condition} or {arg_name: (sql_condition, type)};
+    #           applied when the arg is present and converts cleanly
+    args = request.args
+    order = args.get("order")
+    if order not in ("asc", "desc"):
+        order = default_order
+    size = page_size(args)
+
+    conds = list(where)
+    qparams = list(params)
+
+    active = {}
+    for name, cond in (filters or {}).items():
+        cond, conv = cond if isinstance(cond, tuple) else (cond, str)
+        value = args.get(name, "").strip()
+        if not value:
+            continue
+        try:
+            qparams.append(conv(value))
+        except ValueError:
+            continue
+        conds.append(cond)
+        active[name] = value
+
+    after = decode_cursor(args.get("after"))
+    seek = bool(after) and len(after) == len(keys)
+    if seek:
+        conds.append("(%s) %s (%s)" % (
+            ", ".join(expr for expr, _ in keys),
+            "<" if order == "desc" else ">",
+            ", ".join(["%s"] * len(keys))
+        ))
+        qparams.extend(after)
+
+    query = select
+    if conds:
+        query += " WHERE " + " AND ".join(conds)
+    query += " ORDER BY " + ", ".join(
+        "%s %s" % (expr, order.upper()) for expr, _ in keys)
+    query += " LIMIT %s"
+    qparams.append(size + 1)
+
+    try:
+        cur.execute(query, qparams)
+    except psycopg2.DataError:
+        # A well-formed cursor whose values don't fit the key columns
+        # (edited by hand, or from a different listing).
+        if not seek:
+            raise
+        abort(400, description="Invalid page cursor.")
+    rows = cur.fetchall()
+
+    next_cursor = None
+    if len(rows) > size:
+        rows = rows[:size]
+        next_cursor = encode_cursor([rows[-1][col] for _, col in keys])
+
+    return Page(rows, next_cursor, order, active)
@@ -0,0 +1,158 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from werkzeug.security import generate_password_hash, check_password_hash
+from config import (PASSWORD_HASH_METHOD, PASSWORD_POOL_WORKERS,
+                    PASSWORD_QUEUE_MAX, PASSWORD_TIMEOUT)
+
+
+class PasswordServiceBusy(Exception):
+    pass
+
+
+# scrypt is deliberately slow and holds the GIL while it runs, so hashing on
+# the request thread stalls every other request in the worker. Hashes run in
+# a small process pool instead; at most PASSWORD_QUEUE_MAX calls may be queued
+# or running at once, beyond that callers are turned away immediately.
+
+def _hash(password, method):
+    started = time.time()
+    result = generate_password_hash(password, method=method)
+    return result, started, time.time()
+
+
+def _verify(pw_hash, password):
+    started = time.time()
+    result = check_password_hash(pw_hash, password)
+    return result, started, time.time()
+
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(PASSWORD_QUEUE_MAX)
+
+_metrics_lock = threading.Lock()
+_metrics = {
+    "completed": 0,
+    "rejected": 0,
+    "timeouts": 0,
+    "queue_wait_total": 0.0,
+    "queue_wait_max": 0.0,
+    "compute_total": 0.0,
+    "compute_max": 0.0,
+}
+
+
+def _get_executor():
+    global _executor, _executor_pid
+    if _executor is None or _executor_pid != os.getpid():
+        with _executor_lock:
+            if _executor is None or _executor_pid != os.getpid():
+                # spawn, not fork: forking a multi-threaded server process can
+                # copy held locks into the children.
+                _executor = ProcessPoolExecutor(
+                    max_workers=PASSWORD_POOL_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+                _executor_pid = os.getpid()
+    return _executor
+
+
+def _discard_executor(executor):
+    # A pool whose child died (OOM, kill) is broken for good; drop it so the
+    # next call builds a fresh one. Other threads may have seen the same
+    # breakage, so only the executor that failed is discarded.
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _record(key, amount=1):
+    with _metrics_lock:
+        _metrics[key] += amount
+
+
+def _record_timing(submitted, started, finished):
+    wait = max(0.0, started - submitted)
+    compute = finished - started
+    with _metrics_lock:
+        _metrics["completed"] += 1
+        _metrics["queue_wait_total"] += wait
+        _metrics["queue_wait_max"] = max(_metrics["queue_wait_max"], wait)
+        _metrics["compute_total"] += compute
+        _metrics["compute_max"] = max(_metrics["compute_max"], compute)
+
+
+def _run(fn, *args):
+    if PASSWORD_POOL_WORKERS == 0:
+        submitted = time.time()
+        result, started, finished = fn(*args)
+        _record_timing(submitted, started, finished)
+        return result
+
+    if not _slots.acquire(blocking=False):
+        _record("rejected")
+        raise PasswordServiceBusy("password hashing queue is full")
+
+    submitted = time.time()
+    executor = _get_executor()
+    try:
+        future = executor.submit(fn, *args)
+    except BrokenProcessPool:
+        _slots.release()
+        _discard_executor(executor)
+        raise PasswordServiceBusy("password hashing pool was restarted")
+    except Exception:
+        _slots.release()
+        raise
+    future.add_done_callback(lambda _: _slots.release())
+
+    try:
+        result, started, finished = future.result(timeout=PASSWORD_TIMEOUT)
+    except FutureTimeout:
+        future.cancel()
+        _record("timeouts")
+        raise PasswordServiceBusy("password hashing timed out")
+    except BrokenProcessPool:
+        _discard_executor(executor)
+        raise PasswordServiceBusy("password hashing pool was restarted")
+
+    _record_timing(submitted, started, finished)
+    return result
+
+
+def hash_password(password):
+    return _run(_hash, password, PASSWORD_HASH_METHOD)
+
+
+def needs_rehash(pw_hash):
+    return pw_hash.split("$", 1)[0] != PASSWORD_HASH_METHOD
+
+
+def verify_password(pw_hash, password):
+    # Returns (ok, new_hash). new_hash is set when the password was right but
+    # the stored hash uses old parameters; the caller should store it.
+    if not _run(_verify, pw_hash, password):
+        return False, None
+    if needs_rehash(pw_hash):
+        try:
+            return True, hash_password(password)
+        except PasswordServiceBusy:
+            pass
+    return True, None
+
+
+def metrics():
+    with _metrics_lock:
+        snapshot = dict(_metrics)
+    done = snapshot["completed"] or 1
+    snapshot["queue_wait_avg"] = snapshot["queue_wait_total"] / done
+    snapshot["compute_avg"] = snapshot["compute_total"] / done
+    snapshot["queue_depth"] = PASSWORD_QUEUE_MAX - _slots._value
+    return snapshot
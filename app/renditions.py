@@ -0,0 +1,151 @@
+import argparse
+import multiprocessing
+import os
+import shutil
+import subprocess
+import tempfile
+from app import storage, jobs
+from app.db import get_conn
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# Small previews so mentors can see what a document is without downloading
+# it. Renditions sit next to the blob they were made from
+# (objects/ab/cd/<sha256>.pdf.thumb.jpg) and, like the blob, never change, so
+# each one is rendered once no matter how many documents share the content.
+#
+#   thumb   - first page / image fitted into THUMB_SIZE
+#   preview - images only, downscaled to PREVIEW_MAX on the long side
+
+KINDS = ("thumb", "preview")
+THUMB_SIZE = (240, 320)
+PREVIEW_MAX = 1280
+IMAGE_EXT = {"jpg", "jpeg", "png"}
+
+
+def rendition_path(path, kind):
+    return storage.absolute_path(path) + "." + kind + ".jpg"
+
+
+def _save_jpeg(img, dest):
+    tmp = dest + ".tmp"
+    img.convert("RGB").save(tmp, "JPEG", quality=80, optimize=True)
+    os.replace(tmp, dest)
+
+
+def _first_page(src, out_dir):
+    # poppler's pdftoppm renders just page 1; returns None when unavailable.
+    if not shutil.which("pdftoppm"):
+        return None
+    prefix = os.path.join(out_dir, "page")
+    subprocess.run(
+        ["pdftoppm", "-f", "1", "-l", "1", "-singlefile", "-jpeg",
+         "-scale-to", str(PREVIEW_MAX), src, prefix],
+        check=True, capture_output=True, timeout=60
+    )
+    return prefix + ".jpg"
+
+
+def render(path, ext):
+    # Runs in a worker process. Returns the kinds it produced.
+    if Image is None:
+        return []
+
+    src = storage.absolute_path(path)
+    made = []
+
+    if ext in IMAGE_EXT:
+        with Image.open(src) as img:
+            img.draft("RGB", (PREVIEW_MAX, PREVIEW_MAX))
+            preview = img.copy()
+        preview.thumbnail((PREVIEW_MAX, PREVIEW_MAX))
+        _save_jpeg(preview, rendition_path(path, "preview"))
+        made.append("preview")
+        source = preview
+    elif ext == "pdf":
+        with tempfile.TemporaryDirectory() as tmp:
+            page = _first_page(src, tmp)
+            if page is None:
+                return made
+            with Image.open(page) as img:
+                source = img.copy()
+    else:
+        return made
+
+    source.thumbnail(THUMB_SIZE)
+    _save_jpeg(source, rendition_path(path, "thumb"))
+    made.append("thumb")
+    return made
+
+
+def render_quietly(path, ext):
+    # A corrupt or truncated file should cost its own preview, not the
+    # whole backfill.
+    try:
+        return render(path, ext)
+    except Exception:
+        return []
+
+
+def missing(path, ext):
+    wanted = ["thumb"] + (["preview"] if ext in IMAGE_EXT else [])
+    return [k for k in wanted if not os.path.exists(rendition_path(path, k))]
+
+
+def queue(cur, path, ext):
+    # Queues a job worker to render the blob, unless one is already waiting
+    # for it. Call after the blob is published, in a transaction of its own:
+    # losing the job only costs the preview, which backfill restores.
+    if Image is None or not missing(path, ext):
+        return False
+    cur.execute("""
+        SELECT 1 FROM Job
+        WHERE kind = 'renditions.render'
+          AND status IN ('queued', 'running')
+          AND payload->>'path' = %s
+    """, (path,))
+    if cur.fetchone():
+        return False
+    jobs.enqueue(cur, "renditions.render", {"path": path, "ext": ext})
+    return True
+
+
+@jobs.handler("renditions.render")
+def render_job(cur, payload):
+    # Unlike render_quietly, failures propagate so the queue retries them.
+    render(payload["path"], payload["ext"])
+
+
+def backfill(workers=None):
+    conn = get_conn()
+    cur = conn.cursor(name="rendition_backfill")
+    cur.execute("SELECT path, ext FROM StoredFile WHERE ext IN ('pdf', 'jpg', 'jpeg', 'png')")
+    todo = [(path, ext) for path, ext in cur if missing(path, ext)]
+    cur.close()
+    conn.close()
+
+    ctx = multiprocessing.get_context("spawn")
+    done = 0
+    with ctx.Pool(workers or os.cpu_count()) as pool:
+        for made in pool.starmap(render_quietly, todo, chunksize=16):
+            done += bool(made)
+    return done, len(todo)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Document preview renditions.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    bf = sub.add_parser("backfill", help="render previews missing for stored files")
+    bf.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.command == "backfill":
+        done, total = backfill(args.workers)
+        print("Rendered %d of %d documents missing previews." % (done, total))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+import argparse
+import time
+from app.db import get_conn
+from app import jobs
+
+# Exact definitions of the PortalStats counters. The triggers from
+# migrations/0003_portal_stats.sql keep them current; reconcile() recomputes
+# them from scratch to correct any drift (e.g. after a TRUNCATE or a manual
+# fix in psql that disabled triggers). The same goes for the per-application
+# document counters on Application.
+STAT_QUERIES = {
+    "students": "SELECT COUNT(*) FROM Student",
+    "mentors": "SELECT COUNT(*) FROM Mentor",
+    "programs": "SELECT COUNT(*) FROM Program",
+    "applications": "SELECT COUNT(*) FROM Application",
+    "scholarships": "SELECT COUNT(*) FROM Scholarship",
+    "docs_pending": "SELECT COUNT(*) FROM ApplicationDocument WHERE status='Pending'",
+    "visa_pending": "SELECT COUNT(*) FROM VisaPermit WHERE application_status='Pending'",
+    "housing_available": "SELECT COUNT(*) FROM Housing WHERE availability=TRUE",
+}
+
+
+DOC_COUNTS = """
+    SELECT app.application_id,
+           COUNT(ad.app_doc_id) AS total,
+           COUNT(*) FILTER (WHERE ad.status = 'Approved') AS approved,
+           COUNT(*) FILTER (WHERE ad.status = 'Rejected') AS rejected,
+           COUNT(*) FILTER (WHERE ad.status = 'Pending') AS pending
+    FROM Application app
+    LEFT JOIN ApplicationDocument ad ON ad.application_id = app.application_id
+    {}
+    GROUP BY app.application_id
+"""
+
+DOC_COUNT_DRIFT = """
+    SELECT a.application_id
+    FROM Application a
+    JOIN ({}) d ON d.application_id = a.application_id
+    WHERE (a.docs_total, a.docs_approved, a.docs_rejected, a.docs_pending)
+          IS DISTINCT FROM (d.total, d.approved, d.rejected, d.pending)
+""".format(DOC_COUNTS.format(""))
+
+DOC_COUNT_FIX = """
+    UPDATE Application a
+    SET docs_total = d.total,
+        docs_approved = d.approved,
+        docs_rejected = d.rejected,
+        docs_pending = d.pending
+    FROM ({}) d
+    WHERE a.application_id = d.application_id
+      AND (a.docs_total, a.docs_approved, a.docs_rejected, a.docs_pending)
+          IS DISTINCT FROM (d.total, d.approved, d.rejected, d.pending)
+""".format(DOC_COUNTS.format("WHERE app.application_id = ANY(%s)"))
+
+
+def read_stats(cur):
+    cur.execute("SELECT stat_name, value FROM PortalStats")
+    stats = dict.fromkeys(STAT_QUERIES, 0)
+    stats.update((name, value) for name, value in cur.fetchall())
+    return stats
+
+
+def reconcile(cur):
+    # Runs in the caller's transaction; the caller commits.
+    drift = {}
+
+    # Count without holding any counter lock: each counter and its stored
+    # value are read in one statement, so both come from the same snapshot.
+    # Writers that commit afterwards have moved the stored value by exactly
+    # their own delta, so value + (exact - snapshot) is exact when applied.
+    # The counter rows are only locked by the short UPDATEs at the end, after
+    # the (equally lock-free) search for drifted document counters.
+    corrections = {}
+    for name, query in STAT_QUERIES.items():
+        cur.execute("""
+            SELECT (SELECT value FROM PortalStats WHERE stat_name = %%s), (%s)
+        """ % query, (name,))
+        snapshot, exact = cur.fetchone()
+        corrections[name] = exact - (snapshot or 0)
+
+    # Per-application document counters (migrations/0009). Find the drifted
+    # rows without locking anything, then lock just those and recount them:
+    # the triggers update a row's counters in the same transaction as its
+    # documents, so once the row is locked the recount is exact.
+    cur.execute(DOC_COUNT_DRIFT)
+    drifted = [row[0] for row in cur.fetchall()]
+    if drifted:
+        cur.execute("""
+            SELECT application_id FROM Application
+            WHERE application_id = ANY(%s)
+            ORDER BY application_id
+            FOR UPDATE
+        """, (drifted,))
+        cur.execute(DOC_COUNT_FIX, (drifted,))
+        if cur.rowcount:
+            drift["application_doc_counts"] = cur.rowcount
+
+    for name, delta in corrections.items():
+        cur.execute("""
+            INSERT INTO PortalStats (stat_name, value) VALUES (%s, 0)
+            ON CONFLICT (stat_name) DO NOTHING
+        """, (name,))
+        cur.execute("""
+            UPDATE PortalStats
+            SET value = value + %s, reconciled_at = NOW()
+            WHERE stat_name = %s
+        """, (delta, name))
+        if delta:
+            drift[name] = delta
+
+    return drift
+
+
+@jobs.handler("stats.reconcile")
+def reconcile_job(cur, payload):
+    reconcile(cur)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recompute admin dashboard counters.")
+    parser.add_argument("--interval", type=int, default=0,
+                        help="keep running, reconciling every N seconds")
+    args = parser.parse_args()
+
+    while True:
+        conn = get_conn()
+        cur = conn.cursor()
+        drift = reconcile(cur)
+        conn.commit()
+        cur.close()
+        conn.close()
+        if drift:
+            print("Corrected drift: " + ", ".join(
+                "%s %+d" % (name, delta) for name, delta in sorted(drift.items())))
+        else:
+            print("Counters are exact.")
+
+        if not args.interval:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
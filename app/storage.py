@@ -0,0 +1,243 @@
+import argparse
+import hashlib
+import mimetypes
+import os
+import tempfile
+from flask import request, send_file, make_response
+from app.db import get_conn
+from app import jobs
+from config import DOCUMENT_STORE, DOCUMENT_OFFLOAD, DOCUMENT_ACCEL_PREFIX
+
+CHUNK_SIZE = 64 * 1024
+
+# Flat directory used before the content-addressed store. It sits under
+# app/static but is not served from there (see create_app); migrate_legacy()
+# moves its files into the store.
+LEGACY_UPLOADS = os.path.join(os.path.dirname(__file__), "static", "uploads")
+
+# Uploaded documents are stored by content: the SHA-256 of the bytes names
+# the file, and the first two byte pairs shard it into 65536 directories so
+# no single directory grows without bound. Identical uploads share one blob;
+# StoredFile.ref_count (kept by triggers on ApplicationDocument) says how many
+# documents still point at it, and gc() removes blobs nobody references.
+
+
+class StagedBlob:
+    def __init__(self, sha256, size, ext, tmp_path):
+        self.sha256 = sha256
+        self.size = size
+        self.ext = ext
+        self.tmp_path = tmp_path
+        self.stored_path = None
+
+    @property
+    def path(self):
+        return blob_path(self.sha256, self.ext)
+
+
+def blob_path(sha256, ext):
+    name = sha256 + ("." + ext if ext else "")
+    return "/".join((sha256[:2], sha256[2:4], name))
+
+
+def absolute_path(path):
+    return os.path.join(DOCUMENT_STORE, *path.split("/"))
+
+
+class BlobWriter:
+    # Hashes while copying to a temp file inside the store, so the final
+    # os.replace() is an atomic rename on the same filesystem.
+
+    def __init__(self, ext):
+        tmp_dir = os.path.join(DOCUMENT_STORE, "tmp")
+        os.makedirs(tmp_dir, exist_ok=True)
+        fd, self.tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        self.out = os.fdopen(fd, "wb")
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self.ext = ext
+
+    def write(self, chunk):
+        self.digest.update(chunk)
+        self.size += len(chunk)
+        self.out.write(chunk)
+
+    def finish(self):
+        self.out.close()
+        return StagedBlob(self.digest.hexdigest(), self.size, self.ext, self.tmp_path)
+
+    def abort(self):
+        self.out.close()
+        try:
+            os.unlink(self.tmp_path)
+        except FileNotFoundError:
+            pass
+
+
+def stage(stream, ext):
+    writer = BlobWriter(ext)
+    try:
+        while True:
+            chunk = stream.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            writer.write(chunk)
+    except BaseException:
+        writer.abort()
+        raise
+    return writer.finish()
+
+
+def register(cur, blob):
+    # Upsert the StoredFile row. On a duplicate this takes the row lock and
+    # refreshes last_seen, which keeps gc() away from it.
+    cur.execute("""
+        INSERT INTO StoredFile (sha256, size, ext, path)
+        VALUES (%s, %s, %s, %s)
+        ON CONFLICT (sha256) DO UPDATE SET last_seen = NOW()
+        RETURNING file_id, path
+    """, (blob.sha256, blob.size, blob.ext, blob.path))
+    file_id, path = cur.fetchone()
+    blob.stored_path = path
+    return file_id
+
+
+def publish(blob):
+    # Called after the transaction that references the blob has committed.
+    # Renaming over an existing identical blob is harmless and guarantees the
+    # file exists even if gc() removed it moments before.
+    dest = absolute_path(blob.stored_path or blob.path)
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    os.replace(blob.tmp_path, dest)
+
+
+def discard(blob):
+    try:
+        os.unlink(blob.tmp_path)
+    except FileNotFoundError:
+        pass
+
+
+def send_blob(path, sha256, download_name):
+    # The content hash is a perfect strong ETag: the bytes behind it never
+    # change. send_file handles If-None-Match and Range requests itself, and
+    # emits X-Sendfile instead of the body when USE_X_SENDFILE is on.
+    if DOCUMENT_OFFLOAD == "x-accel":
+        if request.if_none_match.contains(sha256):
+            response = make_response("", 304)
+        else:
+            # nginx serves the body (and any Range) from its internal location.
+            response = make_response("")
+            response.headers["X-Accel-Redirect"] = DOCUMENT_ACCEL_PREFIX + path
+            response.mimetype = mimetypes.guess_type(download_name)[0] or "application/octet-stream"
+        response.set_etag(sha256)
+        response.headers["Content-Disposition"] = "inline; filename=\"%s\"" % download_name
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        return response
+
+    response = send_file(
+        absolute_path(path),
+        download_name=download_name,
+        conditional=True,
+        etag=sha256,
+        max_age=0
+    )
+    response.cache_control.private = True
+    return response
+
+
+def gc(cur, grace_hours=24):
+    # Runs in the caller's transaction. Rows stay locked until the caller
+    # commits, so a concurrent upload of the same content waits and then
+    # re-creates both row and file after we are done. If the transaction
+    # rolls back instead, the surviving rows are still unreferenced, and
+    # publish() puts the file back as soon as anything references them again.
+    cur.execute("""
+        DELETE FROM StoredFile
+        WHERE ref_count = 0
+          AND last_seen < NOW() - make_interval(hours => %s)
+        RETURNING path
+    """, (grace_hours,))
+    paths = [row[0] for row in cur.fetchall()]
+
+    for path in paths:
+        try:
+            os.unlink(absolute_path(path))
+        except FileNotFoundError:
+            pass
+
+    return len(paths)
+
+
+def migrate_legacy():
+    # One transaction per file name: every document still pointing at the
+    # legacy file gets a StoredFile, and the legacy copy is removed once the
+    # blob is published.
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT DISTINCT file_name FROM ApplicationDocument
+        WHERE file_id IS NULL AND file_name IS NOT NULL
+    """)
+    names = [row[0] for row in cur.fetchall()]
+    conn.commit()
+
+    moved, missing = 0, 0
+    for name in names:
+        legacy = os.path.join(LEGACY_UPLOADS, os.path.basename(name))
+        if not os.path.isfile(legacy):
+            missing += 1
+            continue
+        ext = name.rsplit(".", 1)[1].lower() if "." in name else ""
+        with open(legacy, "rb") as f:
+            blob = stage(f, ext)
+        try:
+            file_id = register(cur, blob)
+            cur.execute("""
+                UPDATE ApplicationDocument SET file_id = %s
+                WHERE file_id IS NULL AND file_name = %s
+            """, (file_id, name))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            discard(blob)
+            raise
+        publish(blob)
+        os.unlink(legacy)
+        moved += 1
+
+    cur.close()
+    conn.close()
+    return moved, missing
+
+
+@jobs.handler("storage.gc")
+def gc_job(cur, payload):
+    gc(cur, payload.get("grace_hours", 24))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Document store maintenance.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    gc_parser = sub.add_parser("gc", help="delete blobs no document references")
+    gc_parser.add_argument("--grace-hours", type=int, default=24)
+    sub.add_parser("migrate-legacy", help="move pre-store uploads out of app/static")
+    args = parser.parse_args()
+
+    if args.command == "gc":
+        conn = get_conn()
+        cur = conn.cursor()
+        removed = gc(cur, args.grace_hours)
+        conn.commit()
+        cur.close()
+        conn.close()
+        print("Removed %d unreferenced blobs." % removed)
+    elif args.command == "migrate-legacy":
+        moved, missing = migrate_legacy()
+        print("Moved %d legacy files into the store; %d referenced files were missing."
+              % (moved, missing))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,9 @@
-from flask import Blueprint, render_template, session, redirect, url_for, request
+from flask import Blueprint, render_template, session, redirect, url_for, request, make_response
 from app.db import get_conn
+from app import catalog, storage, uploads, renditions
+from app.pagination import paginate
+from datetime import date
 import psycopg2.extras
-import os
-from werkzeug.utils import secure_filename
 
 student_bp = Blueprint(
     'student',
@@ -13,9 +14,11 @@ student_bp = Blueprint(
 
 
 
-UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), "..", "static", "uploads")
 ALLOWED_EXT = {"pdf", "doc", "docx", "jpg", "jpeg", "png"}
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+
+
+def pick(row, *cols):
+    return {col: row[col] for col in cols}
 
 
 
@@ -31,70 +34,75 @@ def dashboard():
     conn = get_conn()
     cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
 
-    
+    # Everything the dashboard shows, in one round trip.
     cur.execute("""
-        SELECT name, department, cgpa
-        FROM Student
-        WHERE student_id=%s
+        SELECT s.name, s.department, s.cgpa,
+               apps.app_count,
+               apps.total, apps.approved, apps.rejected, apps.pending,
+               visas.visa_total,
+               v.visa_id, v.country, v.application_status,
+               v.issued_date, v.expiry_date,
+               h.assign_id, h.location, h.room_type, h.rent,
+               h.allotment_date, h.checkout_date
+        FROM Student s
+        CROSS JOIN LATERAL (
+            SELECT COUNT(*) AS app_count,
+                   COALESCE(SUM(docs_total), 0) AS total,
+                   COALESCE(SUM(docs_approved), 0) AS approved,
+                   COALESCE(SUM(docs_rejected), 0) AS rejected,
+                   COALESCE(SUM(docs_pending), 0) AS pending
+            FROM Application
+            WHERE student_id = s.student_id
+        ) apps
+        CROSS JOIN LATERAL (
+            SELECT COUNT(*) AS visa_total
+            FROM VisaPermit
+            WHERE student_id = s.student_id
+        ) visas
+        LEFT JOIN LATERAL (
+            SELECT visa_id, country, application_status, issued_date, expiry_date
+            FROM VisaPermit
+            WHERE student_id = s.student_id
+            ORDER BY visa_id ASC LIMIT 1
+        ) v ON TRUE
+        LEFT JOIN LATERAL (
+            SELECT ha.assign_id, h.location, h.room_type, h.rent,
+                   ha.allotment_date, ha.checkout_date
+            FROM HousingAssignment ha
+            JOIN Housing h ON ha.housing_id = h.housing_id
+            WHERE ha.student_id = s.student_id
+            ORDER BY ha.assign_id ASC LIMIT 1
+        ) h ON TRUE
+        WHERE s.student_id = %s
     """, (student_id,))
-    info = cur.fetchone()
+    row = cur.fetchone()
 
-    
-    cur.execute("""
-        SELECT COUNT(*) FROM Application WHERE student_id=%s
-    """, (student_id,))
-    app_count = cur.fetchone()[0]
+    cur.close()
+    conn.close()
 
-    
-    cur.execute("""
-        SELECT 
-            COUNT(*) AS total,
-            SUM(CASE WHEN ad.status='Approved' THEN 1 ELSE 0 END) AS approved,
-            SUM(CASE WHEN ad.status='Rejected' THEN 1 ELSE 0 END) AS rejected,
-            SUM(CASE WHEN ad.status='Pending' THEN 1 ELSE 0 END) AS pending
-        FROM ApplicationDocument ad
-        JOIN Application a ON ad.application_id = a.application_id
-        WHERE a.student_id = %s
-    """, (student_id,))
-    docs = cur.fetchone()
+    if not row:
+        session.clear()
+        return redirect(url_for('main.login'))
 
+    info = pick(row, "name", "department", "cgpa")
+    docs = pick(row, "total", "approved", "rejected", "pending")
 
-    
-    cur.execute("""
-        SELECT COUNT(*) FROM VisaPermit WHERE student_id=%s
-    """, (student_id,))
-    visa_total = cur.fetchone()[0]
+    visa = None
+    if row["visa_id"] is not None:
+        visa = pick(row, "country", "application_status", "issued_date", "expiry_date")
 
-    
-    cur.execute("""
-        SELECT country, application_status, issued_date, expiry_date
-        FROM VisaPermit
-        WHERE student_id=%s
-        ORDER BY visa_id ASC LIMIT 1
-    """, (student_id,))
-    visa = cur.fetchone()
-
-    
-    cur.execute("""
-        SELECT h.location, h.room_type, h.rent,
-               ha.allotment_date, ha.checkout_date
-        FROM HousingAssignment ha
-        JOIN Housing h ON ha.housing_id = h.housing_id
-        WHERE ha.student_id=%s
-        ORDER BY ha.assign_id ASC LIMIT 1
-    """, (student_id,))
-    housing = cur.fetchone()
-
-    cur.close()
-    conn.close()
+    housing = None
+    if row["assign_id"] is not None:
+        housing = pick(row, "location", "room_type", "rent",
+                       "allotment_date", "checkout_date")
 
     return render_template(
         'student/dashboard.html',
         info=info,
-        app_count=app_count,
+        app_count=row["app_count"],
         docs=docs,
         visa=visa,
-        visa_total=visa_total,
+        visa_total=row["visa_total"],
         housing=housing
     )
 
@@ -157,26 +165,87 @@ def programs():
     if session.get('role') != 'student':
         return redirect(url_for('main.login'))
 
+    version, updated_at = catalog.current_version()
+    etag = "catalog-%d" % version
+
+    # Authenticated page: let browsers revalidate, but keep shared caches out.
+    if request.if_none_match.contains(etag):
+        response = make_response("", 304)
+    else:
+        html = catalog.cached_page(
+            version,
+            lambda programs: render_template('student/view_programs.html', programs=programs)
+        )
+        response = make_response(html)
+
+    response.set_etag(etag)
+    response.last_modified = updated_at
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.vary.add("Cookie")
+    return response.make_conditional(request)
+
+
+@student_bp.route('/student/programs/search')
+def search_programs():
+    if session.get('role') != 'student':
+        return redirect(url_for('main.login'))
+
+    q = request.args.get('q', '').strip()
+
     conn = get_conn()
     cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-    cur.execute("""
-        SELECT p.program_id, p.title, u.name AS university,
-               m.name AS mentor, p.duration
-        FROM Program p
-        LEFT JOIN University u ON p.university_id=u.university_id
-        LEFT JOIN Mentor m ON p.mentor_id=m.mentor_id
-        ORDER BY p.program_id
-    """)
-    programs = cur.fetchall()
+
+    # Ranked over the GIN-indexed search_vector; rank and program_id form the
+    # keyset so pages stay stable while paging through ties.
+    if q:
+        rank = "ts_rank(p.search_vector, websearch_to_tsquery('english', %s))::float8"
+        match = ["p.search_vector @@ websearch_to_tsquery('english', %s)"]
+        params = [q, q]
+    else:
+        rank = "0::float8"
+        match = []
+        params = []
+
+    page = paginate(
+        cur,
+        """
+        SELECT * FROM (
+            SELECT p.program_id, p.title, p.program_type, p.duration,
+                   p.start_date, p.university_id, p.mentor_id,
+                   u.name AS university, m.name AS mentor,
+                   %s AS rank
+            FROM Program p
+            LEFT JOIN University u ON p.university_id=u.university_id
+            LEFT JOIN Mentor m ON p.mentor_id=m.mentor_id
+            %s
+        ) ranked
+        """ % (rank, ("WHERE " + match[0]) if match else ""),
+        keys=[("rank", "rank"), ("program_id", "program_id")],
+        params=params,
+        filters={
+            "university": ("university_id = %s", int),
+            "mentor": ("mentor ILIKE %s", lambda v: "%" + v + "%"),
+            "min_duration": ("duration >= %s", int),
+            "max_duration": ("duration <= %s", int),
+            "start_from": ("start_date >= %s", date.fromisoformat),
+            "start_to": ("start_date <= %s", date.fromisoformat),
+        },
+        default_order="desc" if q else "asc"
+    )
+
+    cur.execute("SELECT university_id, name FROM University ORDER BY name")
+    universities = cur.fetchall()
 
     cur.close()
     conn.close()
 
-    return render_template('student/view_programs.html', programs=programs)
+    return render_template('student/search_programs.html', q=q, programs=page.rows,
+                           page=page, universities=universities)
 
 
 @student_bp.route('/student/program/<int:pid>')
-def program_details(pid):
+def program_details(pid, error=None):
     if session.get('role') != 'student':
         return redirect(url_for('main.login'))
 
@@ -184,57 +253,79 @@ def program_details(pid):
     conn = get_conn()
     cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
 
-    
+    # Program, the student's application and its documents, requirements and
+    # scholarships in one round trip. Requirement/document lists are only
+    # built once the student has applied.
     cur.execute("""
-        SELECT p.*, u.name AS university, m.name AS mentor
+        SELECT p.program_id, p.title, p.description, p.program_type,
+               p.duration, p.eligibility, p.start_date, p.end_date,
+               p.university_id, p.mentor_id,
+               u.name AS university, m.name AS mentor,
+               a.application_id,
+               COALESCE(req.items, '[]') AS req_items,
+               COALESCE(doc.items, '[]') AS doc_items,
+               COALESCE(sch.items, '[]') AS sch_items
         FROM Program p
         LEFT JOIN University u ON p.university_id=u.university_id
         LEFT JOIN Mentor m ON p.mentor_id=m.mentor_id
+        LEFT JOIN LATERAL (
+            SELECT application_id
+            FROM Application
+            WHERE student_id=%s AND program_id=p.program_id
+            ORDER BY application_id LIMIT 1
+        ) a ON TRUE
+        LEFT JOIN LATERAL (
+            SELECT json_agg(json_build_object(
+                       'req_id', rd.req_id,
+                       'document_name', rd.document_name
+                   ) ORDER BY rd.req_id) AS items
+            FROM RequiredDocuments rd
+            WHERE rd.program_id=p.program_id AND a.application_id IS NOT NULL
+        ) req ON TRUE
+        LEFT JOIN LATERAL (
+            SELECT json_agg(json_build_object(
+                       'req_id', ad.req_id,
+                       'file_name', ad.file_name,
+                       'status', ad.status
+                   )) AS items
+            FROM ApplicationDocument ad
+            WHERE ad.application_id=a.application_id
+        ) doc ON TRUE
+        LEFT JOIN LATERAL (
+            SELECT json_agg(json_build_object(
+                       'scholarship_id', sc.scholarship_id,
+                       'name', sc.name,
+                       'amount', sc.amount::text,
+                       'eligibility_criteria', sc.eligibility_criteria,
+                       'applied', sa.sch_app_id IS NOT NULL
+                   ) ORDER BY sc.scholarship_id) AS items
+            FROM Scholarship sc
+            LEFT JOIN ScholarshipApplication sa
+                ON sa.scholarship_id=sc.scholarship_id
+               AND sa.application_id=a.application_id
+            WHERE sc.program_id=p.program_id
+        ) sch ON TRUE
         WHERE p.program_id=%s
-    """, (pid,))
+    """, (student_id, pid))
     program = cur.fetchone()
 
-    
-    cur.execute("""
-        SELECT application_id FROM Application 
-        WHERE student_id=%s AND program_id=%s
-    """, (student_id, pid))
-    app = cur.fetchone()
+    cur.close()
+    conn.close()
 
-    applied = bool(app)
-    app_id = app["application_id"] if applied else None
+    app_id = program["application_id"] if program else None
+    applied = app_id is not None
 
-    requirements = []
+    requirements = program["req_items"] if program else []
     documents = {}
-
-    if applied:
-        
-        cur.execute("""
-            SELECT req_id, document_name
-            FROM RequiredDocuments
-            WHERE program_id=%s
-        """, (pid,))
-        requirements = cur.fetchall()
-
-        
-        cur.execute("""
-            SELECT req_id, file_name, status
-            FROM ApplicationDocument
-            WHERE application_id=%s
-        """, (app_id,))
-        for row in cur.fetchall():
-            documents[row["req_id"]] = row
-
-    
-    cur.execute("""
-        SELECT scholarship_id, name, amount, eligibility_criteria
-        FROM Scholarship
-        WHERE program_id=%s
-    """, (pid,))
-    scholarships = cur.fetchall()
-
-    cur.close()
-    conn.close()
+    scholarships = []
+    existing_scholarships = []
+    if program:
+        for doc in program["doc_items"]:
+            documents[doc["req_id"]] = doc
+        scholarships = program["sch_items"]
+        existing_scholarships = [
+            sc["scholarship_id"] for sc in scholarships if sc["applied"]
+        ]
 
     return render_template(
         "student/program_details.html",
@@ -244,7 +335,9 @@ def program_details(pid):
         app_id=app_id,
         requirements=requirements,
         documents=documents,
-        scholarships=scholarships
+        scholarships=scholarships,
+        existing_scholarships=existing_scholarships,
+        error=error or request.args.get('error')
     )
 
 @student_bp.route('/student/program/<int:pid>/apply')
@@ -289,31 +382,37 @@ def upload_required_doc(pid, app_id, req_id):
     if session.get('role') != 'student':
         return redirect(url_for('main.login'))
 
-    f = request.files.get("file")
-    if not f:
-        return redirect(url_for('student.program_details', pid=pid))
-
-    filename = secure_filename(f.filename)
-    ext = filename.rsplit('.',1)[-1].lower()
-
-    if ext not in ALLOWED_EXT:
-        return redirect(url_for('student.program_details', pid=pid))
-
-    dest = os.path.join(UPLOAD_FOLDER, filename)
-    f.save(dest)
-
-    conn = get_conn()
-    cur = conn.cursor()
-
-    
-    cur.execute("""
-        INSERT INTO ApplicationDocument (application_id, req_id, file_name)
-        VALUES (%s, %s, %s)
-        ON CONFLICT (application_id, req_id)
-        DO UPDATE SET file_name = EXCLUDED.file_name,
-                      status = 'Pending'
-    """, (app_id, req_id, filename))
-
+    try:
+        filename, blob = uploads.receive_file(request, "file", ALLOWED_EXT)
+    except uploads.UploadRejected as e:
+        # Render rather than redirect, so oversize (413) and overload (503)
+        # rejections reach clients and proxies with their real status.
+        return program_details(pid, error=str(e)), e.status
+
+    # The blob's temp file exists from here on; anything that fails before
+    # the commit, including waiting for a pooled connection, must discard it.
+    conn = None
+    try:
+        conn = get_conn()
+        cur = conn.cursor()
+        file_id = storage.register(cur, blob)
+        cur.execute("""
+            INSERT INTO ApplicationDocument (application_id, req_id, file_name, file_id)
+            VALUES (%s, %s, %s, %s)
+            ON CONFLICT (application_id, req_id)
+            DO UPDATE SET file_name = EXCLUDED.file_name,
+                          file_id = EXCLUDED.file_id,
+                          status = 'Pending'
+        """, (app_id, req_id, filename, file_id))
+        conn.commit()
+    except Exception:
+        if conn is not None:
+            conn.rollback()
+        storage.discard(blob)
+        raise
+
+    storage.publish(blob)
+    renditions.queue(cur, blob.stored_path or blob.path, blob.ext)
     conn.commit()
     cur.close()
     conn.close()
@@ -405,39 +504,58 @@ def housing():
 
     
     cur.execute("""
-        SELECT request_id, request_type, status, request_date
+        SELECT request_id, request_type, room_type, status, request_date
         FROM HousingRequest
         WHERE student_id=%s
         ORDER BY request_date ASC
     """, (student_id,))
     requests = cur.fetchall()
 
+    cur.execute("""
+        SELECT DISTINCT h.room_type
+        FROM Housing h
+        JOIN Student s ON h.university_id = s.university_id
+        WHERE s.student_id=%s AND h.room_type IS NOT NULL
+        ORDER BY h.room_type
+    """, (student_id,))
+    room_types = [r[0] for r in cur.fetchall()]
+
     if request.method == 'POST':
         action = request.form.get('action')
+        room_type = request.form.get('room_type') or None
 
         if action not in ("apply", "vacate"):
             return render_template("student/housing.html",
                                    current=current, requests=requests,
+                                   room_types=room_types,
                                    error="Invalid action.")
 
         if action == "apply" and current:
             return render_template("student/housing.html",
                                    current=current, requests=requests,
+                                   room_types=room_types,
                                    error="You already have housing.")
 
+        if action == "apply" and room_type and room_type not in room_types:
+            return render_template("student/housing.html",
+                                   current=current, requests=requests,
+                                   room_types=room_types,
+                                   error="Unknown room type.")
+
         if action == "vacate" and not current:
             return render_template("student/housing.html",
                                    current=current, requests=requests,
+                                   room_types=room_types,
                                    error="You have no housing to vacate.")
 
         cur.execute("""
-            INSERT INTO HousingRequest (student_id, request_type)
-            VALUES (%s, %s)
-        """, (student_id, action))
+            INSERT INTO HousingRequest (student_id, request_type, room_type)
+            VALUES (%s, %s, %s)
+        """, (student_id, action, room_type if action == "apply" else None))
         conn.commit()
 
         cur.execute("""
-            SELECT request_id, request_type, status, request_date
+            SELECT request_id, request_type, room_type, status, request_date
             FROM HousingRequest
             WHERE student_id=%s
             ORDER BY request_date ASC
@@ -449,7 +567,8 @@ def housing():
 
     return render_template("student/housing.html",
                            current=current,
-                           requests=requests)
+                           requests=requests,
+                           room_types=room_types)
 
 @student_bp.route('/student/scholarship/apply/<int:app_id>/<int:sid>', methods=['POST'])
 def apply_scholarship(app_id, sid):
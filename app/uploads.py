@@ -0,0 +1,144 @@
+import threading
+import time
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import MultipartDecoder, File, Data, Epilogue, NeedData
+from werkzeug.utils import secure_filename
+from app import storage
+from config import UPLOAD_MAX_BYTES, UPLOAD_CONCURRENCY
+
+# Streaming multipart upload: the body is read from the socket in CHUNK_SIZE
+# pieces and file data goes straight into a storage.BlobWriter, instead of
+# letting Werkzeug spool the whole form and then copying it again with
+# f.save(). The extension is checked as soon as the part headers arrive and
+# the magic bytes as soon as the first few bytes do, so bad files are dropped
+# before the rest of the body is read.
+
+MAGIC_BYTES = {
+    "pdf": (b"%PDF-",),
+    "png": (b"\x89PNG\r\n\x1a\n",),
+    "jpg": (b"\xff\xd8\xff",),
+    "jpeg": (b"\xff\xd8\xff",),
+    "doc": (b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1",),
+    "docx": (b"PK\x03\x04",),
+}
+SNIFF_BYTES = max(len(m) for sigs in MAGIC_BYTES.values() for m in sigs)
+
+
+class UploadRejected(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+_slots = threading.BoundedSemaphore(UPLOAD_CONCURRENCY)
+_metrics_lock = threading.Lock()
+_metrics = {
+    "completed": 0,
+    "rejected": 0,
+    "bytes": 0,
+    "seconds": 0.0,
+}
+
+
+def _record(completed, size=0, seconds=0.0):
+    with _metrics_lock:
+        if completed:
+            _metrics["completed"] += 1
+            _metrics["bytes"] += size
+            _metrics["seconds"] += seconds
+        else:
+            _metrics["rejected"] += 1
+
+
+def metrics():
+    with _metrics_lock:
+        snapshot = dict(_metrics)
+    snapshot["mb_per_second"] = (
+        snapshot["bytes"] / snapshot["seconds"] / (1024 * 1024)
+        if snapshot["seconds"] else 0.0
+    )
+    snapshot["in_flight"] = UPLOAD_CONCURRENCY - _slots._value
+    return snapshot
+
+
+def _check_magic(ext, head):
+    if not any(head.startswith(sig) for sig in MAGIC_BYTES.get(ext, ())):
+        raise UploadRejected("File contents do not match its ." + ext + " extension.")
+
+
+def receive_file(request, field_name, allowed_ext):
+    # Returns (filename, StagedBlob) for the first file part named field_name;
+    # the caller must storage.publish() or storage.discard() the blob.
+    content_type, options = parse_options_header(request.headers.get("Content-Type", ""))
+    boundary = options.get("boundary")
+    if content_type != "multipart/form-data" or not boundary:
+        raise UploadRejected("Expected a multipart/form-data upload.")
+
+    if not _slots.acquire(timeout=1):
+        _record(False)
+        raise UploadRejected("Too many uploads in progress, please retry.", 503)
+
+    started = time.monotonic()
+    decoder = MultipartDecoder(boundary.encode())
+    stream = request.stream
+    writer = None
+    filename = None
+    ext = None
+    head = b""
+    in_target = False
+    done = False
+
+    try:
+        while not done:
+            chunk = stream.read(storage.CHUNK_SIZE)
+            decoder.receive_data(chunk or None)
+
+            event = decoder.next_event()
+            while not isinstance(event, NeedData):
+                if isinstance(event, File):
+                    in_target = writer is None and event.name == field_name
+                    if in_target:
+                        filename = secure_filename(event.filename or "")
+                        ext = filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
+                        if ext not in allowed_ext:
+                            raise UploadRejected("File type not allowed.")
+                        writer = storage.BlobWriter(ext)
+                elif isinstance(event, Data):
+                    if in_target:
+                        if len(head) < SNIFF_BYTES:
+                            head += event.data[:SNIFF_BYTES - len(head)]
+                            if len(head) >= SNIFF_BYTES or not event.more_data:
+                                _check_magic(ext, head)
+                        writer.write(event.data)
+                        if writer.size > UPLOAD_MAX_BYTES:
+                            raise UploadRejected("File is too large.", 413)
+                        if not event.more_data:
+                            in_target = False
+                elif isinstance(event, Epilogue):
+                    done = True
+                    break
+                event = decoder.next_event()
+
+            if not chunk:
+                break
+
+        if writer is None or writer.size == 0:
+            raise UploadRejected("No file was uploaded.")
+
+        blob = writer.finish()
+        _record(True, blob.size, time.monotonic() - started)
+        return filename, blob
+
+    except ValueError:
+        # Raised by the multipart decoder on a truncated or malformed body.
+        if writer is not None:
+            writer.abort()
+        _record(False)
+        raise UploadRejected("Malformed upload.")
+    except Exception:
+        if writer is not None:
+            writer.abort()
+        _record(False)
+        raise
+    finally:
+        _slots.release()
@@ -1,6 +1,73 @@
+import os
+
 DB_NAME = "internship_portal"
 DB_USER = "postgres"
 DB_PASS = "postgres"
 DB_HOST = "localhost"
 DB_PORT = 5432
-SECRET_KEY = "Throughout heaven and earth, I alone am the honored one."
\ No newline at end of file
+SECRET_KEY = "Throughout heaven and earth, I alone am the honored one."
+
+DB_POOL_MIN = 2
+DB_POOL_MAX = 20
+DB_POOL_TIMEOUT = 5
+DB_POOL_HEALTHCHECK_INTERVAL = 30
+
+# Passwords are hashed in a process pool (0 workers = hash inline).
+PASSWORD_HASH_METHOD = "scrypt:32768:8:1"
+PASSWORD_POOL_WORKERS = 4
+PASSWORD_QUEUE_MAX = 64
+PASSWORD_TIMEOUT = 5
+
+# Seconds a worker trusts its cached program catalog version before re-checking.
+CATALOG_VERSION_TTL = 5
+
+# Content-addressed document store; blobs live under objects/ab/cd/<sha256>.<ext>.
+# Kept outside app/static so documents are only reachable through the
+# authorized download endpoint.
+DOCUMENT_STORE = os.path.join(os.path.dirname(__file__), "storage", "objects")
+
+# How document downloads hand the bytes to the front proxy:
+#   None        - Flask streams the file itself
+#   "x-sendfile" - Apache/lighttpd X-Sendfile header with the absolute path
+#   "x-accel"   - nginx X-Accel-Redirect to DOCUMENT_ACCEL_PREFIX + blob path,
+#                 which must be an `internal` location aliased to DOCUMENT_STORE
+DOCUMENT_OFFLOAD = None
+DOCUMENT_ACCEL_PREFIX = "/protected-documents/"
+
+# Upload limits: bytes per file, and uploads streamed concurrently per worker.
+UPLOAD_MAX_BYTES = 20 * 1024 * 1024
+UPLOAD_CONCURRENCY = 8
+
+# Pending housing requests handled per transaction when draining the queue.
+HOUSING_BATCH_SIZE = 200
+
+# Background jobs: worker processes started by run_worker.py, attempts before a
+# job is marked failed, seconds a claimed job may run before another worker may
+# take it over, retry backoff (doubling from BASE up to MAX seconds), and the
+# longest a worker sleeps between queue checks when no notification arrives.
+JOB_WORKERS = 2
+JOB_MAX_ATTEMPTS = 5
+JOB_VISIBILITY_TIMEOUT = 300
+JOB_BACKOFF_BASE = 10
+JOB_BACKOFF_MAX = 3600
+JOB_POLL_INTERVAL = 30
+
+# Bulk CSV imports: where uploaded files wait for a worker, processes used to
+# hash initial passwords, and how many row errors are kept in the report.
+IMPORT_DIR = os.path.join(os.path.dirname(__file__), "storage", "imports")
+IMPORT_HASH_WORKERS = os.cpu_count() or 2
+IMPORT_ERROR_MAX = 1000
+
+# Query benchmarks (python -m app.bench): timed replays per route, the table
+# size from which a sequential scan fails the run, the margin --record adds to
+# measured p95 latencies, and where the budgets are kept.
+BENCH_RUNS = 30
+BENCH_SEQ_SCAN_ROWS = 10000
+BENCH_BUDGET_HEADROOM = 1.5
+BENCH_BUDGETS = os.path.join(os.path.dirname(__file__), "app", "bench_budgets.json")
+
+# Per-request query instrumentation: a Server-Timing header and a JSON log line
+# (logger "app.db") per request, plus a warning when one normalized statement
+# runs more than DB_REPEAT_WARN times in a request, usually a query in a loop.
+DB_INSTRUMENT = True
+DB_REPEAT_WARN = 10
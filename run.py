@@ -1,9 +1,9 @@
 from app import create_app
 from app.db import init_db
 
-app = create_app()
-
-init_db()
-
+# Process pools started with spawn (app.passwords) re-import this module as
+# __mp_main__ in every child, so nothing may run at import time: no app, no
+# migrations. Other WSGI servers use the factory, e.g. gunicorn "app:create_app()".
 if __name__ == "__main__":
-    app.run(debug=True)
\ No newline at end of file
+    init_db()
+    create_app().run(debug=True)
@@ -0,0 +1,41 @@
+import argparse
+import multiprocessing
+import signal
+from app.db import init_db
+from app.jobs import work
+from config import JOB_WORKERS
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run background job workers.")
+    parser.add_argument("--workers", type=int, default=JOB_WORKERS)
+    parser.add_argument("--once", action="store_true",
+                        help="exit once no job is ready instead of waiting")
+    args = parser.parse_args()
+
+    init_db()
+
+    # spawn, not fork: each worker opens its own connection from scratch.
+    ctx = multiprocessing.get_context("spawn")
+    procs = [ctx.Process(target=work, args=(i, args.once)) for i in range(args.workers)]
+    for p in procs:
+        p.start()
+
+    # Pass SIGTERM on; workers finish the job they are running and exit.
+    def stop(*_):
+        for p in procs:
+            if p.is_alive():
+                p.terminate()
+    signal.signal(signal.SIGTERM, stop)
+
+    try:
+        for p in procs:
+            p.join()
+    except KeyboardInterrupt:
+        # Ctrl-C already reached the workers through the process group.
+        for p in procs:
+            p.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import psycopg2
+import pytest
+from flask import g
+from app import create_app, db
+from config import DB_INSTRUMENT
+
+# The student dashboard, program details and mentor review pages are each
+# served by one composite query. These tests pin that down, so a second
+# round trip added to any of them fails here rather than showing up as
+# latency in production. They need the configured Postgres database with at
+# least one application in it (python -m app.datagen --scale 1k).
+
+PAGES = [
+    ("student", "/student/dashboard"),
+    ("student", "/student/program/{program}"),
+    ("mentor", "/mentor/application/{application}"),
+]
+
+
+@pytest.fixture(scope="module")
+def ids():
+    try:
+        conn = db._connect()
+    except psycopg2.OperationalError as e:
+        pytest.skip("database unavailable: %s" % e)
+    db.migrate()
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT a.application_id, a.student_id, a.program_id, p.mentor_id
+        FROM Application a
+        JOIN Program p ON p.program_id = a.program_id
+        WHERE p.mentor_id IS NOT NULL
+        ORDER BY a.application_id
+        LIMIT 1
+    """)
+    row = cur.fetchone()
+    conn.close()
+    if row is None:
+        pytest.skip("no application to render; load data with app.datagen")
+    return dict(zip(("application", "student", "program", "mentor"), row))
+
+
+@pytest.fixture(scope="module")
+def app():
+    app = create_app()
+    app.testing = True
+    if not DB_INSTRUMENT:
+        app.before_request(db.start_query_stats)
+
+    app.statement_counts = []
+
+    # Registered after init_app's hook, so it runs first and still finds the
+    # request's QueryStats on g.
+    @app.after_request
+    def count_statements(response):
+        app.statement_counts.append(g._db_stats.statements)
+        return response
+
+    return app
+
+
+@pytest.mark.parametrize("role, path", PAGES)
+def test_page_is_one_round_trip(app, ids, role, path):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["role"] = role
+        session["user_id"] = ids[role]
+        session["name"] = "test"
+
+    response = client.get(path.format(**ids))
+
+    assert response.status_code == 200
+    assert app.statement_counts[-1] == 1